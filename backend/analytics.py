@@ -0,0 +1,380 @@
+# Streaming analytics over game logs (see gamelog.py).
+#
+# Games flow through generator stages (read_games -> only_kind -> replay) into a list of analyses.
+# An analysis is an accumulator: it sees each game once, and each ply when it needs positions, and
+# keeps only its own tables. Those are bounded by the number of distinct openings and positions, not
+# by the number of games, so a log of any length is analysed in constant memory.
+#
+# Analyses also merge. analyze_logs gives every shard of a log to its own process, each running a
+# fresh copy of the analyses, and merges what comes back.
+#
+#   analyses = [OpeningFrequency(), VisitCounts(), Blunders(), WinRateByOpening()]
+#   report = analyze_logs(shard_paths("logs"), analyses)
+#   print_report(report)
+
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from multiprocessing import Pool
+
+from backend.gamelog import SINGLE, ULTIMATE, read_games
+from backend.rl.single_tic import encode_state_key, decode_state_key, state_result
+from backend.ultimate.position import Position, DRAW
+
+
+KIND_NAMES = {SINGLE: 'tic-tac-toe', ULTIMATE: 'ultimate'}
+BOARD_SYMBOLS = {None: '.', 'X': 'X', 'O': 'O'}
+
+
+def _to_state_key(cells):
+    return (tuple(cells[0:3]), tuple(cells[3:6]), tuple(cells[6:9]))
+
+
+def _state_name(kind, key):
+    # 'X.O......' (row by row) for a tic-tac-toe state code, the hex Zobrist hash for Ultimate
+    if kind == SINGLE:
+        return "".join(BOARD_SYMBOLS[cell] for row in decode_state_key(key) for cell in row)
+    return f"{key:016x}"
+
+
+def stream(paths):
+    """Every game of several log files, one file after the other"""
+    for path in paths:
+        yield from read_games(path)
+
+
+def only_kind(games, kind):
+    for game in games:
+        if game.kind == kind:
+            yield game
+
+
+def replay(game):
+    """
+    Yield (ply, state, move) for every move of a game, state being the position before the move:
+    a state key for tic-tac-toe, or a Position for Ultimate. The Position is updated in place once
+    the next ply is requested, so copy it to keep it.
+    """
+    if game.kind == SINGLE:
+        cells = [None] * 9
+        player = 'X'
+        for ply, move in enumerate(game.moves):
+            yield ply, _to_state_key(cells), move
+            cells[move] = player
+            player = 'O' if player == 'X' else 'X'
+    else:
+        position = Position()
+        for ply, move in enumerate(game.moves):
+            yield ply, position, move
+            position.make(move)
+
+
+class Analysis(ABC):
+    """Base accumulator. per_ply analyses also get add_ply for every move of every game."""
+    name = None
+    per_ply = False
+
+    def add_game(self, game):
+        pass
+
+    def add_ply(self, game, ply, state, move):
+        pass
+
+    @abstractmethod
+    def merge(self, other):
+        """Add the counts of another instance (from another worker) to this one"""
+
+    @abstractmethod
+    def report(self, top=10):
+        """The results, JSON-serializable, with the `top` entries of each ranking"""
+
+
+class OpeningFrequency(Analysis):
+    """How often each opening (the first `plies` moves) was played"""
+    name = 'openings'
+
+    def __init__(self, plies=2):
+        self.plies = plies
+        self.counts = Counter()  # (kind, opening) -> games
+
+    def add_game(self, game):
+        self.counts[game.kind, game.moves[:self.plies]] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def report(self, top=10):
+        totals = Counter()
+        for (kind, _), count in self.counts.items():
+            totals[kind] += count
+        return [{'kind': KIND_NAMES[kind], 'opening': list(opening), 'games': count,
+                 'share': round(count / totals[kind], 4)}
+                for (kind, opening), count in self.counts.most_common(top)]
+
+
+class WinRateByOpening(Analysis):
+    """X / O / draw rates of finished games, per opening"""
+    name = 'win_rate_by_opening'
+
+    def __init__(self, plies=1, min_games=1):
+        self.plies = plies
+        self.min_games = min_games
+        self.results = {}  # (kind, opening) -> [X wins, O wins, draws]
+
+    def add_game(self, game):
+        if game.result is None:
+            return
+        counts = self.results.setdefault((game.kind, game.moves[:self.plies]), [0, 0, 0])
+        counts['XOD'.index(game.result)] += 1
+
+    def merge(self, other):
+        for key, (x, o, d) in other.results.items():
+            counts = self.results.setdefault(key, [0, 0, 0])
+            counts[0] += x
+            counts[1] += o
+            counts[2] += d
+
+    def report(self, top=10):
+        rows = []
+        for (kind, opening), (x, o, d) in self.results.items():
+            games = x + o + d
+            if games >= self.min_games:
+                rows.append({'kind': KIND_NAMES[kind], 'opening': list(opening), 'games': games,
+                             'x': round(x / games, 4), 'o': round(o / games, 4), 'draw': round(d / games, 4)})
+        rows.sort(key=lambda row: -row['games'])
+        return rows[:top]
+
+
+class VisitCounts(Analysis):
+    """
+    How often each position was reached before a move. Positions are keyed by their code for
+    tic-tac-toe and their Zobrist hash for Ultimate. Only the first max_ply plies are counted: past
+    the opening almost every Ultimate position is new, and counting them would grow with the log.
+    """
+    name = 'visits'
+    per_ply = True
+
+    def __init__(self, max_ply=10):
+        self.max_ply = max_ply
+        self.counts = Counter()  # (kind, code or hash) -> visits
+
+    def add_ply(self, game, ply, state, move):
+        if ply >= self.max_ply:
+            return
+        if game.kind == SINGLE:
+            self.counts[SINGLE, encode_state_key(state)] += 1
+        else:
+            self.counts[ULTIMATE, state.zobrist()] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def report(self, top=10):
+        rows = [{'kind': KIND_NAMES[kind], 'state': _state_name(kind, key), 'visits': visits}
+                for (kind, key), visits in self.counts.most_common(top)]
+        return {'positions': len(self.counts), 'visits': sum(self.counts.values()), 'top': rows}
+
+
+class Blunders(Analysis):
+    """
+    Moves that throw away value against a reference.
+
+    Tic-tac-toe: with no reference policy, a move is a blunder when it lowers the perfect-play value
+    of the game for the player who made it. With a reference policy (state_key -> move), the value of
+    a position is what the reference gets playing both sides from it (perfect play where it has no
+    move), and a blunder is a move that does worse than the reference's own move.
+
+    Ultimate: only positions covered by a tablebase (built with `python -m backend tablebase`) can be
+    judged. Without tablebase_path Ultimate games are skipped.
+    """
+    name = 'blunders'
+    per_ply = True
+
+    def __init__(self, reference=None, tablebase_path=None):
+        self.reference = reference
+        self.tablebase_path = tablebase_path
+        self.checked = Counter()      # kind -> moves judged
+        self.blunders = Counter()     # (kind, player) -> blunders
+        self.by_ply = Counter()       # (kind, ply) -> blunders
+        self.positions = Counter()    # (kind, code or hash, move) -> blunders
+        self._perfect = None
+        self._values = None
+        self._tablebase = None
+
+    def __getstate__(self):
+        # Worker processes rebuild the values and reopen the tablebase themselves
+        state = dict(self.__dict__)
+        state['_perfect'] = state['_values'] = state['_tablebase'] = None
+        return state
+
+    def _value(self, state_key):
+        # Value of a tic-tac-toe state from X's side (1, 0, -1), with the reference playing if there is one
+        if self._values is None:
+            from backend.rl.exploitability import solve_game
+            self._perfect = solve_game()
+            self._values = dict(self._perfect) if self.reference is None else {}
+
+        value = self._values.get(state_key)
+        if value is None:
+            result = state_result(state_key)
+            move = None if self.reference is None else self.reference.get(state_key)
+            if result is not None or move is None or state_key[move // 3][move % 3] is not None:
+                value = self._perfect[state_key]
+            else:
+                cells = [cell for row in state_key for cell in row]
+                cells[move] = 'X' if cells.count('X') == cells.count('O') else 'O'
+                value = self._value(_to_state_key(cells))
+            self._values[state_key] = value
+        return value
+
+    def add_ply(self, game, ply, state, move):
+        if game.kind == SINGLE:
+            self._judge_single(game, ply, state, move)
+        elif self.tablebase_path is not None:
+            self._judge_ultimate(game, ply, state, move)
+
+    def _judge_single(self, game, ply, state_key, move):
+        cells = [cell for row in state_key for cell in row]
+        player = 'X' if cells.count('X') == cells.count('O') else 'O'
+        cells[move] = player
+        before, after = self._value(state_key), self._value(_to_state_key(cells))
+        self.checked[SINGLE] += 1
+        if (after < before) if player == 'X' else (after > before):
+            self._record(SINGLE, player, ply, encode_state_key(state_key), move)
+
+    def _judge_ultimate(self, game, ply, position, move):
+        if self._tablebase is None:
+            from backend.ultimate.tablebase import Tablebase
+            self._tablebase = Tablebase.open(self.tablebase_path)
+        tablebase = self._tablebase
+        if position.playable_empties() > tablebase.max_empties:
+            return
+        before = tablebase.probe(position)
+        if before is None:
+            return
+
+        # Values are for the player to move: WIN 1, DRAW 0, LOSS -1
+        after_position = position.copy()
+        after_position.make(move)
+        if after_position.result:
+            after = 0 if after_position.result == DRAW else (1 if after_position.result == position.player else -1)
+        else:
+            probe = tablebase.probe(after_position)
+            if probe is None:
+                return
+            after = -probe[0]
+
+        self.checked[ULTIMATE] += 1
+        if after < before[0]:
+            self._record(ULTIMATE, 'X' if position.player == 1 else 'O', ply, position.zobrist(), move)
+
+    def _record(self, kind, player, ply, key, move):
+        self.blunders[kind, player] += 1
+        self.by_ply[kind, ply] += 1
+        self.positions[kind, key, move] += 1
+
+    def merge(self, other):
+        self.checked.update(other.checked)
+        self.blunders.update(other.blunders)
+        self.by_ply.update(other.by_ply)
+        self.positions.update(other.positions)
+
+    def report(self, top=10):
+        report = {}
+        for kind, checked in self.checked.items():
+            blunders = self.blunders[kind, 'X'] + self.blunders[kind, 'O']
+            worst = [{'state': _state_name(kind, key), 'move': move, 'blunders': count}
+                     for (position_kind, key, move), count in self.positions.most_common()
+                     if position_kind == kind][:top]
+            report[KIND_NAMES[kind]] = {
+                'moves': checked,
+                'blunders': blunders,
+                'rate': round(blunders / checked, 4) if checked else 0.0,
+                'by_player': {player: self.blunders[kind, player] for player in 'XO'},
+                'by_ply': {ply: count for (ply_kind, ply), count in sorted(self.by_ply.items()) if ply_kind == kind},
+                'worst': worst,
+            }
+        return report
+
+
+def run(games, analyses):
+    """Feed a stream of games to the analyses. Returns how many games there were."""
+    per_ply = [analysis for analysis in analyses if analysis.per_ply]
+    count = 0
+    for game in games:
+        if per_ply:
+            for ply, state, move in replay(game):
+                for analysis in per_ply:
+                    analysis.add_ply(game, ply, state, move)
+        for analysis in analyses:
+            analysis.add_game(game)
+        count += 1
+    return count
+
+
+def _analyze_shard(task):
+    # Runs inside a worker on its own (pickled) copy of the analyses
+    path, analyses, kind = task
+    games = read_games(path)
+    if kind is not None:
+        games = only_kind(games, kind)
+    return run(games, analyses), analyses
+
+
+def analyze_logs(paths, analyses, kind=None, processes=None, top=10):
+    """
+    Run fresh analyses over log files, one process per shard (processes=1 runs them in this one).
+    kind=SINGLE or ULTIMATE keeps only that kind of game. Returns a JSON-ready report.
+    """
+    paths = list(paths)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(paths)))
+
+    start = time.perf_counter()
+    if processes > 1:
+        games = 0
+        with Pool(processes) as pool:
+            for shard_games, shard_analyses in pool.imap_unordered(_analyze_shard, [(path, analyses, kind) for path in paths]):
+                games += shard_games
+                for analysis, shard_analysis in zip(analyses, shard_analyses):
+                    analysis.merge(shard_analysis)
+    else:
+        games = sum(_analyze_shard((path, analyses, kind))[0] for path in paths)
+    elapsed = time.perf_counter() - start
+
+    report = {'games': games, 'shards': len(paths), 'seconds': round(elapsed, 3)}
+    for analysis in analyses:
+        report[analysis.name] = analysis.report(top)
+    return report
+
+
+def print_report(report):
+    print("=" * 40)
+    print(f"{report['games']} games from {report['shards']} shards in {report['seconds']:.2f}s")
+
+    if 'openings' in report:
+        print("\nMost played openings:")
+        for row in report['openings']:
+            print(f"  {row['kind']:<12} {str(row['opening']):<16} {row['games']:>8} games  {row['share']:.1%}")
+
+    if 'win_rate_by_opening' in report:
+        print("\nResults by opening (X / O / draw):")
+        for row in report['win_rate_by_opening']:
+            print(f"  {row['kind']:<12} {str(row['opening']):<16} {row['games']:>8} games  "
+                  f"{row['x']:.1%} / {row['o']:.1%} / {row['draw']:.1%}")
+
+    if 'visits' in report:
+        visits = report['visits']
+        print(f"\n{visits['visits']} visits to {visits['positions']} positions, most visited:")
+        for row in visits['top']:
+            print(f"  {row['kind']:<12} {row['state']:<18} {row['visits']:>8}")
+
+    if 'blunders' in report:
+        for kind, stats in report['blunders'].items():
+            print(f"\n{kind}: {stats['blunders']} blunders in {stats['moves']} judged moves ({stats['rate']:.2%}), "
+                  f"X {stats['by_player']['X']} O {stats['by_player']['O']}")
+            for row in stats['worst']:
+                print(f"  {row['state']:<18} move {row['move']}  {row['blunders']} times")
+    print("=" * 40)
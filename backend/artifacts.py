@@ -0,0 +1,66 @@
+# Trained policies are saved as artifacts, keyed by a hash of the config that produced them,
+# so the same config never has to be trained (or solved) twice.
+
+import hashlib
+import json
+import os
+import pickle
+import time
+
+
+# Bump when a change to the trainers should invalidate previously saved artifacts
+ARTIFACT_VERSION = 1
+
+DEFAULT_ARTIFACT_DIR = os.environ.get("TICTAC_ARTIFACTS", "artifacts")
+
+
+def config_hash(kind, config):
+    """Stable hash of an artifact kind ('mc', 'td', 'vi', 'pi', ...) and its config dict"""
+    payload = json.dumps({'kind': kind, 'version': ARTIFACT_VERSION, 'config': config}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def artifact_path(kind, config, artifact_dir=None):
+    artifact_dir = artifact_dir or DEFAULT_ARTIFACT_DIR
+    return os.path.join(artifact_dir, f"{kind}-{config_hash(kind, config)}.pkl")
+
+
+def save_artifact(kind, config, policy, artifact_dir=None):
+    path = artifact_path(kind, config, artifact_dir)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # Write to a temporary file first so a crash never leaves a half-written artifact behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({'kind': kind, 'config': config, 'created': time.time(), 'policy': policy}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_artifact(kind, config, artifact_dir=None):
+    """Returns the saved policy for this exact config, or None if it was never built"""
+    path = artifact_path(kind, config, artifact_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)['policy']
+
+
+def load_or_build(kind, config, build, artifact_dir=None, force=False, verbose=True):
+    """
+    Reuse the artifact matching (kind, config) if there is one, otherwise call build(config),
+    save what it returns and return it. Pass force=True to rebuild regardless.
+    """
+    if not force:
+        policy = load_artifact(kind, config, artifact_dir)
+        if policy is not None:
+            if verbose:
+                print(f"Reusing {artifact_path(kind, config, artifact_dir)}")
+            return policy
+
+    policy = build(config)
+    path = save_artifact(kind, config, policy, artifact_dir)
+    if verbose:
+        print(f"Saved {path}")
+    return policy
@@ -0,0 +1,730 @@
+# Single command-line entry point for training, solving, playing and serving policies.
+#
+#   python -m backend train td --episodes 50000
+#   python -m backend solve vi
+#   python -m backend play vi
+#   python -m backend arena mc td vi random --games 1000
+#   python -m backend arena rtdp vi --games 200
+#   python -m backend bench
+#   python -m backend perft --suite
+#   python -m backend tablebase --empties 10
+#   python -m backend ntuple --games 20000
+#   python -m backend book --plies 4 --iterations 20000
+#   python -m backend record vi td random --games 10000 --out logs
+#   python -m backend analytics logs --reference vi
+#   python -m backend serve td --port 8000
+#   python -m backend publish td --to deploy && python -m backend serve --watch deploy
+#   python -m backend loadtest --url http://127.0.0.1:8000 --concurrency 32 --rate 500 --output report.json
+#
+# Modules are imported inside the command that needs them, so startup only pays for what is
+# used. Trained policies are saved as artifacts keyed by their config hash and reused.
+
+import argparse
+import os
+import sys
+import time
+
+
+class UsageError(ValueError):
+    """A bad policy spec or name on the command line, reported as a usage error"""
+
+
+DEFAULT_CONFIGS = {
+    'mc': {'episodes': 200000, 'epsilon': 0.1, 'alpha': 0.1, 'gamma': 0.9, 'seed': 0, 'afterstates': 0},
+    'td': {'episodes': 200000, 'epsilon': 0.2, 'alpha': 0.1, 'gamma': 0.9, 'seed': 0,
+           'mode': 'q', 'n_steps': 3, 'lam': 0.8, 'afterstates': 0},
+    'hogwild': {'episodes': 200000, 'epsilon': 0.2, 'alpha': 0.1, 'gamma': 0.9, 'seed': 0, 'workers': 0},
+    'vi': {'gamma': 0.9, 'theta': 1e-6, 'max_iterations': 100, 'mode': 'gauss_seidel'},
+    'pi': {'gamma': 0.9, 'theta': 1e-6, 'max_iterations': 20, 'seed': 0, 'evaluation': 'exact'},
+    'rtdp': {'gamma': 0.9, 'epsilon': 0.0},
+}
+
+# Options added after artifacts of their kind were saved: left out of the config, and so out of its
+# hash, while they are off, so that the existing artifacts are still found
+UNHASHED_WHEN_OFF = {'afterstates'}
+
+
+def _build_mc(config):
+    import random
+    from backend.rl.model_free.monte_carlo import MonteCarlo
+
+    random.seed(config['seed'])
+    mc = MonteCarlo(epsilon=config['epsilon'], alpha=config['alpha'], gamma=config['gamma'],
+                    afterstates=bool(config.get('afterstates')))
+    return mc.train(num_episodes=config['episodes'], verbose=False)
+
+
+def _build_td(config):
+    import random
+    from backend.rl.model_free.temporal_diff import TemporalDifference
+
+    random.seed(config['seed'])
+    td = TemporalDifference(epsilon=config['epsilon'], alpha=config['alpha'], gamma=config['gamma'],
+                            mode=config['mode'], n_steps=config['n_steps'], lam=config['lam'],
+                            afterstates=bool(config.get('afterstates')))
+    return td.train_full(iterations=config['episodes'], verbose=False)
+
+
+def _build_hogwild(config):
+    from backend.rl.model_free.hogwild_td import HogwildTemporalDifference
+
+    # workers=0 uses every core. The worker count is part of the config because lock-free updates
+    # make the result depend on it.
+    td = HogwildTemporalDifference(epsilon=config['epsilon'], alpha=config['alpha'], gamma=config['gamma'],
+                                   workers=config['workers'] or None)
+    return td.train_full(iterations=config['episodes'], verbose=False, seed=config['seed'])
+
+
+def _build_vi(config):
+    from backend.rl.dynamic_programming.value_iter import ValueIteration
+
+    vi = ValueIteration()
+    return vi.run_value_iteration(gamma=config['gamma'], theta=config['theta'],
+                                  max_iterations=config['max_iterations'], mode=config['mode'])
+
+
+def _build_pi(config):
+    import random
+    from backend.rl.dynamic_programming.policy_iter import PolicyIteration
+
+    random.seed(config['seed'])
+    pi = PolicyIteration()
+    return pi.run_policy_iteration(gamma=config['gamma'], theta=config['theta'],
+                                   max_iterations=config['max_iterations'], evaluation=config['evaluation'])
+
+
+def _on_demand_rtdp(config):
+    from backend.rl.dynamic_programming.rtdp import LRTDP, OnDemandPolicy
+
+    return OnDemandPolicy(LRTDP(gamma=config['gamma'], epsilon=config['epsilon']))
+
+
+BUILDERS = {'mc': _build_mc, 'td': _build_td, 'hogwild': _build_hogwild, 'vi': _build_vi, 'pi': _build_pi}
+# Policies that solve states when they are first asked for: nothing to build up front or to cache
+ON_DEMAND = {'rtdp': _on_demand_rtdp}
+
+
+def _parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_spec(spec):
+    """
+    Turn a policy spec such as 'td' or 'td:episodes=50000,epsilon=0.1' into (kind, config),
+    filling in the defaults for anything not given.
+    """
+    kind, _, overrides = spec.partition(':')
+    if kind not in DEFAULT_CONFIGS:
+        raise UsageError(f"Unknown policy kind '{kind}', expected one of {', '.join(DEFAULT_CONFIGS)}")
+
+    config = dict(DEFAULT_CONFIGS[kind])
+    for item in filter(None, overrides.split(',')):
+        key, _, value = item.partition('=')
+        if key not in config:
+            raise UsageError(f"Unknown option '{key}' for {kind}, expected one of {', '.join(config)}")
+        config[key] = _parse_value(value)
+    for key in UNHASHED_WHEN_OFF & set(config):
+        if not config[key]:
+            del config[key]
+    return kind, config
+
+
+def resolve_policy(spec, force=False, artifact_dir=None):
+    """Load (or train and save) the policy described by a spec. 'random' is the empty policy."""
+    if spec == 'random':
+        return {}
+
+    from backend.artifacts import load_or_build
+
+    kind, config = parse_spec(spec)
+    if kind in ON_DEMAND:
+        return ON_DEMAND[kind](config)
+    return load_or_build(kind, config, BUILDERS[kind], artifact_dir=artifact_dir, force=force)
+
+
+def resolve_full_policy(spec, artifact_dir=None):
+    """Like resolve_policy, but on-demand policies are solved for every state, for compiling"""
+    policy = resolve_policy(spec, artifact_dir=artifact_dir)
+    if spec != 'random' and parse_spec(spec)[0] in ON_DEMAND:
+        policy = policy.solve_reachable()
+    return policy
+
+
+def _spec_from_args(kind, args):
+    for key in sorted(set().union(*DEFAULT_CONFIGS.values()) - set(DEFAULT_CONFIGS[kind])):
+        if getattr(args, key, None) is not None:
+            raise UsageError(f"--{key.replace('_', '-')} does not apply to {kind}")
+    overrides = [f"{key}={value}" for key in DEFAULT_CONFIGS[kind]
+                 if (value := getattr(args, key, None)) is not None]
+    return kind + (":" + ",".join(overrides) if overrides else "")
+
+
+def cmd_train(args):
+    start = time.perf_counter()
+    policy = resolve_policy(_spec_from_args(args.kind, args), force=args.force, artifact_dir=args.artifacts)
+    print(f"{args.kind}: policy for {len(policy)} states ({time.perf_counter() - start:.2f}s)")
+
+
+def cmd_play(args):
+    from backend.rl.single_tic import SingleTic
+
+    policy = resolve_policy(args.policy, artifact_dir=args.artifacts)
+    SingleTic.simulate_game(policy)
+
+
+def _resolve_agents(args):
+    # Agents are keyed by their spec, so a repeated spec would silently merge into one
+    if len(set(args.policies)) < len(args.policies):
+        raise UsageError(f"Each policy can only be given once, got {' '.join(args.policies)}")
+    return {spec: resolve_policy(spec, artifact_dir=args.artifacts) for spec in args.policies}
+
+
+def cmd_arena(args):
+    from backend.rl.arena import run_tournament, print_report
+
+    agents = _resolve_agents(args)
+    results = run_tournament(agents, games_per_pair=args.games, opening_plies=args.openings,
+                             seed=args.seed, processes=args.processes)
+    print_report(results)
+
+
+def cmd_sweep(args):
+    from backend.rl.model_free.sweep import run_sweep
+
+    run_sweep(args.algorithm, search=args.search, trials=args.trials, min_episodes=args.min_episodes,
+              max_episodes=args.max_episodes, eta=args.eta, seed=args.seed, processes=args.processes,
+              output=args.output, points=args.points)
+
+
+def cmd_perft(args):
+    from backend.ultimate.perft import parallel_perft, run_suite, check_against_multitic
+    from backend.ultimate.position import Position
+
+    if args.suite:
+        failures = run_suite(max_depth=args.depth, processes=args.processes)
+        if args.check:
+            failures += check_against_multitic()
+        if failures:
+            print(f"{len(failures)} perft counts differ from the expected ones")
+            sys.exit(1)
+        return
+
+    moves = [int(move) for move in args.moves.split(",")] if args.moves else []
+    position = Position.from_moves(moves, first_grid=None if args.free else 4)
+    start = time.perf_counter()
+    nodes, counts = parallel_perft(position, args.depth or 5, args.processes)
+    elapsed = time.perf_counter() - start
+    for move in sorted(counts):
+        print(f"  {move:>2} (grid {move // 9}, position {move % 9}): {counts[move]}")
+    print(f"perft {args.depth or 5}: {nodes} nodes in {elapsed:.2f}s ({nodes / elapsed:,.0f} nodes/sec)")
+
+
+def cmd_mnk(args):
+    from backend.artifacts import DEFAULT_ARTIFACT_DIR
+    from backend.rl.dynamic_programming.mnk import MNKRules, OutOfCoreSolver
+
+    try:
+        rules = MNKRules(args.m, args.n, args.k)
+    except ValueError as e:
+        raise UsageError(str(e))
+    moves = [int(move) for move in args.probe.split(",")] if args.probe else []
+    if len(set(moves)) < len(moves) or any(not 0 <= move < rules.cells for move in moves):
+        raise UsageError(f"--probe needs distinct cells between 0 and {rules.cells - 1}")
+
+    workdir = args.workdir or os.path.join(args.artifacts or DEFAULT_ARTIFACT_DIR, f"mnk-{args.m}x{args.n}x{args.k}")
+    solver = OutOfCoreSolver(rules, workdir, memory_budget_mb=args.memory)
+    solver.solve()
+    if args.probe is not None:
+        code = sum((1 if ply % 2 == 0 else 2) * 3 ** move for ply, move in enumerate(moves))
+        names = {1: 'X wins', 0: 'draw', -1: 'O wins'}
+        move = solver.best_move(code)
+        print(f"Value {names[solver.value(code)]}, " + ("game over" if move is None else f"best move {move}"))
+
+
+def cmd_tablebase(args):
+    from backend.ultimate.position import Position
+    from backend.ultimate.tablebase import Tablebase, build_tablebase, WDL_NAMES
+
+    path = build_tablebase(max_empties=args.empties, games=args.games, seed=args.seed,
+                           artifact_dir=args.artifacts, force=args.force)
+    if args.probe is not None:
+        moves = [int(move) for move in args.probe.split(",")] if args.probe else []
+        position = Position.from_moves(moves)
+        tablebase = Tablebase.open(path)
+        value = tablebase.probe(position)
+        if value is None:
+            print(f"Not in the tablebase ({position.playable_empties()} playable empties)")
+        else:
+            wdl, distance = value
+            print(f"{WDL_NAMES[wdl]} for the player to move, game over in {distance} plies, "
+                  f"best move {tablebase.best_move(position)}")
+
+
+def cmd_ntuple(args):
+    from backend.ultimate.ntuple import load_or_train, play_match
+
+    network = load_or_train(games=args.games, alpha=args.alpha, epsilon=args.epsilon, seed=args.seed,
+                            artifact_dir=args.artifacts, force=args.force)
+    if args.match:
+        agent = network.agent()
+        for side, agents in (("X", (agent, None)), ("O", (None, agent))):
+            wins_x, wins_o, draws = play_match(*agents, games=args.match, seed=args.seed)
+            wins = wins_x if side == "X" else wins_o
+            print(f"As {side} against random: {wins}/{args.match} won, {draws} drawn")
+
+
+def cmd_book(args):
+    from backend.ultimate.opening_book import OpeningBook, build_book
+    from backend.ultimate.position import Position
+
+    first_grid = None if args.free else 4
+    path = build_book(plies=args.plies, iterations=args.iterations, first_grid=first_grid, seed=args.seed,
+                      processes=args.processes, artifact_dir=args.artifacts, force=args.force)
+    if args.probe is not None:
+        moves = [int(move) for move in args.probe.split(",")] if args.probe else []
+        entry = OpeningBook.open(path).probe(Position.from_moves(moves, first_grid))
+        if entry is None:
+            print("Not in the book")
+        else:
+            print(f"Book move {entry.move} (grid {entry.move // 9}, position {entry.move % 9}): "
+                  f"expected score {entry.score:.3f}, {entry.visits}/{entry.iterations} visits")
+
+
+def cmd_record(args):
+    from backend.rl.arena import record_games
+
+    agents = _resolve_agents(args)
+    start = time.perf_counter()
+    games = record_games(agents, args.out, games_per_pair=args.games, shards=args.shards,
+                         opening_plies=args.openings, seed=args.seed, processes=args.processes)
+    print(f"Logged {games} games to {args.shards} shards in {args.out} ({time.perf_counter() - start:.2f}s)")
+
+
+def cmd_analytics(args):
+    import json
+    from backend.analytics import (OpeningFrequency, VisitCounts, Blunders, WinRateByOpening, analyze_logs,
+                                   print_report)
+    from backend.gamelog import SINGLE, ULTIMATE, shard_paths
+
+    if not os.path.exists(args.logs):
+        raise SystemExit(f"No such game log file or directory: {args.logs}")
+    paths = shard_paths(args.logs) if os.path.isdir(args.logs) else [args.logs]
+    if not paths:
+        raise SystemExit(f"No game logs in {args.logs}")
+    reference = resolve_policy(args.reference, artifact_dir=args.artifacts) if args.reference else None
+    analyses = [
+        OpeningFrequency(plies=args.opening_plies),
+        WinRateByOpening(plies=args.opening_plies),
+        VisitCounts(max_ply=args.max_ply),
+        Blunders(reference=reference, tablebase_path=args.tablebase),
+    ]
+    kind = {'all': None, 'single': SINGLE, 'ultimate': ULTIMATE}[args.kind]
+    report = analyze_logs(paths, analyses, kind=kind, processes=args.processes, top=args.top)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def cmd_loadtest(args):
+    from backend.gamelog import shard_paths
+    from backend.loadtest import run_load, load_openings, print_report, save_report, load_report, compare_reports
+
+    mix = {}
+    for item in args.mix.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in ('single', 'ultimate'):
+            raise SystemExit(f"Unknown session kind '{kind}' in --mix, expected single or ultimate")
+        mix[kind] = float(weight or 1)
+
+    openings = None
+    if args.logs:
+        paths = shard_paths(args.logs) if os.path.isdir(args.logs) else [args.logs]
+        openings = load_openings(paths, plies=args.opening_plies, seed=args.seed)
+
+    url, server = args.url, None
+    if args.serve:
+        # A server in this process shares the CPU (and the GIL) with the load generator, which is
+        # fine for comparing builds but not for absolute numbers
+        import threading
+        from backend.server import PolicyServer
+
+        server = PolicyServer(resolve_policy(args.serve, artifact_dir=args.artifacts), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        report = run_load(url, concurrency=args.concurrency, rate=args.rate, duration=args.duration,
+                          warmup=args.warmup, mix=mix, openings=openings, opening_plies=args.opening_plies,
+                          think=args.think, timeout=args.timeout, seed=args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    print_report(report)
+    if args.output:
+        save_report(report, args.output)
+    if args.compare and compare_reports(load_report(args.compare), report, tolerance=args.tolerance):
+        sys.exit(1)
+
+
+def _bench_state_result(seconds):
+    from backend.rl.single_tic import state_result
+
+    state_key = (('X', 'O', None), (None, 'X', None), ('O', None, None))
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(1000):
+            state_result(state_key)
+        calls += 1000
+    return calls, time.perf_counter() - start, "calls"
+
+
+def _bench_game_result(seconds):
+    from backend.rl.single_tic import SingleTic
+
+    game = SingleTic([['X', 'O', None], [None, 'X', None], ['O', None, None]])
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(100):
+            game.game_result()
+        calls += 100
+    return calls, time.perf_counter() - start, "calls"
+
+
+def _bench_td_episode(seconds):
+    from backend.rl.model_free.temporal_diff import TemporalDifference
+
+    td = TemporalDifference()
+    episodes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        td.train_episode()
+        episodes += 1
+    return episodes, time.perf_counter() - start, "episodes"
+
+
+def _bench_arena(seconds):
+    from backend.rl.arena import play_game, RANDOM_AGENT
+
+    games = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        play_game(RANDOM_AGENT, RANDOM_AGENT, seed=games)
+        games += 1
+    return games, time.perf_counter() - start, "games"
+
+
+def _bench_perft(seconds):
+    from backend.ultimate.perft import perft
+    from backend.ultimate.position import Position
+
+    position = Position()
+    nodes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        nodes += perft(position, 4)
+    return nodes, time.perf_counter() - start, "nodes"
+
+
+def _bench_compact_policy(seconds):
+    from backend.rl.compact_policy import compile_policy
+    from backend.rl.single_tic import decode_state_key
+
+    # Every other code, so half the lookups are misses
+    compact = compile_policy({decode_state_key(code): code % 9 for code in range(0, 3 ** 9, 2)})
+    state_keys = [decode_state_key(code) for code in range(0, 3 ** 9, 97)]
+    lookups = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for state_key in state_keys:
+            compact.get(state_key)
+        lookups += len(state_keys)
+    return lookups, time.perf_counter() - start, "lookups"
+
+
+def _bench_batch_playout(seconds):
+    from backend.ultimate.batch_playout import batch_playouts
+    from backend.ultimate.position import Position
+
+    position = Position()
+    playouts = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        batch_playouts(position, 10000, seed=playouts)
+        playouts += 10000
+    return playouts, time.perf_counter() - start, "playouts"
+
+
+BENCHMARKS = {
+    'state_result': _bench_state_result,
+    'game_result': _bench_game_result,
+    'td_episode': _bench_td_episode,
+    'arena_game': _bench_arena,
+    'perft': _bench_perft,
+    'compact_policy': _bench_compact_policy,
+    'batch_playout': _bench_batch_playout,
+}
+
+
+def cmd_bench(args):
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            raise UsageError(f"Unknown benchmark '{name}', expected one of {', '.join(BENCHMARKS)}")
+        count, elapsed, unit = BENCHMARKS[name](args.seconds)
+        print(f"{name:<16} {count / elapsed:>14,.0f} {unit}/sec")
+
+
+def cmd_serve(args):
+    from backend.server import serve
+
+    if args.watch:
+        policy = None
+    elif args.policy and args.compact:
+        from backend.rl.compact_policy import compile_policy
+
+        policy = compile_policy(resolve_full_policy(args.policy, artifact_dir=args.artifacts))
+        print(f"Compiled {len(policy)} states into {policy.nbytes} bytes")
+    elif args.policy:
+        policy = resolve_policy(args.policy, artifact_dir=args.artifacts)
+    else:
+        raise SystemExit("Give a policy spec to serve, or --watch a directory of published policies")
+    serve(policy, host=args.host, port=args.port, max_sessions=args.max_sessions,
+          session_timeout=args.session_timeout, snapshot=args.snapshot, watch=args.watch, name=args.name,
+          book=args.book)
+
+
+def cmd_publish(args):
+    from backend.policy_store import publish_policy
+
+    policy = resolve_full_policy(args.policy, artifact_dir=args.artifacts)
+    version, path = publish_policy(policy, args.to, name=args.name, keep=args.keep)
+    print(f"Published {args.policy} as version {version}: {path}")
+
+
+def _positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"expected a whole number of at least 1, got {text}")
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m backend", description="Tic-Tac-RL command line")
+    parser.add_argument("--artifacts", default=None, help="Artifact directory (default: ./artifacts)")
+    parser.add_argument("--instrument", metavar="PATH", default=None,
+                        help="Count and time the RL hot paths, print a report and export it as JSON")
+    parser.add_argument("--trace-memory", dest="trace_memory", action="store_true",
+                        help="With --instrument, track Q-table growth with tracemalloc")
+    parser.add_argument("--sample-interval", dest="sample_interval", type=float, default=None,
+                        help="With --instrument, run the sampling profiler at this interval (seconds)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train = subparsers.add_parser("train", help="Train a model-free policy (mc, td, hogwild)")
+    train.add_argument("kind", choices=['mc', 'td', 'hogwild'])
+    train.add_argument("--episodes", type=int)
+    train.add_argument("--epsilon", type=float)
+    train.add_argument("--alpha", type=float)
+    train.add_argument("--gamma", type=float)
+    train.add_argument("--seed", type=int)
+    train.add_argument("--mode", choices=['q', 'nstep', 'watkins'], help="TD update (default: one-step q)")
+    train.add_argument("--n-steps", dest="n_steps", type=int, help="Lookahead for --mode nstep")
+    train.add_argument("--lam", type=float, help="Trace decay for --mode watkins")
+    train.add_argument("--afterstates", action="store_const", const=1,
+                       help="mc/td: learn values of post-move boards instead of (state, move) pairs")
+    train.add_argument("--workers", type=int, help="Processes for hogwild (default: all cores)")
+    train.add_argument("--force", action="store_true", help="Retrain even if an artifact exists")
+    train.set_defaults(func=cmd_train)
+
+    solve = subparsers.add_parser("solve", help="Solve with dynamic programming (vi, pi)")
+    solve.add_argument("kind", choices=['vi', 'pi'])
+    solve.add_argument("--gamma", type=float)
+    solve.add_argument("--theta", type=float)
+    solve.add_argument("--max-iterations", dest="max_iterations", type=int)
+    solve.add_argument("--mode", choices=['gauss_seidel', 'prioritized', 'sweep'],
+                       help="Backup schedule for vi (default: gauss_seidel)")
+    solve.add_argument("--evaluation", choices=['exact', 'sweep'],
+                       help="Policy evaluation for pi: exact ordered pass (default) or capped sweeps")
+    solve.add_argument("--force", action="store_true", help="Solve again even if an artifact exists")
+    solve.set_defaults(func=cmd_train)
+
+    play = subparsers.add_parser("play", help="Play against a policy in the terminal")
+    play.add_argument("policy", help="Policy spec, e.g. vi or td:episodes=50000")
+    play.set_defaults(func=cmd_play)
+
+    arena = subparsers.add_parser("arena", help="Round-robin tournament between policies")
+    arena.add_argument("policies", nargs="+", help="Policy specs, 'random' for a random player")
+    arena.add_argument("--games", type=int, default=200, help="Games per pair of policies")
+    arena.add_argument("--openings", type=int, default=2, help="Random opening plies per game")
+    arena.add_argument("--seed", type=int, default=0)
+    arena.add_argument("--processes", type=int, default=None)
+    arena.set_defaults(func=cmd_arena)
+
+    sweep = subparsers.add_parser("sweep", help="Parallel hyperparameter sweep with successive halving")
+    sweep.add_argument("algorithm", choices=['mc', 'td'])
+    sweep.add_argument("--search", choices=['random', 'grid'], default="random")
+    sweep.add_argument("--trials", type=int, default=27, help="Configurations for random search")
+    sweep.add_argument("--points", type=int, default=3,
+                       help="Values per (low, high) range for grid search (log-spaced)")
+    sweep.add_argument("--min-episodes", dest="min_episodes", type=int, default=2000, help="Budget of the first rung")
+    sweep.add_argument("--max-episodes", dest="max_episodes", type=int, default=54000, help="Budget of the last rung")
+    sweep.add_argument("--eta", type=int, default=3, help="Keep the best 1/eta configs after each rung")
+    sweep.add_argument("--seed", type=int, default=0)
+    sweep.add_argument("--processes", type=int, default=None)
+    sweep.add_argument("--output", default="sweep.csv", help="CSV results table")
+    sweep.set_defaults(func=cmd_sweep)
+
+    bench = subparsers.add_parser("bench", help="Micro-benchmarks of the hot paths")
+    bench.add_argument("names", nargs="*", help=f"Benchmarks to run ({', '.join(BENCHMARKS)})")
+    bench.add_argument("--seconds", type=float, default=1.0, help="Time spent per benchmark")
+    bench.set_defaults(func=cmd_bench)
+
+    perft = subparsers.add_parser("perft", help="Count Ultimate tic-tac-toe leaf nodes to a depth")
+    perft.add_argument("--depth", type=int, default=None, help="Search depth (default 5, or the whole suite)")
+    perft.add_argument("--moves", default=None, help="Comma-separated moves (grid * 9 + position) to start from")
+    perft.add_argument("--free", action="store_true", help="Let X open in any grid instead of grid 4")
+    perft.add_argument("--processes", type=int, default=None, help="Processes for the root split")
+    perft.add_argument("--suite", action="store_true", help="Run the regression suite of known counts")
+    perft.add_argument("--check", action="store_true", help="With --suite, also compare with the MultiTic classes")
+    perft.set_defaults(func=cmd_perft)
+
+    mnk = subparsers.add_parser("mnk", help="Solve an m,n,k game (k in a row on m x n) out of core")
+    mnk.add_argument("m", type=int, nargs="?", default=3, help="Rows (default: 3)")
+    mnk.add_argument("n", type=int, nargs="?", default=3, help="Columns (default: 3)")
+    mnk.add_argument("k", type=int, nargs="?", default=3, help="Pieces in a row to win (default: 3)")
+    mnk.add_argument("--memory", type=int, default=256, help="Memory budget for a chunk of states (MB)")
+    mnk.add_argument("--workdir", default=None,
+                     help="Directory for the level files and values (default: ARTIFACTS/mnk-MxNxK)")
+    mnk.add_argument("--probe", default=None, metavar="CELLS",
+                     help="Comma-separated cells (row * n + col) played from the empty board, X first, to look up")
+    mnk.set_defaults(func=cmd_mnk)
+
+    tablebase = subparsers.add_parser("tablebase", help="Build an Ultimate endgame tablebase")
+    tablebase.add_argument("--empties", type=int, default=10, help="Most playable empty cells in a position")
+    tablebase.add_argument("--games", type=int, default=1000, help="Random games to take the roots from")
+    tablebase.add_argument("--seed", type=int, default=0)
+    tablebase.add_argument("--probe", default=None, metavar="MOVES",
+                           help="Comma-separated moves (grid * 9 + position) of a position to look up")
+    tablebase.add_argument("--force", action="store_true", help="Rebuild even if the file exists")
+    tablebase.set_defaults(func=cmd_tablebase)
+
+    ntuple = subparsers.add_parser("ntuple", help="Train an Ultimate n-tuple value network by TD self-play")
+    ntuple.add_argument("--games", type=int, default=20000, help="Self-play games")
+    ntuple.add_argument("--alpha", type=float, default=0.1)
+    ntuple.add_argument("--epsilon", type=float, default=0.1)
+    ntuple.add_argument("--seed", type=int, default=0)
+    ntuple.add_argument("--match", type=int, default=100, help="Games per side against a random player (0 to skip)")
+    ntuple.add_argument("--force", action="store_true", help="Retrain even if the artifact exists")
+    ntuple.set_defaults(func=cmd_ntuple)
+
+    book = subparsers.add_parser("book", help="Build an Ultimate opening book with parallel searches")
+    book.add_argument("--plies", type=int, default=4, help="Plies covered by the book")
+    book.add_argument("--iterations", type=int, default=20000, help="MCTS iterations per book position")
+    book.add_argument("--free", action="store_true", help="Let X open in any grid instead of grid 4")
+    book.add_argument("--processes", type=int, default=None, help="Parallel searches (default: every core)")
+    book.add_argument("--seed", type=int, default=0)
+    book.add_argument("--probe", default=None, metavar="MOVES",
+                      help="Comma-separated moves (grid * 9 + position) of a position to look up")
+    book.add_argument("--force", action="store_true", help="Rebuild even if the file exists")
+    book.set_defaults(func=cmd_book)
+
+    record = subparsers.add_parser("record", help="Log round-robin games between policies to a sharded game log")
+    record.add_argument("policies", nargs="+", help="Policy specs, 'random' for a random player")
+    record.add_argument("--out", default="logs", help="Directory for the log shards")
+    record.add_argument("--games", type=int, default=1000, help="Games per pair of policies")
+    record.add_argument("--shards", type=int, default=4)
+    record.add_argument("--openings", type=int, default=2, help="Random opening plies per game")
+    record.add_argument("--seed", type=int, default=0)
+    record.add_argument("--processes", type=int, default=None)
+    record.set_defaults(func=cmd_record)
+
+    analytics = subparsers.add_parser("analytics", help="Openings, visits, blunders and results of logged games")
+    analytics.add_argument("logs", help="Log directory (every shard in it) or a single log file")
+    analytics.add_argument("--kind", choices=['all', 'single', 'ultimate'], default='all')
+    analytics.add_argument("--reference", default=None,
+                           help="Policy spec to judge tic-tac-toe blunders against (default: perfect play)")
+    analytics.add_argument("--tablebase", default=None, help="Tablebase file to judge Ultimate endgame blunders")
+    analytics.add_argument("--opening-plies", dest="opening_plies", type=int, default=2)
+    analytics.add_argument("--max-ply", dest="max_ply", type=int, default=10, help="Count visits up to this ply")
+    analytics.add_argument("--top", type=int, default=10)
+    analytics.add_argument("--processes", type=int, default=None)
+    analytics.add_argument("--output", default=None, help="Also write the report as JSON")
+    analytics.set_defaults(func=cmd_analytics)
+
+    loadtest = subparsers.add_parser("loadtest", help="Replay game sessions against a move server under load")
+    loadtest.add_argument("--url", default="http://127.0.0.1:8000", help="Server to test")
+    loadtest.add_argument("--serve", default=None, metavar="POLICY",
+                          help="Start a server for this policy spec in-process and test it instead of --url")
+    loadtest.add_argument("--concurrency", type=int, default=16, help="Virtual users, one connection each")
+    loadtest.add_argument("--rate", type=float, default=None, help="Requests/sec over all users (default: unlimited)")
+    loadtest.add_argument("--duration", type=float, default=10.0, help="Measured seconds")
+    loadtest.add_argument("--warmup", type=float, default=1.0, help="Seconds of load before measuring")
+    loadtest.add_argument("--mix", default="single=1,ultimate=1", help="Weights of the session kinds")
+    loadtest.add_argument("--logs", default=None, help="Game log directory or file to sample openings from")
+    loadtest.add_argument("--opening-plies", dest="opening_plies", type=int, default=4)
+    loadtest.add_argument("--think", type=float, default=0.0, help="Pause before every request (seconds)")
+    loadtest.add_argument("--timeout", type=float, default=5.0, help="Request timeout (seconds)")
+    loadtest.add_argument("--seed", type=int, default=0)
+    loadtest.add_argument("--output", default=None, help="Write the report as JSON")
+    loadtest.add_argument("--compare", default=None, metavar="REPORT",
+                          help="Baseline report to compare with, exits with 1 on a regression")
+    loadtest.add_argument("--tolerance", type=float, default=0.1, help="Relative change that counts as a regression")
+    loadtest.set_defaults(func=cmd_loadtest)
+
+    publish = subparsers.add_parser("publish", help="Publish a policy as the next version for serve --watch")
+    publish.add_argument("policy", help="Policy spec, e.g. td:episodes=300000")
+    publish.add_argument("--to", default="deploy", help="Directory that servers watch")
+    publish.add_argument("--name", default="policy", help="Name of the served policy")
+    publish.add_argument("--keep", type=_positive_int, default=None, help="Delete all but the newest KEEP versions")
+    publish.set_defaults(func=cmd_publish)
+
+    serve = subparsers.add_parser("serve", help="Serve moves from a policy over HTTP")
+    serve.add_argument("policy", nargs="?", help="Policy spec, e.g. vi or td:episodes=50000")
+    serve.add_argument("--watch", default=None, metavar="DIR",
+                       help="Serve the newest policy published to DIR and hot-reload new versions")
+    serve.add_argument("--name", default="policy", help="With --watch, the published policy name to serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--compact", action="store_true", help="Serve from a compiled perfect-hash policy")
+    serve.add_argument("--max-sessions", dest="max_sessions", type=int, default=10000,
+                       help="Live Ultimate games kept, the least recently used is evicted beyond that")
+    serve.add_argument("--session-timeout", dest="session_timeout", type=float, default=1800.0,
+                       help="Seconds before an idle game is dropped")
+    serve.add_argument("--snapshot", default=None, help="File to restore games from and save them to")
+    serve.add_argument("--book", default=None, help="Opening book file to answer /analyze from (see the book command)")
+    serve.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.instrument:
+        from backend.rl import instrument
+        instrument.enable(memory=args.trace_memory, sample_interval=args.sample_interval)
+
+    try:
+        args.func(args)
+    except UsageError as e:
+        # Anything else is a real failure and keeps its traceback
+        parser.error(str(e))
+    finally:
+        if args.instrument:
+            instrument.disable()
+            instrument.print_report()
+            instrument.export_json(args.instrument)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
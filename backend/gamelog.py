@@ -0,0 +1,114 @@
+# Compact binary logs of played games, tic-tac-toe and Ultimate tic-tac-toe alike.
+#
+# A log file starts with a 5-byte header (magic, version) followed by one record per game:
+#   kind    1 byte, SINGLE or ULTIMATE
+#   result  1 byte, EMPTY (unfinished), X, O or DRAW as in ultimate/tables.py
+#   count   1 byte, the number of moves
+#   moves   one byte per move: the cell 0-8, or grid * 9 + cell for Ultimate
+# so a tic-tac-toe game costs at most 12 bytes and an Ultimate game at most 84. Records are only
+# ever appended, and read_games() is a generator, so a log of any size streams in constant memory.
+#
+# Large logs are split into shards (games-000.log, games-001.log, ...) that separate processes can
+# write and read independently, see ShardedLog and analytics.analyze_logs.
+#
+#   with GameLog("games.log") as log:
+#       log.write(SINGLE, [4, 0, 8, 2, 1, 7, 6, 3, 5], 'D')
+#   for game in read_games("games.log"):
+#       game.kind, game.moves, game.result
+
+import glob
+import os
+from collections import namedtuple
+
+
+MAGIC = b"TTGL"
+VERSION = 1
+SINGLE, ULTIMATE = 1, 2
+RESULT_CODES = {None: 0, 'X': 1, 'O': 2, 'D': 3}
+RESULT_SYMBOLS = (None, 'X', 'O', 'D')
+MAX_MOVES = {SINGLE: 9, ULTIMATE: 81}
+
+GameRecord = namedtuple('GameRecord', 'kind moves result')  # result is 'X', 'O', 'D' or None
+
+
+class GameLog:
+    """Append-only writer for one log file"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC + bytes([VERSION]))
+        self.games = 0
+
+    def write(self, kind, moves, result):
+        if kind not in MAX_MOVES:
+            raise ValueError(f"Unknown game kind {kind}")
+        if len(moves) > MAX_MOVES[kind] or any(not 0 <= move < MAX_MOVES[kind] for move in moves):
+            raise ValueError(f"Moves out of range for a game of kind {kind}: {moves}")
+        self.file.write(bytes((kind, RESULT_CODES[result], len(moves), *moves)))
+        self.games += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardedLog:
+    """Writes games round-robin over `shards` log files in a directory"""
+
+    def __init__(self, directory, shards=4, prefix="games"):
+        self.logs = [GameLog(shard_path(directory, index, prefix)) for index in range(shards)]
+        self.next = 0
+
+    def write(self, kind, moves, result):
+        self.logs[self.next].write(kind, moves, result)
+        self.next = (self.next + 1) % len(self.logs)
+
+    def close(self):
+        for log in self.logs:
+            log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def shard_path(directory, index, prefix="games"):
+    return os.path.join(directory, f"{prefix}-{index:03d}.log")
+
+
+def shard_paths(directory, prefix="games"):
+    """Every shard of a log directory, in order"""
+    return sorted(glob.glob(os.path.join(directory, f"{prefix}-*.log")))
+
+
+def read_games(path, buffer_size=1 << 16):
+    """Generator over the games of one log file, as GameRecords"""
+    with open(path, "rb", buffering=buffer_size) as f:
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a game log")
+        if header[len(MAGIC)] != VERSION:
+            raise ValueError(f"{path} is a version {header[len(MAGIC)]} game log, expected {VERSION}")
+
+        while True:
+            head = f.read(3)
+            if len(head) < 3:
+                # A partial record can only be the end of a log whose writer was interrupted
+                return
+            kind, result, count = head
+            moves = f.read(count)
+            if len(moves) < count:
+                return
+            yield GameRecord(kind, tuple(moves), RESULT_SYMBOLS[result])
@@ -0,0 +1,446 @@
+# Load generator for the move server (server.py), built on asyncio and the standard library.
+#
+# Every virtual user keeps one keep-alive connection and plays whole game sessions, one after the
+# other, for as long as the test runs:
+#   single    a tic-tac-toe game against the served policy (POST /move for the policy's side,
+#             random moves for the user's side)
+#   ultimate  an Ultimate game through the session API (POST /games, /games/move, /games/state),
+#             both sides played by the user
+# Sessions start from an opening sampled from recorded games (gamelog.py) when logs are given, and
+# from random moves otherwise, so the server sees the positions real games go through.
+#
+# With a request rate the test is open-loop: requests are scheduled at fixed intervals, and a
+# request's latency is measured from the time it was scheduled, not from when a busy user got around
+# to sending it. A server that falls behind then shows up as growing latency instead of silently
+# lowering the load (coordinated omission). Without a rate every user sends as fast as it can.
+#
+# A request whose slot has already passed when a user gets to it starts late: every user was busy.
+# Late starts are counted and reported, and a run with many of them gets a warning, as the generator
+# (too few users for the rate) may be the bottleneck rather than the server. Think time is the
+# generator's own doing, so a slot missed while a user was thinking moves the schedule on instead of
+# being counted as latency.
+#
+# The report has latency percentiles, throughput and error rates per endpoint and in total, plus the
+# config and build it was made with, so that two runs can be compared with compare_reports.
+#
+#   report = run_load("http://127.0.0.1:8000", concurrency=32, rate=500, duration=30)
+#   print_report(report)
+#   compare_reports(load_report("baseline.json"), report)
+
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from backend.gamelog import SINGLE, ULTIMATE, read_games
+from backend.rl.single_tic import WINNING_LINES
+from backend.ultimate.position import Position
+
+
+REPORT_VERSION = 1
+DEFAULT_MIX = {'single': 1, 'ultimate': 1}
+PERCENTILES = (50, 90, 99)
+LATE_WARNING = 0.01   # share of late starts above which a report warns that the generator fell behind
+
+
+class RequestFailed(Exception):
+    pass
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, for JSON requests and responses"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        request = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                   f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode() + body
+
+        # A reused connection may have been closed by the server while idle: reconnect once
+        reused = self.writer is not None
+        while True:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self.writer.write(request)
+                await self.writer.drain()
+                head = await self.reader.readuntil(b"\r\n\r\n")
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if not reused:
+                    raise
+                reused = False
+
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        data = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, json.loads(data) if data else None
+
+
+class RateLimiter:
+    """Hands out request start times `1 / rate` seconds apart, shared by all users"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next = None
+
+    async def wait(self, paused=0.0):
+        """
+        (start time, late) of the caller's next request, late if the slot had already passed. `paused`
+        is how long the caller has just been thinking: the part of the delay it covers is skipped.
+        """
+        now = time.perf_counter()
+        if self.next is None:
+            self.next = now
+        late = self.next < now
+        if late:
+            self.next = min(now, self.next + paused)
+        slot = self.next
+        self.next += self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        return slot, late
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []      # seconds, successful and failed requests alike
+        self.statuses = Counter()
+        self.errors = 0
+        self.late = 0            # requests that started after their slot, every user being busy
+
+    def add(self, latency, status, error, late=False):
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+        self.errors += error
+        self.late += late
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.statuses.update(other.statuses)
+        self.errors += other.errors
+        self.late += other.late
+
+    def summary(self, seconds):
+        requests = len(self.latencies)
+        latencies = sorted(self.latencies)
+        summary = {
+            'requests': requests,
+            'errors': self.errors,
+            'error_rate': round(self.errors / requests, 5) if requests else 0.0,
+            'late': self.late,
+            'throughput': round(requests / seconds, 2) if seconds else 0.0,
+            'mean_ms': round(1000 * sum(latencies) / requests, 3) if requests else None,
+            'max_ms': round(1000 * latencies[-1], 3) if requests else None,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+        }
+        for p in PERCENTILES:
+            summary[f'p{p}_ms'] = round(1000 * percentile(latencies, p), 3) if requests else None
+        return summary
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def load_openings(paths, plies=4, max_openings=10000, seed=0):
+    """
+    Openings of recorded games, {SINGLE: [...], ULTIMATE: [...]} as tuples of moves. Logs of any
+    size are streamed, keeping a uniform sample (reservoir) of at most max_openings per kind.
+    """
+    rng = random.Random(seed)
+    openings = {SINGLE: [], ULTIMATE: []}
+    seen = Counter()
+    for path in paths:
+        for game in read_games(path):
+            sample = openings[game.kind]
+            seen[game.kind] += 1
+            opening = game.moves[:plies]
+            if len(sample) < max_openings:
+                sample.append(opening)
+            else:
+                index = rng.randrange(seen[game.kind])
+                if index < max_openings:
+                    sample[index] = opening
+    return openings
+
+
+def _winner(cells):
+    for a, b, c in WINNING_LINES:
+        if cells[a] is not None and cells[a] == cells[b] == cells[c]:
+            return cells[a]
+    return 'D' if None not in cells else None
+
+
+class LoadTest:
+    def __init__(self, url, concurrency=16, rate=None, duration=10.0, warmup=1.0, mix=None, openings=None,
+                 opening_plies=4, think=0.0, timeout=5.0, seed=0):
+        parts = urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"Expected an http://host:port URL, got {url}")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.mix = mix or DEFAULT_MIX
+        self.openings = openings or {SINGLE: [], ULTIMATE: []}
+        self.opening_plies = opening_plies
+        self.think = think
+        self.timeout = timeout
+        self.seed = seed
+
+        self.limiter = RateLimiter(rate) if rate else None
+        self.stats = {}
+        self.sessions = Counter()
+        self.measure_from = self.stop_at = None
+
+    def _running(self):
+        return time.perf_counter() < self.stop_at
+
+    async def call(self, connection, method, path, payload=None):
+        """One timed request. Returns the response payload, or raises RequestFailed."""
+        if self.think:
+            await asyncio.sleep(self.think)
+        if self.limiter:
+            start, late = await self.limiter.wait(paused=self.think)
+        else:
+            start, late = time.perf_counter(), False
+        status, error = None, False
+        try:
+            status, response = await asyncio.wait_for(connection.request(method, path, payload), self.timeout)
+            error = status >= 400
+        except asyncio.TimeoutError:
+            status, error = 'timeout', True
+            await connection.close()
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status, error = 'connection', True
+            await connection.close()
+
+        end = time.perf_counter()
+        if start >= self.measure_from:
+            self.stats.setdefault(f"{method} {path}", EndpointStats()).add(end - start, status, error, late)
+        if error:
+            raise RequestFailed(status)
+        return response
+
+    def _opening(self, kind, rng):
+        openings = self.openings[kind]
+        return rng.choice(openings) if openings else None
+
+    async def single_session(self, connection, rng):
+        cells = [None] * 9
+        opening = self._opening(SINGLE, rng)
+        if opening is None:
+            opening = rng.sample(range(9), rng.randint(0, self.opening_plies))
+        ply = 0
+        for move in opening:
+            cells[move] = 'X' if ply % 2 == 0 else 'O'
+            ply += 1
+            if _winner(cells):
+                return
+
+        policy_side = rng.choice('XO')
+        while self._running() and not _winner(cells):
+            player = 'X' if ply % 2 == 0 else 'O'
+            if player == policy_side:
+                board = [cells[0:3], cells[3:6], cells[6:9]]
+                move = (await self.call(connection, "POST", "/move", {'board': board}))['move']
+            else:
+                move = rng.choice([i for i in range(9) if cells[i] is None])
+            cells[move] = player
+            ply += 1
+
+    async def ultimate_session(self, connection, rng):
+        game_id = (await self.call(connection, "POST", "/games", {}))['game_id']
+        position = Position()
+        opening = self._opening(ULTIMATE, rng)
+        if opening is None:
+            opening = []
+            replay = Position()
+            for _ in range(rng.randint(0, self.opening_plies)):
+                if replay.result:
+                    break
+                move = rng.choice(replay.legal_moves())
+                replay.make(move)
+                opening.append(move)
+
+        moves = list(opening)
+        while self._running() and not position.result:
+            move = moves.pop(0) if moves else rng.choice(position.legal_moves())
+            await self.call(connection, "POST", "/games/move", {'game_id': game_id, 'move': move})
+            position.make(move)
+            # Clients poll the state now and then, e.g. after reconnecting
+            if rng.random() < 0.1:
+                await self.call(connection, "POST", "/games/state", {'game_id': game_id})
+
+    async def user(self, index):
+        rng = random.Random(self.seed * 1000003 + index)
+        connection = Connection(self.host, self.port)
+        kinds = list(self.mix)
+        weights = [self.mix[kind] for kind in kinds]
+        scenarios = {'single': self.single_session, 'ultimate': self.ultimate_session}
+        try:
+            while self._running():
+                kind = rng.choices(kinds, weights)[0]
+                try:
+                    await scenarios[kind](connection, rng)
+                    self.sessions[kind] += 1
+                except RequestFailed:
+                    self.sessions[f"{kind}_failed"] += 1
+        finally:
+            await connection.close()
+
+    async def run(self):
+        if self.rate and self.think and self.concurrency / self.think < self.rate:
+            print(f"Warning: {self.concurrency} users thinking {self.think}s between requests can send at most "
+                  f"{self.concurrency / self.think:.1f} requests/sec, below the rate of {self.rate}/sec")
+        now = time.perf_counter()
+        self.measure_from = now + self.warmup
+        self.stop_at = self.measure_from + self.duration
+        await asyncio.gather(*(self.user(index) for index in range(self.concurrency)))
+        return self.report(time.perf_counter() - self.measure_from)
+
+    def report(self, seconds):
+        total = EndpointStats()
+        for stats in self.stats.values():
+            total.merge(stats)
+        return {
+            'version': REPORT_VERSION,
+            'started': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            'build': build_id(),
+            'python': platform.python_version(),
+            'target': self.url,
+            'config': {'concurrency': self.concurrency, 'rate': self.rate, 'duration': self.duration,
+                       'warmup': self.warmup, 'mix': self.mix, 'think': self.think, 'seed': self.seed,
+                       'recorded_openings': {kind: len(openings) for kind, openings in
+                                             (('single', self.openings[SINGLE]), ('ultimate', self.openings[ULTIMATE]))}},
+            'seconds': round(seconds, 3),
+            'sessions': dict(self.sessions),
+            'endpoints': {name: stats.summary(seconds) for name, stats in sorted(self.stats.items())},
+            'total': total.summary(seconds),
+        }
+
+
+def build_id():
+    """Short git commit of the working tree, with '-dirty' if it has changes, or None outside git"""
+    try:
+        repo = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5, check=True, cwd=repo).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, timeout=5, cwd=repo).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_load(url, **options):
+    """Run a load test (see LoadTest for the options) and return its report"""
+    return asyncio.run(LoadTest(url, **options).run())
+
+
+def save_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path):
+    with open(path) as f:
+        report = json.load(f)
+    if report.get('version') != REPORT_VERSION:
+        raise ValueError(f"{path} is a version {report.get('version')} report, expected {REPORT_VERSION}")
+    return report
+
+
+def print_report(report):
+    config = report['config']
+    print("=" * 40)
+    rate = f"{config['rate']}/sec" if config['rate'] else "unlimited"
+    print(f"{report['target']} build {report['build']}: {config['concurrency']} users, rate {rate}, "
+          f"{report['seconds']:.1f}s measured")
+    print(f"{'endpoint':<20} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'errors':>8}")
+    rows = list(report['endpoints'].items()) + [('total', report['total'])]
+    for name, stats in rows:
+        if not stats['requests']:
+            continue
+        print(f"{name:<20} {stats['requests']:>9} {stats['throughput']:>9.1f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p90_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['max_ms']:>8.2f} {stats['error_rate']:>8.2%}")
+    print(f"Sessions: {report['sessions']}")
+    total = report['total']
+    late = total.get('late', 0)
+    if config['rate'] and total['requests']:
+        print(f"Late starts: {late} ({late / total['requests']:.1%}) requests started after their slot")
+        if late > LATE_WARNING * total['requests']:
+            print(f"Warning: every user was often busy, the generator could not keep up with "
+                  f"{config['rate']}/sec. Latencies include that wait: add users (--concurrency) or "
+                  f"lower the rate")
+    print("=" * 40)
+
+
+def compare_reports(baseline, current, tolerance=0.1):
+    """
+    Print how every endpoint changed between two reports. Latency or throughput more than
+    `tolerance` worse, or an error rate up by more than a percentage point, counts as a regression.
+    Returns the list of regressions as (endpoint, metric, before, after).
+    """
+    regressions = []
+    print("=" * 40)
+    print(f"build {baseline['build']} -> {current['build']}")
+    if baseline['config'] != current['config']:
+        print("Warning: the two runs used different configs")
+    print(f"{'endpoint':<20} {'metric':<11} {'before':>10} {'after':>10} {'change':>8}")
+
+    names = sorted(set(baseline['endpoints']) & set(current['endpoints'])) + ['total']
+    for name in names:
+        before = baseline['total'] if name == 'total' else baseline['endpoints'][name]
+        after = current['total'] if name == 'total' else current['endpoints'][name]
+        if not before['requests'] or not after['requests']:
+            continue
+        for metric, higher_is_worse in (('p50_ms', True), ('p99_ms', True), ('throughput', False),
+                                        ('error_rate', True)):
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            if metric == 'error_rate':
+                regressed = new - old > 0.01
+            else:
+                regressed = change > tolerance if higher_is_worse else change < -tolerance
+            if regressed:
+                regressions.append((name, metric, old, new))
+            print(f"{name:<20} {metric:<11} {old:>10.3f} {new:>10.3f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    print("=" * 40)
+    return regressions
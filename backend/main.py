@@ -1,6 +1,10 @@
 import numpy as np
 from backend.helpers import position_to_coordinates
-from backend.rl.single_tic import SingleTic
+from backend.rl.single_tic import SingleTic, encode_state_key
+from backend.gamelog import ULTIMATE
+from backend.ultimate.tables import SUB_RESULT, MACRO_RESULT, POW4
+# Results as returned by SingleTic.game_result, indexed by the lookup tables' EMPTY/X/O/DRAW
+RESULT_SYMBOLS = (None, 'X', 'O', 'D')
 # A 3x3 grid is placed within a larger 3x3 grid. In total, 81 squares are present.
 
 class MultiTic:
@@ -24,82 +28,112 @@ class MultiTic:
         grid_to_replace = self.big_grid[row][col]
         
         if isinstance(grid_to_replace, SingleTic):
-            result = grid_to_replace.game_result()
+            result = RESULT_SYMBOLS[SUB_RESULT[encode_state_key(grid_to_replace.grid)]]
             if result:  # Only replace if there's a result (winner or draw)
                 self.big_grid[row][col] = result
                 return result
         return None
     
     def big_grid_result(self):
-        # Create a copy of the big grid with removed SingleTic instances to check for winner --> review if this is correct
-        check_grid = [
-            [None if isinstance(cell, SingleTic) else cell for cell in row]
-            for row in self.big_grid
-        ]
-
-        # print(check_grid)
-
-        check_grid = SingleTic(check_grid)
-        return check_grid.game_result()
+        # Grids still in play count as empty, finished ones by their result ('X', 'O' or 'D'). Like
+        # SingleTic.game_result on that grid, three 'D' grids in a line also end the game as a draw.
+        code = 0
+        for i, cell in enumerate(self._flatten_big_grid()):
+            if not isinstance(cell, SingleTic):
+                code += RESULT_SYMBOLS.index(cell) * POW4[i]
+        return RESULT_SYMBOLS[MACRO_RESULT[code]]
     
     def make_move(self, grid_index, position, current_player):
+        # Raises ValueError for an illegal move: bad player, grid or position, a finished grid or a taken cell
+        if current_player not in ('X', 'O'):
+            raise ValueError(f"Unknown player {current_player}")
         big_grid_row, big_grid_col = position_to_coordinates(grid_index)
         single_grid_act = self.big_grid[big_grid_row][big_grid_col]
-        if isinstance(single_grid_act, SingleTic):
-            single_grid_act.make_move(position, current_player)
-            # Returns next player and the next grid_index to play in
-            next_player = 'O' if current_player == 'X' else 'X'
-            next_grid_index = position
-            return next_player, next_grid_index
-        else:
-            print("Can't make a move on a finished grid")
-            return None
+        if not isinstance(single_grid_act, SingleTic) or single_grid_act.game_result() is not None:
+            raise ValueError(f"Can't make a move on a finished grid ({grid_index})")
+
+        single_grid_act.make_move(position, current_player)
+        # Returns next player and the next grid_index to play in
+        next_player = 'O' if current_player == 'X' else 'X'
+        next_grid_index = position
+        return next_player, next_grid_index
         
 
 def pick_position(current_player):
     pos = int(input(f"Pick a position, player {current_player}: "))
     return pos
 
-def pick_grid_index(current_player):
-    pos = int(input(f"Pick a new grid index, player {current_player}: "))
-    return pos
+def pick_grid_index(game, current_player):
+    # Keep asking until the player picks an unfinished grid
+    while True:
+        try:
+            grid_index = int(input(f"Pick a new grid index, player {current_player}: "))
+        except ValueError:
+            print("The grid index must be a number between 0 and 8")
+            continue
+        if not 0 <= grid_index <= 8:
+            print("The grid index must be a number between 0 and 8")
+            continue
+        row, col = position_to_coordinates(grid_index)
+        grid = game.big_grid[row][col]
+        if isinstance(grid, SingleTic) and grid.game_result() is None:
+            return grid_index
+        print(f"Grid {grid_index} is finished, pick another one")
 
 
-def game_loop():
+def make_picked_move(game, grid_index, current_player):
+    # Keep asking until the player picks a legal position
+    while True:
+        try:
+            position = pick_position(current_player)
+        except ValueError:
+            print("The position must be a number between 0 and 8")
+            continue
+        if not 0 <= position <= 8:
+            print("The position must be a number between 0 and 8")
+            continue
+        print(f"Player {current_player} making move in grid {grid_index} at position {position}")
+        try:
+            return game.make_move(grid_index, position, current_player)
+        except ValueError as e:
+            print(e)
+
+
+def game_loop(log=None):
+    # The finished game is appended to `log` (a gamelog.GameLog) if one is given
     game = MultiTic()
+    moves = []
     
-    # First player who is X can move anywhere, any grid_index and positon within that grid index
-    current_player = 'X'
-    first_grid_index = 4 # middle of the big grid, so first player plays in the middle tic tac toe grid
-    first_position = pick_position(current_player)
-    print(f"Player {current_player} making move in grid {first_grid_index} at position {first_position}")
-    
-    next_player, next_grid_index = game.make_move(first_grid_index, first_position, current_player)
+    # First player who is X plays in the middle tic tac toe grid
+    next_player = 'X'
+    grid_index = 4
     
     while True:
         # The game loop
-        # See if the grid that the player played in can be replaced by a result from the singular tic tac toe grid
-        game.replace_single_grid(next_grid_index)
-
-        # Second player who is 0 moves in the grid_index corresponding to the previous player's position
         # Next player moves in the grid_index corresponding to the previous player's position
-        picked_position = pick_position(next_player)
-        print(f"Player {next_player} making move in grid {next_grid_index} at position {picked_position}")
-        next_player, next_grid_index = game.make_move(next_grid_index, picked_position, next_player)
+        current_player = next_player
+        next_player, next_grid_index = make_picked_move(game, grid_index, current_player)
+        moves.append(grid_index * 9 + next_grid_index)
 
-        # Check to see if that grid can be evaluted for a winner
-        if game.big_grid_result():
-            print(f"Game over, {next_player} wins!")
-            break
+        # See if the grid that was just played in can be replaced by a result from the singular tic tac toe grid
+        game.replace_single_grid(grid_index)
 
-        if game.big_grid_result() == 'D':
-            print("Game over, draw!")
+        # Check to see if the big grid can be evaluated for a winner
+        result = game.big_grid_result()
+        if result:
+            if log is not None:
+                log.write(ULTIMATE, moves, result)
+            if result == 'D':
+                print("Game over, draw!")
+            else:
+                print(f"Game over, {result} wins!")
             break
 
         # If the next game index is already filled, then the player has to pick a new grid index
-        row, col = position_to_coordinates(next_grid_index)
+        grid_index = next_grid_index
+        row, col = position_to_coordinates(grid_index)
         if not isinstance(game.big_grid[row][col], SingleTic):
-           next_grid_index = pick_grid_index(next_player)
+            grid_index = pick_grid_index(game, next_player)
             
 
 
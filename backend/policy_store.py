@@ -0,0 +1,244 @@
+# Versioned policy files for serving, and hot reload of the newest one without a restart.
+#
+# publish_policy() compiles a policy (see rl/compact_policy.py) and writes it to a directory as
+# <name>-v<version>.ttcp, the next version after the ones already there. The file is written under a
+# temporary name and renamed into place, so a watcher never sees half of it.
+#
+# PolicyReloader serves the newest version of a name and watches the directory for new ones:
+#   - a new version is memory-mapped and its pages touched in the watcher thread, so the first
+#     requests on it neither read from disk nor wait for the load
+#   - the swap is a reference assignment under a lock, between requests
+#   - every request holds a lease on the version it started with; a replaced version is unmapped
+#     when its last lease ends, so no request ever sees a policy change (or vanish) under it
+# The files are mapped, not unpickled, so a version costs its page cache pages (a few KB for
+# tic-tac-toe) and two versions overlap only while old requests drain.
+#
+#   publish_policy(policy, "deploy", name="td")
+#   reloader = PolicyReloader("deploy", name="td").start()
+#   with reloader.acquire() as policy:
+#       policy.get(state_key)
+
+import mmap
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from backend.rl.compact_policy import CompactPolicy, compile_policy
+
+
+EXTENSION = ".ttcp"
+
+
+def _versions(directory, name):
+    # {version: path} of the published versions of a name
+    pattern = re.compile(rf"{re.escape(name)}-v(\d+){re.escape(EXTENSION)}$")
+    versions = {}
+    if os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            match = pattern.match(entry.name)
+            if match:
+                versions[int(match.group(1))] = entry.path
+    return versions
+
+
+def latest_version(directory, name):
+    """(version, path) of the newest published version of a name, or (None, None)"""
+    versions = _versions(directory, name)
+    if not versions:
+        return None, None
+    version = max(versions)
+    return version, versions[version]
+
+
+def publish_policy(policy, directory, name="policy", keep=None):
+    """
+    Compile a policy dict (or take a CompactPolicy as is) and publish it as the next version of
+    `name` in `directory`. keep=N deletes all but the newest N versions afterwards (mapped copies
+    stay valid until they are closed). Returns (version, path).
+    """
+    if keep is not None and keep < 1:
+        raise ValueError(f"keep must be at least 1 (the version being published), got {keep}")
+    compact = policy if isinstance(policy, CompactPolicy) else compile_policy(policy)
+    os.makedirs(directory, exist_ok=True)
+    version = (latest_version(directory, name)[0] or 0) + 1
+    path = os.path.join(directory, f"{name}-v{version:06d}{EXTENSION}")
+
+    tmp_path = os.path.join(directory, f".{name}-v{version:06d}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(compact.to_bytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    if keep is not None:
+        for old_version, old_path in _versions(directory, name).items():
+            if old_version <= version - keep:
+                os.remove(old_path)
+    return version, path
+
+
+class MappedPolicy:
+    """One memory-mapped version, with the number of requests currently using it"""
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.policy = CompactPolicy.from_buffer(self.map)
+        except ValueError:
+            self.map.close()
+            raise
+        self.in_flight = 0
+        self.retired = False
+
+    def warm(self):
+        # Fault every page in now, instead of in the first requests after the swap
+        if hasattr(self.map, "madvise"):
+            self.map.madvise(mmap.MADV_WILLNEED)
+        for offset in range(0, len(self.map), mmap.PAGESIZE):
+            self.map[offset]
+
+    def close(self):
+        self.policy.release()
+        self.map.close()
+
+
+class PolicyReloader:
+    def __init__(self, directory, name="policy", interval=1.0):
+        self.directory = directory
+        self.name = name
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.current = None
+        self.swaps = 0
+        self.unmapped = 0
+        self.failed = {}  # version -> error, so a broken file is not retried every poll
+        self._stop = threading.Event()
+        self._thread = None
+
+        if not self.reload():
+            raise FileNotFoundError(f"No published '{name}' policy in {directory}")
+
+    @property
+    def version(self):
+        return self.current.version
+
+    def reload(self):
+        """Swap in the newest version if it is newer than the one being served. Returns True on a swap."""
+        version, path = latest_version(self.directory, self.name)
+        if version is None or version in self.failed or (self.current and version <= self.current.version):
+            return False
+        try:
+            mapped = MappedPolicy(path, version)
+        except (OSError, ValueError) as e:
+            self.failed[version] = str(e)
+            return False
+        mapped.warm()
+
+        with self.lock:
+            old, self.current = self.current, mapped
+            self.swaps += 1
+            if old is not None:
+                old.retired = True
+                close_old = old.in_flight == 0
+        if old is not None and close_old:
+            self._unmap(old)
+        return True
+
+    def _unmap(self, mapped):
+        mapped.close()
+        with self.lock:
+            self.unmapped += 1
+
+    @contextmanager
+    def acquire(self):
+        """Lease the current policy for the duration of one request"""
+        with self.lock:
+            mapped = self.current
+            mapped.in_flight += 1
+        try:
+            yield mapped.policy
+        finally:
+            with self.lock:
+                mapped.in_flight -= 1
+                close = mapped.retired and mapped.in_flight == 0
+            if close:
+                self._unmap(mapped)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.reload():
+                    print(f"Serving {self.name} v{self.current.version} ({self.current.path})")
+            except OSError as e:
+                print(f"Policy reload failed: {e}")
+
+    def start(self):
+        """Poll the directory every `interval` seconds in a background thread"""
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        with self.lock:
+            return {'name': self.name, 'version': self.current.version, 'in_flight': self.current.in_flight,
+                    'swaps': self.swaps, 'unmapped': self.unmapped, 'failed': sorted(self.failed)}
+
+
+def main():
+    import random
+    import tempfile
+    from backend.rl.single_tic import decode_state_key, state_result
+
+    # Requests in a loop on two threads while ten new versions are published: request latency
+    # percentiles across the swaps, and every replaced mapping should be closed at the end
+    states = [decode_state_key(code) for code in range(3 ** 9)]
+    states = [state for state in states if state_result(state) is None][:3000]
+    rng = random.Random(0)
+    versions = [compile_policy({state: rng.choice([i for i in range(9) if state[i // 3][i % 3] is None])
+                                for state in states}) for _ in range(11)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        publish_policy(versions[0], directory)
+        reloader = PolicyReloader(directory, interval=0.05).start()
+        stop = threading.Event()
+        latencies = [[], []]
+
+        def client(times):
+            client_rng = random.Random(len(times))
+            while not stop.is_set():
+                start = time.perf_counter()
+                with reloader.acquire() as policy:
+                    policy.get(states[client_rng.randrange(len(states))])
+                times.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=client, args=(times,)) for times in latencies]
+        for thread in threads:
+            thread.start()
+        for compact in versions[1:]:
+            time.sleep(0.2)
+            publish_policy(compact, directory, keep=2)
+        time.sleep(0.2)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        reloader.stop()
+
+        times = sorted(latencies[0] + latencies[1])
+        p50, p99, p999 = (times[int(q * (len(times) - 1))] * 1e6 for q in (0.5, 0.99, 0.999))
+        print(f"{len(times)} requests: p50 {p50:.1f}us p99 {p99:.1f}us p99.9 {p999:.1f}us "
+              f"max {times[-1] * 1e6:.0f}us")
+        print(reloader.stats())
+
+
+if __name__ == "__main__":
+    main()
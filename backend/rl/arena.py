@@ -0,0 +1,312 @@
+# Headless round-robin tournaments between tic-tac-toe policies, with Elo ratings.
+#
+# Unlike SingleTic.simulate_ai_game, nothing is printed and every random choice comes from a
+# seeded generator, so a tournament is reproducible. An agent is either a policy dict
+# (state_key -> action) as returned by the trainers in backend/rl, or any picklable callable
+# taking a state_key and returning an action (e.g. a search agent).
+
+import itertools
+import math
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from backend.gamelog import SINGLE, GameLog, shard_path
+from backend.rl.single_tic import state_result
+
+
+# An empty policy never knows a move, so every move is a seeded random fallback
+RANDOM_AGENT = {}
+
+# Agents are handed to each worker process once, instead of with every batch of games
+_AGENTS = {}
+
+
+def _init_worker(agents):
+    global _AGENTS
+    _AGENTS = agents
+
+
+def _to_state_key(cells):
+    return (tuple(cells[0:3]), tuple(cells[3:6]), tuple(cells[6:9]))
+
+
+def choose_move(agent, state_key, valid_actions, rng):
+    """
+    Ask an agent for its move. Returns (move, fallback) where fallback is True when the agent
+    had no (legal) move for this state and a seeded random move was played instead.
+    """
+    if callable(agent):
+        move = agent(state_key)
+    else:
+        move = agent.get(state_key)
+
+    if move not in valid_actions:
+        return rng.choice(valid_actions), True
+    return move, False
+
+
+def play_game(agent_X, agent_O, seed, opening_plies=2, moves=None):
+    """
+    Play one silent game. The first `opening_plies` moves are random (seeded), so that
+    deterministic policies do not replay the same game over and over.
+    Returns (result, fallbacks_X, fallbacks_O) where result is 'X', 'O' or 'D'.
+    If `moves` is a list, the moves played are appended to it.
+    """
+    rng = random.Random(seed)
+    cells = [None] * 9
+    fallbacks = {'X': 0, 'O': 0}
+    current_player = 'X'
+    ply = 0
+
+    while True:
+        state_key = _to_state_key(cells)
+        result = state_result(state_key)
+        if result is not None:
+            return result, fallbacks['X'], fallbacks['O']
+
+        valid_actions = [i for i in range(9) if cells[i] is None]
+        if ply < opening_plies:
+            move = rng.choice(valid_actions)
+        else:
+            agent = agent_X if current_player == 'X' else agent_O
+            move, fallback = choose_move(agent, state_key, valid_actions, rng)
+            fallbacks[current_player] += fallback
+
+        cells[move] = current_player
+        current_player = 'O' if current_player == 'X' else 'X'
+        ply += 1
+        if moves is not None:
+            moves.append(move)
+
+
+def _play_batch(task):
+    # Runs inside a worker: plays every seed of one (X, O) pairing
+    name_X, name_O, seeds, opening_plies = task
+    agent_X, agent_O = _AGENTS[name_X], _AGENTS[name_O]
+    counts = {'X': 0, 'O': 0, 'D': 0, 'fallbacks_X': 0, 'fallbacks_O': 0}
+    for seed in seeds:
+        result, fallbacks_X, fallbacks_O = play_game(agent_X, agent_O, seed, opening_plies)
+        counts[result] += 1
+        counts['fallbacks_X'] += fallbacks_X
+        counts['fallbacks_O'] += fallbacks_O
+    return name_X, name_O, counts
+
+
+def run_tournament(agents, games_per_pair=200, opening_plies=2, seed=0, processes=None, batch_size=100):
+    """
+    Round-robin between all agents (a dict name -> agent). Every pair plays games_per_pair games,
+    half with each side as X. Both colour assignments replay the same seeded openings.
+    Returns a dict with the W/D/L table, fallback counts, Elo ratings and timing.
+    """
+    names = list(agents)
+    if len(names) < 2:
+        raise ValueError("A tournament needs at least two agents")
+
+    games_per_side = (games_per_pair + 1) // 2
+    master_rng = random.Random(seed)
+
+    tasks = []
+    for a, b in itertools.combinations(names, 2):
+        seeds = [master_rng.getrandbits(32) for _ in range(games_per_side)]
+        for start in range(0, games_per_side, batch_size):
+            batch = seeds[start:start + batch_size]
+            tasks.append((a, b, batch, opening_plies))
+            tasks.append((b, a, batch, opening_plies))
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    start_time = time.perf_counter()
+    if processes > 1:
+        with Pool(processes, initializer=_init_worker, initargs=(agents,)) as pool:
+            batches = pool.map(_play_batch, tasks)
+    else:
+        _init_worker(agents)
+        batches = [_play_batch(task) for task in tasks]
+    elapsed = time.perf_counter() - start_time
+
+    # table[a][b] = [wins, draws, losses] of a against b
+    table = {a: {b: [0, 0, 0] for b in names if b != a} for a in names}
+    fallbacks = {name: 0 for name in names}
+    total_games = 0
+    for name_X, name_O, counts in batches:
+        table[name_X][name_O][0] += counts['X']
+        table[name_X][name_O][1] += counts['D']
+        table[name_X][name_O][2] += counts['O']
+        table[name_O][name_X][0] += counts['O']
+        table[name_O][name_X][1] += counts['D']
+        table[name_O][name_X][2] += counts['X']
+        fallbacks[name_X] += counts['fallbacks_X']
+        fallbacks[name_O] += counts['fallbacks_O']
+        total_games += counts['X'] + counts['O'] + counts['D']
+
+    ratings = compute_elo(table)
+    low, high = elo_confidence(table, seed=seed)
+
+    return {
+        'names': names,
+        'table': table,
+        'fallbacks': fallbacks,
+        'elo': ratings,
+        'elo_low': low,
+        'elo_high': high,
+        'games': total_games,
+        'seconds': elapsed,
+        'games_per_sec': total_games / elapsed if elapsed > 0 else float('inf'),
+    }
+
+
+def _record_shard(task):
+    # Runs inside a worker: plays a list of (X, O, seed) games into one shard of the log
+    path, games, opening_plies = task
+    with GameLog(path) as log:
+        for name_X, name_O, seed in games:
+            moves = []
+            result, _, _ = play_game(_AGENTS[name_X], _AGENTS[name_O], seed, opening_plies, moves)
+            log.write(SINGLE, moves, result)
+    return len(games)
+
+
+def record_games(agents, directory, games_per_pair=1000, shards=4, opening_plies=2, seed=0, processes=None):
+    """
+    Play the same round-robin as run_tournament, but append every game to a sharded game log
+    (gamelog.py) in `directory` instead of scoring it, one worker per shard. Returns the number of games.
+    """
+    names = list(agents)
+    if len(names) < 2:
+        raise ValueError("Recording games needs at least two agents")
+
+    master_rng = random.Random(seed)
+    games = []
+    for a, b in itertools.combinations(names, 2):
+        for _ in range((games_per_pair + 1) // 2):
+            game_seed = master_rng.getrandbits(32)
+            games.append((a, b, game_seed))
+            games.append((b, a, game_seed))
+
+    tasks = [(shard_path(directory, index), games[index::shards], opening_plies) for index in range(shards)]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, shards)
+
+    if processes > 1:
+        with Pool(processes, initializer=_init_worker, initargs=(agents,)) as pool:
+            return sum(pool.map(_record_shard, tasks))
+    _init_worker(agents)
+    return sum(_record_shard(task) for task in tasks)
+
+
+def compute_elo(table, base=1500.0, iterations=100, prior_games=1.0):
+    """
+    Maximum-likelihood Elo ratings from a W/D/L table (draws count as half a win).
+    Every agent also gets `prior_games` virtual draws against an average opponent, which keeps
+    the ratings finite when an agent wins or loses every game.
+    """
+    names = list(table)
+    ratings = {name: 0.0 for name in names}
+    scale = math.log(10) / 400
+
+    for _ in range(iterations):
+        for a in names:
+            expected_prior = 1 / (1 + 10 ** (-ratings[a] / 400))
+            score = 0.5 * prior_games
+            expected = prior_games * expected_prior
+            variance = prior_games * expected_prior * (1 - expected_prior)
+
+            for b, (wins, draws, losses) in table[a].items():
+                games = wins + draws + losses
+                if games == 0:
+                    continue
+                e = 1 / (1 + 10 ** ((ratings[b] - ratings[a]) / 400))
+                score += wins + 0.5 * draws
+                expected += games * e
+                variance += games * e * (1 - e)
+
+            # One Newton step on the log-likelihood, limited so early steps cannot overshoot
+            step = (score - expected) / (scale * variance)
+            ratings[a] += max(-200.0, min(200.0, step))
+
+        mean = sum(ratings.values()) / len(ratings)
+        for name in names:
+            ratings[name] -= mean
+
+    return {name: base + rating for name, rating in ratings.items()}
+
+
+def elo_confidence(table, confidence=0.95, samples=200, seed=0, base=1500.0):
+    """
+    Bootstrap confidence interval for each Elo rating: each pairing's games are resampled
+    from its observed W/D/L frequencies and the ratings are refit.
+    """
+    rng = random.Random(seed)
+    names = list(table)
+    pairs = [(a, b) for a, b in itertools.combinations(names, 2)]
+    draws_per_name = {name: [] for name in names}
+
+    for _ in range(samples):
+        resampled = {a: {b: [0, 0, 0] for b in names if b != a} for a in names}
+        for a, b in pairs:
+            wins, draws, losses = table[a][b]
+            games = wins + draws + losses
+            if games == 0:
+                continue
+            outcomes = rng.choices((0, 1, 2), weights=(wins, draws, losses), k=games)
+            for outcome in outcomes:
+                resampled[a][b][outcome] += 1
+                resampled[b][a][2 - outcome] += 1
+
+        for name, rating in compute_elo(resampled, base=base, iterations=30).items():
+            draws_per_name[name].append(rating)
+
+    tail = (1 - confidence) / 2
+    low, high = {}, {}
+    for name, values in draws_per_name.items():
+        values.sort()
+        low[name] = values[int(tail * (len(values) - 1))]
+        high[name] = values[int((1 - tail) * (len(values) - 1))]
+    return low, high
+
+
+def print_report(results):
+    names = results['names']
+    width = max(len(name) for name in names) + 2
+
+    print("=" * 40)
+    print("TOURNAMENT RESULTS (W/D/L, row vs column)")
+    print("=" * 40)
+    print(" " * width + "".join(f"{name:>{width + 6}}" for name in names))
+    for a in names:
+        row = f"{a:<{width}}"
+        for b in names:
+            cell = "-" if a == b else "/".join(str(n) for n in results['table'][a][b])
+            row += f"{cell:>{width + 6}}"
+        print(row)
+
+    print()
+    print("Elo (95% CI):")
+    for name in sorted(names, key=lambda n: -results['elo'][n]):
+        print(f"  {name:<{width}} {results['elo'][name]:7.1f}  "
+              f"[{results['elo_low'][name]:.1f}, {results['elo_high'][name]:.1f}]  "
+              f"random fallbacks: {results['fallbacks'][name]}")
+
+    print()
+    print(f"{results['games']} games in {results['seconds']:.2f}s ({results['games_per_sec']:.0f} games/sec)")
+
+
+def main():
+    from backend.rl.model_free.monte_carlo import MonteCarlo
+    from backend.rl.model_free.temporal_diff import TemporalDifference
+
+    agents = {
+        'mc': MonteCarlo().train(num_episodes=20000, verbose=False),
+        'td': TemporalDifference().train_full(iterations=20000, verbose=False),
+        'random': RANDOM_AGENT,
+    }
+    results = run_tournament(agents, games_per_pair=1000)
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
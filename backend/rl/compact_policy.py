@@ -0,0 +1,188 @@
+# Compile a policy dict (state_key -> move) into a few kilobytes of flat bytes.
+#
+# A policy dict keyed by nested tuples costs hundreds of bytes per state. Here each state is
+# encoded as an integer (encode_state_key), and a minimal perfect hash maps the N encoded states of
+# the policy onto slots 0..N-1 without collisions. Per slot we keep:
+#   - the move, 4 bits (two moves per byte)
+#   - an 8-bit fingerprint of the state, so a state the policy never saw is (almost always)
+#     reported as missing instead of returning some other state's move
+# The hash is CHD-style hash-and-displace: a first hash puts every state in one of N/4 buckets, and
+# each bucket stores the seed (2 bytes) of a second hash that sends all its states to free slots.
+# That is about 2.5 bytes per state in total, against roughly 300 for the dict.
+#
+# For 3x3 tic-tac-toe a direct table over all 3**9 codes would be about as small. The perfect hash
+# keeps the size proportional to the policy instead of to the key space, which is what lets larger
+# boards fit.
+#
+#   compact = compile_policy(policy)
+#   compact[state_key]          # like policy[state_key], KeyError if missing
+#   compact.get(state_key)      # like policy.get(state_key)
+#   data = compact.to_bytes()   # CompactPolicy.from_buffer(data) maps it back without copying
+
+import struct
+
+from backend.rl.single_tic import encode_state_key
+
+
+MAGIC = b"TTCP"
+_HEADER = struct.Struct("<4sIII")  # magic, number of states, number of buckets, reserved
+BUCKET_SIZE = 4
+MAX_SEED = 0xFFFF
+MASK32 = 0xFFFFFFFF
+
+
+_DIGITS = {None: 0, 'X': 1, 'O': 2}
+
+
+def _encode(state_key):
+    # encode_state_key unrolled, about three times faster
+    (a, b, c), (d, e, f), (g, h, i) = state_key
+    digits = _DIGITS
+    return (digits[a] + 3 * digits[b] + 9 * digits[c] + 27 * digits[d] + 81 * digits[e] + 243 * digits[f] +
+            729 * digits[g] + 2187 * digits[h] + 6561 * digits[i])
+
+
+def _hash(code):
+    # First-level hash: picks the bucket, and its top byte is the fingerprint
+    return code * 0x9E3779B1 & MASK32
+
+
+def _slot(hash_, seed, count):
+    # Second-level hash, a different one for every bucket seed
+    return ((hash_ ^ seed * 0x85EBCA6B) * 0xC2B2AE35 & MASK32) % count
+
+
+class CompactPolicy:
+    def __init__(self, count, buckets, seeds, fingerprints, moves, buffer=None):
+        self.count = count
+        self.buckets = buckets
+        self.seeds = seeds                # memoryview of uint16, one per bucket
+        self.fingerprints = fingerprints  # bytes-like, one per slot
+        self.moves = moves                # bytes-like, two 4-bit moves per byte
+        self._buffer = buffer
+
+    def get_code(self, code, default=None):
+        """Move for an already encoded state, or default"""
+        count = self.count
+        if not count:
+            return default
+        hash_ = code * 0x9E3779B1 & MASK32  # _hash and _slot inlined
+        slot = ((hash_ ^ self.seeds[hash_ % self.buckets] * 0x85EBCA6B) * 0xC2B2AE35 & MASK32) % count
+        if self.fingerprints[slot] != hash_ >> 24:
+            return default
+        return self.moves[slot >> 1] >> ((slot & 1) << 2) & 0xF
+
+    def get(self, state_key, default=None):
+        return self.get_code(_encode(state_key), default)
+
+    def __getitem__(self, state_key):
+        move = self.get_code(_encode(state_key))
+        if move is None:
+            raise KeyError(state_key)
+        return move
+
+    def __contains__(self, state_key):
+        return self.get_code(_encode(state_key)) is not None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return _HEADER.size + 2 * self.buckets + self.count + (self.count + 1) // 2
+
+    def to_bytes(self):
+        return (_HEADER.pack(MAGIC, self.count, self.buckets, 0) + bytes(self.seeds.cast('B')) +
+                bytes(self.fingerprints) + bytes(self.moves))
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Wrap bytes from to_bytes(), or any buffer holding them (a memory map, say), without copying"""
+        view = memoryview(buffer)
+        magic, count, buckets, _ = _HEADER.unpack(view[:_HEADER.size])
+        if magic != MAGIC:
+            raise ValueError("Not a compact policy")
+        start = _HEADER.size
+        seeds = view[start:start + 2 * buckets].cast('H')
+        start += 2 * buckets
+        fingerprints = view[start:start + count]
+        start += count
+        moves = view[start:start + (count + 1) // 2]
+        return cls(count, buckets, seeds, fingerprints, moves, buffer)
+
+    def release(self):
+        """Let go of the views into the buffer, so a memory map under them can be closed"""
+        for view in (self.seeds, self.fingerprints, self.moves):
+            if isinstance(view, memoryview):
+                view.release()
+        self._buffer = None
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_buffer(f.read())
+
+
+def compile_policy(policy):
+    """
+    Build a CompactPolicy from a dict of state_key -> move (0-8). States mapped to None (terminal
+    states in PolicyIteration's policies) are left out, like any state the policy lacks.
+    """
+    codes, moves = [], []
+    for state_key, move in policy.items():
+        if move is None:
+            continue
+        if not isinstance(move, int) or isinstance(move, bool):
+            raise ValueError(f"Move {move!r} for {state_key} is not an integer")
+        if not 0 <= move <= 8:
+            raise ValueError(f"Move {move} does not fit in 4 bits")
+        codes.append(encode_state_key(state_key))
+        moves.append(move)
+
+    # Smaller buckets cost more seed bytes but are easier to place
+    for bucket_size in range(BUCKET_SIZE, 0, -1):
+        compact = _build(codes, moves, bucket_size)
+        if compact is not None:
+            return compact
+    raise ValueError("Could not build a perfect hash for this policy")
+
+
+def _build(codes, moves, bucket_size):
+    count = len(codes)
+    buckets = max(1, (count + bucket_size - 1) // bucket_size)
+
+    members = [[] for _ in range(buckets)]
+    for i, code in enumerate(codes):
+        members[_hash(code) % buckets].append(i)
+
+    # Place the biggest buckets first, while most slots are still free
+    seeds = [0] * buckets
+    slot_of = [None] * count
+    taken = [False] * count
+    for bucket in sorted(range(buckets), key=lambda b: -len(members[b])):
+        if not members[bucket]:
+            continue
+        for seed in range(MAX_SEED + 1):
+            slots = [_slot(_hash(codes[i]), seed, count) for i in members[bucket]]
+            if len(set(slots)) == len(slots) and not any(taken[slot] for slot in slots):
+                break
+        else:
+            return None
+        seeds[bucket] = seed
+        for i, slot in zip(members[bucket], slots):
+            slot_of[i] = slot
+            taken[slot] = True
+
+    fingerprints = bytearray(count)
+    packed = bytearray((count + 1) // 2)
+    for i, slot in enumerate(slot_of):
+        fingerprints[slot] = _hash(codes[i]) >> 24
+        packed[slot >> 1] |= moves[i] << ((slot & 1) << 2)
+
+    seed_bytes = struct.pack(f"<{buckets}H", *seeds)
+    return CompactPolicy(count, buckets, memoryview(seed_bytes).cast('H'), bytes(fingerprints), bytes(packed))
@@ -0,0 +1,239 @@
+# Out-of-core dynamic programming for m,n,k games (k in a row on an m x n board).
+#
+# SingleTic and get_all_states() keep every state as a nested tuple in a Python set. That is fine for
+# the 5,478 states of 3x3, but 4x4 has about 10^7 reachable states. Here a state is an integer:
+# cell i holds digit d_i (0 empty, 1 X, 2 O) and the code is sum(d_i * 3**i).
+#
+# The solver works level by level, where a level is the number of pieces on the board, and streams
+# every level through numpy in fixed-size chunks:
+#   1. Forward pass: expand level L in chunks, marking the children in a memory-mapped byte array
+#      indexed by code. The codes of level L+1 are then written to disk in chunks.
+#   2. Backward pass: from the full board down to the empty board, compute every state's game value
+#      from its children's values (one level further), kept in a memory-mapped int8 array.
+# Only one chunk of codes (and its children) is ever held in memory. The two dense arrays are
+# memory-mapped, so the OS pages them in and out as needed.
+#
+# Values are exact game-theoretic results from X's perspective: 1 X wins, 0 draw, -1 O wins.
+#
+#   solver = OutOfCoreSolver(MNKRules(4, 4, 4), "mnk-4x4x4")
+#   solver.solve()
+#   solver.value(0)  # value of the empty board
+
+import os
+import time
+
+import numpy as np
+
+
+# 3**20 bytes is already 3.5GB per dense array
+MAX_CELLS = 20
+
+
+class MNKRules:
+    def __init__(self, m=3, n=3, k=3):
+        if m * n > MAX_CELLS:
+            raise ValueError(f"Boards with more than {MAX_CELLS} cells are not supported")
+        if k > max(m, n):
+            raise ValueError("k cannot be larger than the board")
+
+        self.m, self.n, self.k = m, n, k
+        self.cells = m * n
+        self.num_codes = 3 ** self.cells
+        self.powers = 3 ** np.arange(self.cells, dtype=np.int64)
+        self.lines = self._winning_lines()
+        self._line_index = np.array(self.lines, dtype=np.int64).reshape(-1, k)
+
+    def _winning_lines(self):
+        # Every window of k cells in a row, column or diagonal
+        lines = []
+        for row in range(self.m):
+            for col in range(self.n):
+                for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_row, end_col = row + d_row * (self.k - 1), col + d_col * (self.k - 1)
+                    if 0 <= end_row < self.m and 0 <= end_col < self.n:
+                        lines.append(tuple((row + d_row * i) * self.n + col + d_col * i for i in range(self.k)))
+        return lines
+
+    def encode(self, grid):
+        """Grid of 'X' / 'O' / None rows (like a SingleTic state key) -> integer code"""
+        digits = {None: 0, 'X': 1, 'O': 2}
+        return sum(digits[cell] * 3 ** i for i, cell in enumerate(c for row in grid for c in row))
+
+    def decode(self, code):
+        """Integer code -> tuple of rows, the same shape as a SingleTic state key"""
+        symbols = (None, 'X', 'O')
+        cells = []
+        for _ in range(self.cells):
+            code, digit = divmod(code, 3)
+            cells.append(symbols[digit])
+        return tuple(tuple(cells[row * self.n:(row + 1) * self.n]) for row in range(self.m))
+
+    def digits(self, codes):
+        """(N,) codes -> (N, cells) int8 digits"""
+        return ((codes[:, None] // self.powers[None, :]) % 3).astype(np.int8)
+
+    def winners(self, digits):
+        """(N, cells) digits -> (N,) int8: 1 if X has k in a row, 2 if O has, else 0"""
+        line_cells = digits[:, self._line_index]  # (N, lines, k)
+        first = line_cells[:, :, 0]
+        complete = (first != 0) & np.all(line_cells == first[:, :, None], axis=2)
+        winner = np.where(complete, first, 0).max(axis=1)
+        return winner.astype(np.int8)
+
+
+class OutOfCoreSolver:
+    def __init__(self, rules, workdir, memory_budget_mb=256):
+        self.rules = rules
+        self.workdir = workdir
+        os.makedirs(workdir, exist_ok=True)
+
+        # Per code of a chunk we hold its digits, one child code per cell and a few temporaries
+        bytes_per_code = rules.cells * (8 + 8 + 1) + 64
+        self.chunk_size = max(1024, memory_budget_mb * 2 ** 20 // bytes_per_code)
+
+        self.values = None
+        self.level_sizes = []
+
+    def _path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def _level_path(self, level):
+        return self._path(f"level_{level:03d}.bin")
+
+    def _open_dense(self, name, dtype, mode):
+        return np.memmap(self._path(name), dtype=dtype, mode=mode, shape=(self.rules.num_codes,))
+
+    def _read_level(self, level):
+        # Yields the codes of a level one chunk at a time
+        size = os.path.getsize(self._level_path(level)) // 8
+        if size == 0:
+            return
+        codes = np.memmap(self._level_path(level), dtype=np.int64, mode='r', shape=(size,))
+        for start in range(0, size, self.chunk_size):
+            yield np.array(codes[start:start + self.chunk_size])
+
+    def _children(self, codes, digits, player):
+        # (N,) codes -> (N, cells) child codes, -1 where the cell is taken
+        children = codes[:, None] + player * self.rules.powers[None, :]
+        return np.where(digits == 0, children, -1)
+
+    def forward(self, verbose=True):
+        """Enumerate the reachable states level by level, writing each level's codes to disk"""
+        rules = self.rules
+        seen = self._open_dense("seen.u8", np.uint8, 'w+') # level + 1 of every reached code, 0 if unreached
+
+        with open(self._level_path(0), "wb") as f:
+            np.array([0], dtype=np.int64).tofile(f)
+        self.level_sizes = [1]
+
+        for level in range(rules.cells):
+            player = 1 if level % 2 == 0 else 2
+            for codes in self._read_level(level):
+                digits = rules.digits(codes)
+                open_codes = rules.winners(digits) == 0
+                children = self._children(codes[open_codes], digits[open_codes], player)
+                seen[children[children >= 0]] = level + 2
+
+            # Collect the next level by scanning the marks in chunks, already in sorted order
+            count = 0
+            with open(self._level_path(level + 1), "wb") as f:
+                for start in range(0, rules.num_codes, self.chunk_size * 8):
+                    block = seen[start:start + self.chunk_size * 8]
+                    found = np.flatnonzero(block == level + 2).astype(np.int64) + start
+                    found.tofile(f)
+                    count += len(found)
+            self.level_sizes.append(count)
+            if verbose:
+                print(f"Level {level + 1}: {count} states")
+
+        seen.flush()
+        del seen
+        os.remove(self._path("seen.u8"))
+        return sum(self.level_sizes)
+
+    def backward(self, verbose=True):
+        """Compute every reachable state's value, from the full board back to the empty board"""
+        rules = self.rules
+        values = self._open_dense("values.i8", np.int8, 'w+')
+
+        for level in range(rules.cells, -1, -1):
+            player = 1 if level % 2 == 0 else 2
+            for codes in self._read_level(level):
+                digits = rules.digits(codes)
+                winners = rules.winners(digits)
+                result = np.where(winners == 1, 1, np.where(winners == 2, -1, 0)).astype(np.int8)
+
+                open_codes = (winners == 0) & (level < rules.cells)
+                if open_codes.any():
+                    children = self._children(codes[open_codes], digits[open_codes], player)
+                    taken = children < 0
+                    child_values = values[np.where(taken, 0, children)].astype(np.int8)
+                    if player == 1:
+                        best = np.where(taken, -2, child_values).max(axis=1)
+                    else:
+                        best = np.where(taken, 2, child_values).min(axis=1)
+                    result[open_codes] = best
+
+                values[codes] = result
+            if verbose:
+                print(f"Solved level {level}")
+
+        values.flush()
+        self.values = values
+        return int(values[0])
+
+    def solve(self, verbose=True):
+        start = time.perf_counter()
+        states = self.forward(verbose)
+        value = self.backward(verbose)
+        if verbose:
+            names = {1: 'X wins', 0: 'draw', -1: 'O wins'}
+            print(f"{self.rules.m}x{self.rules.n} k={self.rules.k}: {states} reachable states, "
+                  f"{names[value]} with perfect play ({time.perf_counter() - start:.1f}s)")
+        return value
+
+    def load(self):
+        """Reopen the values of a previous solve in the same workdir"""
+        self.values = self._open_dense("values.i8", np.int8, 'r')
+        return self
+
+    def value(self, code):
+        return int(self.values[code])
+
+    def best_move(self, code):
+        """Best cell to play from a (non-terminal) reachable state, or None if the game is over"""
+        rules = self.rules
+        codes = np.array([code], dtype=np.int64)
+        digits = rules.digits(codes)
+        if rules.winners(digits)[0] != 0 or not (digits == 0).any():
+            return None
+
+        player = 1 if (digits != 0).sum() % 2 == 0 else 2
+        children = self._children(codes, digits, player)[0]
+        moves = [cell for cell in range(rules.cells) if children[cell] >= 0]
+        child_values = [int(self.values[children[cell]]) for cell in moves]
+        best = max(child_values) if player == 1 else min(child_values)
+        return moves[child_values.index(best)]
+
+    def policy(self):
+        """
+        Policy dict keyed like SingleTic state keys (state_key -> cell), for boards small enough to hold
+        every state in memory.
+        """
+        policy = {}
+        for level in range(self.rules.cells):
+            for codes in self._read_level(level):
+                for code in codes.tolist():
+                    move = self.best_move(code)
+                    if move is not None:
+                        policy[self.rules.decode(code)] = move
+        return policy
+
+
+def main():
+    solver = OutOfCoreSolver(MNKRules(3, 3, 3), "mnk-3x3x3")
+    solver.solve()
+
+
+if __name__ == "__main__":
+    main()
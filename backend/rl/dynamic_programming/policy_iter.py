@@ -11,6 +11,8 @@ import numpy as np
 from backend.helpers import position_to_coordinates
 import random
 from backend.rl.single_tic import SingleTic
+from backend.rl.dynamic_programming.state_graph import StateGraph
+from backend.rl import instrument
 
 class PolicyIteration:
     def __init__(self):
@@ -19,6 +21,10 @@ class PolicyIteration:
         self.values = {}
         self.policy = {}
 
+        # Only used by the exact evaluation mode
+        self.graph = None
+        self.changed_states = None # States whose action changed in the last improvement step
+
     def game_state_to_grid(self, state_key):
         return [list(row) for row in state_key]
     
@@ -71,6 +77,9 @@ class PolicyIteration:
     def initialize_policy(self):
         print("Initializing policy randomly...")
 
+        # A new policy starts from scratch: nothing of the last run's values can be warm-started
+        self.values = {}
+        self.changed_states = None
 
         for state_key in self.all_states:
             grid = self.game_state_to_grid(state_key)
@@ -86,9 +95,14 @@ class PolicyIteration:
         print(f"Initialized policy for {len(self.policy)} non-terminal states")
         return self.policy
     
-    def policy_evaluation(self, gamma=0.9, theta=1e-6, max_iterations=20):
+    def policy_evaluation(self, gamma=0.9, theta=1e-6, max_iterations=20, mode="sweep"):
         print("=== EVALUATING POLICY ===")
 
+        if mode == "exact":
+            return self.exact_policy_evaluation(gamma)
+        elif mode != "sweep":
+            raise ValueError(f"Unknown evaluation mode: {mode}")
+
         # Initialize values for all states to 0
         for state in self.all_states:
             self.values[state] = 0.0
@@ -98,29 +112,30 @@ class PolicyIteration:
             print(f"Iteration {iteration+1}...")
             delta = 0.0 # Tracking maximum change in value across all states
 
-            # Use the state-value function to evaluate the policy, improving the values of the states based on the current policy
-            for state_key in self.all_states:
-                old_value = self.values[state_key]
+            with instrument.span("sweep"):
+                # Use the state-value function to evaluate the policy, improving the values of the states based on the current policy
+                for state_key in self.all_states:
+                    old_value = self.values[state_key]
 
-                # Check for terminal state
-                grid = self.game_state_to_grid(state_key)
-                game = SingleTic(grid)
-                result = game.game_result()
+                    # Check for terminal state
+                    grid = self.game_state_to_grid(state_key)
+                    game = SingleTic(grid)
+                    result = game.game_result()
 
-                if result is not None:
-                    self.values[state_key] = self.get_reward(state_key, player="X")
+                    if result is not None:
+                        self.values[state_key] = self.get_reward(state_key, player="X")
 
-                else:
-                    policy_action = self.policy[state_key]
+                    else:
+                        policy_action = self.policy[state_key]
                     
-                    next_state = self.get_next_state(state_key, policy_action)
-                    immediate_reward = self.get_reward(state_key, player="X")
-                    future_value = self.values[next_state]
+                        next_state = self.get_next_state(state_key, policy_action)
+                        immediate_reward = self.get_reward(state_key, player="X")
+                        future_value = self.values[next_state]
 
-                    # Update the value for the current state
-                    self.values[state_key] = immediate_reward + gamma * future_value
+                        # Update the value for the current state
+                        self.values[state_key] = immediate_reward + gamma * future_value
 
-                delta = max(delta, abs(self.values[state_key] - old_value))
+                    delta = max(delta, abs(self.values[state_key] - old_value))
                     
             print(f"Iteration {iteration+1}, max change: {delta:.6f}")
 
@@ -131,10 +146,49 @@ class PolicyIteration:
         print(f"Policy evaluation reached maximum number of iterations: {max_iterations}")
         return max_iterations
     
-    def policy_improvement(self, gamma=0.9):
+    def exact_policy_evaluation(self, gamma=0.9):
+        # Under a deterministic policy every state has a single successor, and the state graph is a DAG.
+        # Visiting the states so that each successor is evaluated before its predecessors gives the
+        # exact V^pi in one pass, with no sweeps and no convergence threshold.
+        #
+        # Values are kept between calls (warm start). After an improvement step only the states whose
+        # action changed, and the states whose policy path leads into them, need new values.
+        if self.graph is None:
+            self.graph = StateGraph(self.all_states)
+        graph = self.graph
+
+        if self.changed_states is None or not self.values:
+            to_update = graph.order
+        else:
+            # Walk backwards along the policy edges from every changed state
+            dirty = set(self.changed_states)
+            stack = list(self.changed_states)
+            while stack:
+                state_key = stack.pop()
+                for parent in graph.predecessors[state_key]:
+                    if parent not in dirty and graph.successors[parent][self.policy[parent]] == state_key:
+                        dirty.add(parent)
+                        stack.append(parent)
+            to_update = sorted(dirty, key=graph.rank.__getitem__)
+
+        with instrument.span("sweep"):
+            for state_key in to_update:
+                if graph.terminal[state_key]:
+                    self.values[state_key] = graph.rewards[state_key]
+                else:
+                    next_state = graph.successors[state_key][self.policy[state_key]]
+                    self.values[state_key] = graph.rewards[state_key] + gamma * self.values[next_state]
+
+        print(f"Exact policy evaluation updated {len(to_update)} of {len(graph)} states")
+        return len(to_update)
+
+    def policy_improvement(self, gamma=0.9, mode="sweep"):
+        # mode is the evaluation mode: "exact" reads the state graph and records the changed states
         print("=== IMPROVING POLICY ===")
         policy_changed = False
 
+        if mode == "exact":
+            return self._graph_policy_improvement(gamma)
 
         for state_key in self.all_states:
             grid = self.game_state_to_grid(state_key)
@@ -172,8 +226,43 @@ class PolicyIteration:
         else:
             print("Policy is stable")
             return False
+
+    def _graph_policy_improvement(self, gamma=0.9):
+        # Same greedy step as policy_improvement, reading transitions from the prebuilt state graph
+        # and remembering which states changed action for the next exact evaluation
+        if self.graph is None:
+            self.graph = StateGraph(self.all_states)
+        graph = self.graph
+        self.changed_states = []
+
+        for state_key in graph.order:
+            if graph.terminal[state_key]:
+                continue
+
+            moves = graph.successors[state_key]
+            immediate_reward = graph.rewards[state_key]
+            available_actions = list(moves)
+            q_values = [immediate_reward + gamma * self.values[moves[action]] for action in available_actions]
+
+            if graph.player[state_key] == 'X':
+                best_action = available_actions[np.argmax(q_values)]
+            else:
+                best_action = available_actions[np.argmin(q_values)]
+
+            if self.policy.get(state_key) != best_action:
+                self.policy[state_key] = best_action
+                self.changed_states.append(state_key)
+
+        if self.changed_states:
+            print(f"Policy changed in {len(self.changed_states)} states, continuing...")
+            return True
+        else:
+            print("Policy is stable")
+            return False
         
-    def run_policy_iteration(self, gamma=0.9, theta=1e-6, max_iterations=20):
+    def run_policy_iteration(self, gamma=0.9, theta=1e-6, max_iterations=20, evaluation="sweep"):
+        # evaluation="exact" evaluates each policy exactly in one ordered pass over the state graph,
+        # reusing the previous values; "sweep" runs the original capped iterative evaluation
         print("Running policy iteration...")
 
         # Step 1: Initialize policy randomly
@@ -183,10 +272,11 @@ class PolicyIteration:
             print(f"Iteration {iteration+1}...")
 
             # Step 2: Evaluate the policy
-            evaluation_iterations = self.policy_evaluation(gamma, theta)
+            evaluation_iterations = self.policy_evaluation(gamma, theta, mode=evaluation)
 
             # Step 3: Improve the policy
-            policy_changed = self.policy_improvement(gamma)
+            with instrument.span("improvement"):
+                policy_changed = self.policy_improvement(gamma, mode=evaluation)
 
             # Step 4: Check for convergence
             if not policy_changed:
@@ -0,0 +1,269 @@
+# Labelled real-time dynamic programming (LRTDP): solve only the states a query needs.
+#
+# ValueIteration and PolicyIteration enumerate get_all_states() before answering anything. Here a
+# query names one root state, and the solver runs trials from it: walk down the game tree, always
+# taking the move that currently looks best for the player to move, to a finished game (or a state
+# already solved), then back up the states on the way. Successors are generated the first time a
+# state is backed up, so only the part of the tree the trials reach is ever expanded.
+#
+# The Bellman backup is ValueIteration's: V(s) = reward for X at the end of the game, otherwise
+# gamma * max (X to move) or min (O to move) over the successors, so the values agree with it.
+#
+# Convergence labelling. Plain LRTDP keeps one optimistic value per state, but in a two-player game
+# a value optimistic for X is pessimistic for O, and a move could be labelled best while a sibling's
+# value is still a guess. So every state keeps a lower and an upper bound on its value, starting at
+# the reward bounds [-1, 1]. Trials follow X's highest upper bound and O's lowest lower bound, the
+# backups tighten both bounds, and a state is labelled solved once they meet (within epsilon). A
+# state whose best move leads to a solved state is solved by its next backup, so every trial ends
+# on a finished game and the root is solved after a number of trials that scales with the subtree.
+#
+# Bounds and labels live on the solver, so later queries stop at states earlier ones solved.
+#
+#   solver = LRTDP(GameModel(3, 3, 3), gamma=0.9)
+#   solver.solve(state_key)       # V(state_key), from X's point of view
+#   solver.best_move(state_key)
+#   policy = OnDemandPolicy(solver)   # policy.get(state_key), for play, arena and serve
+
+import time
+
+from backend.rl.dynamic_programming.mnk import MNKRules
+
+
+class GameModel:
+    """An m,n,k game (3,3,3 is tic-tac-toe) on state keys shaped like SingleTic's"""
+
+    def __init__(self, m=3, n=3, k=3):
+        self.rules = MNKRules(m, n, k)
+        self.m, self.n = m, n
+        self.lines = self.rules.lines
+
+    def initial_state(self):
+        return tuple((None,) * self.n for _ in range(self.m))
+
+    def reward(self, state_key):
+        """Reward for X if the game is over (1 win, -1 loss, 0 draw), None if it goes on"""
+        cells = [cell for row in state_key for cell in row]
+        for line in self.lines:
+            first = cells[line[0]]
+            if first is not None and all(cells[i] == first for i in line):
+                return 1.0 if first == 'X' else -1.0
+        return None if None in cells else 0.0
+
+    def player(self, state_key):
+        pieces = sum(cell is not None for row in state_key for cell in row)
+        return 'X' if pieces % 2 == 0 else 'O'
+
+    def successors(self, state_key):
+        """[(action, next_state)] for every empty cell, actions in ascending order"""
+        player = self.player(state_key)
+        n = self.n
+        moves = []
+        for action in range(self.m * n):
+            row, col = divmod(action, n)
+            if state_key[row][col] is None:
+                grid = [list(r) for r in state_key]
+                grid[row][col] = player
+                moves.append((action, tuple(tuple(r) for r in grid)))
+        return moves
+
+
+class LRTDP:
+    def __init__(self, model=None, gamma=0.9, epsilon=0.0):
+        self.model = model or GameModel()
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.lower = {}       # state -> lower bound on V(state)
+        self.upper = {}       # state -> upper bound on V(state)
+        self.maximizer = {}   # state -> True if X is to move
+        self.children = {}    # state -> [(action, next_state)], once the state has been backed up
+        self.solved = set()
+        self.backups = 0
+        self.trials = 0
+
+    def _touch(self, state_key):
+        # First sight of a state: exact if the game is over, otherwise the widest bounds
+        if state_key in self.lower:
+            return
+        reward = self.model.reward(state_key)
+        if reward is None:
+            self.lower[state_key], self.upper[state_key] = -1.0, 1.0
+            self.maximizer[state_key] = self.model.player(state_key) == 'X'
+        else:
+            self.lower[state_key] = self.upper[state_key] = reward
+            self.solved.add(state_key)
+
+    def _backup(self, state_key):
+        children = self.children.get(state_key)
+        if children is None:
+            children = self.children[state_key] = self.model.successors(state_key)
+            for _, child in children:
+                self._touch(child)
+        lower, upper = self.lower, self.upper
+        best = max if self.maximizer[state_key] else min
+        low = self.gamma * best(lower[child] for _, child in children)
+        high = self.gamma * best(upper[child] for _, child in children)
+        lower[state_key], upper[state_key] = low, high
+        self.backups += 1
+        if high - low <= self.epsilon:
+            self.solved.add(state_key)
+
+    def _trial(self, root):
+        path = []
+        state_key = root
+        while state_key not in self.solved:
+            path.append(state_key)
+            self._backup(state_key)
+            if state_key in self.solved:
+                break
+            # The move that is best for the player to move if the open questions go their way
+            if self.maximizer[state_key]:
+                state_key = max(self.children[state_key], key=lambda move: self.upper[move[1]])[1]
+            else:
+                state_key = min(self.children[state_key], key=lambda move: self.lower[move[1]])[1]
+        # Labelling: back up the path from its end, so solved states propagate towards the root
+        for state_key in reversed(path):
+            self._backup(state_key)
+        self.trials += 1
+
+    def solve(self, state_key, max_trials=None):
+        """Run trials from state_key until it is solved. Returns V(state_key), from X's point of view."""
+        self._touch(state_key)
+        trials = 0
+        while state_key not in self.solved:
+            if max_trials is not None and trials >= max_trials:
+                break
+            self._trial(state_key)
+            trials += 1
+        return self.value(state_key)
+
+    def value(self, state_key):
+        """Midpoint of the bounds, the exact value once the state is solved"""
+        return (self.lower[state_key] + self.upper[state_key]) / 2
+
+    def best_move(self, state_key):
+        """Solve the state and return a move that guarantees its value, or None if the game is over"""
+        self.solve(state_key)
+        children = self.children.get(state_key)
+        if not children:
+            return None
+        # X takes the move with the best guaranteed value (lower bound), O the best for O (upper bound)
+        if self.maximizer[state_key]:
+            return max(children, key=lambda move: self.lower[move[1]])[0]
+        return min(children, key=lambda move: self.upper[move[1]])[0]
+
+    def stats(self):
+        return {'expanded': len(self.children), 'seen': len(self.lower), 'solved': len(self.solved),
+                'backups': self.backups, 'trials': self.trials}
+
+
+class OnDemandPolicy:
+    """A policy (state_key -> action) that solves each state the first time it is asked for"""
+
+    def __init__(self, solver):
+        self.solver = solver
+        self.moves = {}
+
+    def get(self, state_key, default=None):
+        if state_key not in self.moves:
+            self.moves[state_key] = self.solver.best_move(state_key)
+        move = self.moves[state_key]
+        return default if move is None else move
+
+    def __getitem__(self, state_key):
+        move = self.get(state_key)
+        if move is None:
+            raise KeyError(state_key)
+        return move
+
+    def __contains__(self, state_key):
+        return self.get(state_key) is not None
+
+    def __len__(self):
+        return len(self.moves)
+
+    def solve_reachable(self):
+        """
+        Solve every state reachable from the empty board and return the whole policy as a dict, for
+        the uses that need all of it up front (compile_policy, publish_policy)
+        """
+        model = self.solver.model
+        policy = {}
+        stack = [model.initial_state()]
+        while stack:
+            state_key = stack.pop()
+            if state_key in policy or model.reward(state_key) is not None:
+                continue
+            policy[state_key] = self.get(state_key)
+            stack.extend(next_state for _, next_state in model.successors(state_key))
+        return policy
+
+
+def compare_with_value_iteration(gamma=0.9, queries=200, seed=0):
+    """
+    Time full value iteration against LRTDP queries on tic-tac-toe, and check every state LRTDP
+    solved has value iteration's value.
+    """
+    import random
+    from backend.rl.dynamic_programming.value_iter import ValueIteration
+
+    start = time.perf_counter()
+    vi = ValueIteration()
+    vi.run_value_iteration(gamma=gamma, theta=1e-12, mode="gauss_seidel")
+    vi_time = time.perf_counter() - start
+
+    model = GameModel()
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(queries):
+        state_key = model.initial_state()
+        for _ in range(rng.randrange(2, 7)):
+            if model.reward(state_key) is not None:
+                break
+            state_key = rng.choice(model.successors(state_key))[1]
+        if model.reward(state_key) is None:
+            positions.append(state_key)
+
+    # A single mid-game query on a fresh solver, then a stream of queries sharing one solver
+    solver = LRTDP(model, gamma)
+    start = time.perf_counter()
+    solver.solve(positions[0])
+    first_time = time.perf_counter() - start
+    first_expanded = solver.stats()['expanded']
+
+    start = time.perf_counter()
+    for state_key in positions:
+        solver.solve(state_key)
+    stream_time = time.perf_counter() - start
+
+    errors = [abs(solver.value(state_key) - vi.values[state_key]) for state_key in solver.solved]
+    print(f"Value iteration: {len(vi.all_states)} states enumerated and solved in {vi_time * 1000:.0f}ms")
+    print(f"LRTDP, one mid-game query: {first_expanded} states expanded in {first_time * 1000:.1f}ms")
+    print(f"LRTDP, {len(positions)} queries: {stream_time / len(positions) * 1000:.2f}ms each, {solver.stats()}")
+    print(f"Largest difference from value iteration over {len(errors)} solved states: {max(errors):.2e}")
+
+    start = time.perf_counter()
+    value = solver.solve(model.initial_state())
+    print(f"Empty board: V = {value:.4f}, solved in {(time.perf_counter() - start) * 1000:.0f}ms "
+          f"on top of the earlier queries")
+    return max(errors)
+
+
+def main():
+    compare_with_value_iteration()
+
+    # Beyond 3x3: a 4x4 board (4 in a row) has about 10^7 states, too many to enumerate in Python,
+    # but a position with a few pieces on it only needs its own subtree
+    model = GameModel(4, 4, 4)
+    state_key = (('X', None, None, 'O'),
+                 (None, 'O', 'X', None),
+                 (None, 'X', None, None),
+                 ('O', None, None, None))
+    solver = LRTDP(model)
+    start = time.perf_counter()
+    value = solver.solve(state_key)
+    print(f"4x4x4 position with 6 pieces: V = {value:.4f}, best move {solver.best_move(state_key)}, "
+          f"{(time.perf_counter() - start):.2f}s, {solver.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# The tic-tac-toe state graph, built once from get_all_states() so the dynamic programming solvers
+# don't rebuild SingleTic objects and grids for every state on every sweep.
+#
+# Every move adds a piece, so the graph is a DAG layered by piece count. `order` lists the states
+# from the fullest boards to the empty board: every successor comes before its predecessors,
+# which lets a single pass in that order compute exact values.
+
+from backend.rl.single_tic import state_result
+
+
+class StateGraph:
+    def __init__(self, all_states):
+        self.rewards = {}       # state -> reward for X (1 win, -1 loss, 0 draw or unfinished)
+        self.terminal = {}      # state -> True if the game is over
+        self.player = {}        # state -> player to move ('X' or 'O')
+        self.successors = {}    # state -> {action: next_state}, actions in ascending order
+        self.predecessors = {}  # state -> list of states with a move leading to it
+
+        for state_key in all_states:
+            self.predecessors.setdefault(state_key, [])
+
+        for state_key in all_states:
+            result = state_result(state_key)
+            self.terminal[state_key] = result is not None
+            self.rewards[state_key] = 1.0 if result == 'X' else -1.0 if result == 'O' else 0.0
+
+            x_count = sum(row.count('X') for row in state_key)
+            o_count = sum(row.count('O') for row in state_key)
+            player = 'X' if x_count == o_count else 'O'
+            self.player[state_key] = player
+
+            moves = {}
+            if result is None:
+                for action in range(9):
+                    row, col = action // 3, action % 3
+                    if state_key[row][col] is None:
+                        grid = [list(r) for r in state_key]
+                        grid[row][col] = player
+                        next_state = tuple(tuple(r) for r in grid)
+                        moves[action] = next_state
+                        self.predecessors[next_state].append(state_key)
+            self.successors[state_key] = moves
+
+        # Fullest boards first, so successors are always handled before their predecessors
+        self.order = sorted(all_states, key=lambda s: sum(cell is not None for row in s for cell in row), reverse=True)
+        self.rank = {state_key: i for i, state_key in enumerate(self.order)}
+
+    def __len__(self):
+        return len(self.order)
@@ -0,0 +1,204 @@
+# Exact exploitability analysis of a deterministic tic-tac-toe policy.
+#
+# Instead of sampling games, we walk the whole game tree: on the policy's turns we follow its
+# move, on the opponent's turns we try every reply. With memoization over state keys this touches
+# each reachable state once, so the answer is exact and takes a fraction of a second.
+
+import time
+
+from backend.rl.single_tic import state_result
+
+
+RESULT_NAMES = {1: 'win', 0: 'draw', -1: 'loss'}
+
+
+def get_current_player(state_key):
+    x_count = sum(row.count('X') for row in state_key)
+    o_count = sum(row.count('O') for row in state_key)
+    return 'X' if x_count == o_count else 'O'
+
+
+def get_valid_actions(state_key):
+    return [i for i in range(9) if state_key[i // 3][i % 3] is None]
+
+
+def get_next_state(state_key, action, player):
+    grid = [list(row) for row in state_key]
+    grid[action // 3][action % 3] = player
+    return tuple(tuple(row) for row in grid)
+
+
+def analyze_policy(policy, side, max_lines=20):
+    """
+    Exact worst case of `policy` playing `side` ('X' or 'O') against every possible opponent.
+
+    States the policy lacks (or where it returns an illegal move) are coverage gaps. At a gap
+    the caller would fall back to a random move, so the analysis assumes any legal move can
+    happen there.
+
+    Returns a dict with:
+        worst_case:    'win', 'draw' or 'loss' for the policy's side under the best opponent
+        losing_lines:  up to max_lines move sequences (from the empty board) that beat the policy
+        gaps:          reachable states where the policy has no legal move
+        states:        number of distinct states visited
+    """
+    if side not in ('X', 'O'):
+        raise ValueError("Side must be 'X' or 'O'")
+
+    opponent = 'O' if side == 'X' else 'X'
+    values = {}  # state_key -> 1 / 0 / -1 from the policy side's perspective
+    gaps = set()
+
+    def policy_move(state_key, valid_actions):
+        move = policy.get(state_key)
+        return move if move in valid_actions else None
+
+    def value(state_key):
+        if state_key in values:
+            return values[state_key]
+
+        result = state_result(state_key)
+        if result is not None:
+            if result == side:
+                v = 1
+            elif result == opponent:
+                v = -1
+            else:
+                v = 0
+        else:
+            player = get_current_player(state_key)
+            valid_actions = get_valid_actions(state_key)
+            move = policy_move(state_key, valid_actions) if player == side else None
+
+            if player == side and move is not None:
+                v = value(get_next_state(state_key, move, player))
+            else:
+                if player == side:
+                    gaps.add(state_key)
+                # The opponent (or a random fallback) can pick any move: take the worst one
+                v = min(value(get_next_state(state_key, action, player)) for action in valid_actions)
+
+        values[state_key] = v
+        return v
+
+    empty_state = tuple(tuple(None for _ in range(3)) for _ in range(3))
+    worst_case = value(empty_state)
+
+    # Collect move sequences that end in a loss by only following losing transitions
+    losing_lines = []
+
+    def collect(state_key, line):
+        if len(losing_lines) >= max_lines:
+            return
+        if state_result(state_key) is not None:
+            losing_lines.append(line)
+            return
+
+        player = get_current_player(state_key)
+        valid_actions = get_valid_actions(state_key)
+        move = policy_move(state_key, valid_actions) if player == side else None
+        candidates = [move] if move is not None else valid_actions
+
+        for action in candidates:
+            next_state = get_next_state(state_key, action, player)
+            if values[next_state] == -1:
+                collect(next_state, line + [action])
+
+    if worst_case == -1:
+        collect(empty_state, [])
+
+    return {
+        'side': side,
+        'worst_case': RESULT_NAMES[worst_case],
+        'losing_lines': losing_lines,
+        'gaps': sorted(gaps, key=str),
+        'states': len(values),
+    }
+
+
+def solve_game():
+    """Perfect-play (minimax) value of every reachable state, from X's perspective: 1, 0 or -1"""
+    values = {}
+
+    def value(state_key):
+        if state_key in values:
+            return values[state_key]
+        result = state_result(state_key)
+        if result is not None:
+            v = 1 if result == 'X' else -1 if result == 'O' else 0
+        else:
+            player = get_current_player(state_key)
+            child_values = [value(get_next_state(state_key, action, player)) for action in get_valid_actions(state_key)]
+            v = max(child_values) if player == 'X' else min(child_values)
+        values[state_key] = v
+        return v
+
+    value(tuple(tuple(None for _ in range(3)) for _ in range(3)))
+    return values
+
+
+def optimal_move_rate(policy, values=None):
+    """
+    Fraction of the policy's decisions that keep the perfect-play value, over every state the policy can
+    reach playing either side against all opponent replies. A missing or illegal move counts as a mistake.
+    1.0 means the policy plays perfectly wherever it can end up.
+    """
+    if values is None:
+        values = solve_game()
+
+    correct, total = 0, 0
+    for side in ('X', 'O'):
+        seen = set()
+        stack = [tuple(tuple(None for _ in range(3)) for _ in range(3))]
+        while stack:
+            state_key = stack.pop()
+            if state_key in seen or state_result(state_key) is not None:
+                continue
+            seen.add(state_key)
+
+            player = get_current_player(state_key)
+            valid_actions = get_valid_actions(state_key)
+            if player == side:
+                total += 1
+                move = policy.get(state_key)
+                if move in valid_actions:
+                    next_state = get_next_state(state_key, move, player)
+                    correct += values[next_state] == values[state_key]
+                    stack.append(next_state)
+                    continue
+            stack.extend(get_next_state(state_key, action, player) for action in valid_actions)
+
+    return correct / total if total else 0.0
+
+
+def analyze(policy, max_lines=20):
+    """Analyze a policy as both X and O"""
+    return {side: analyze_policy(policy, side, max_lines) for side in ('X', 'O')}
+
+
+def print_report(report):
+    for side, analysis in report.items():
+        print("=" * 40)
+        print(f"Policy playing {side}: worst case is a {analysis['worst_case']}")
+        print(f"States visited: {analysis['states']}, coverage gaps: {len(analysis['gaps'])}")
+        for line in analysis['losing_lines']:
+            print("  losing line: " + " ".join(str(move) for move in line))
+    print("=" * 40)
+
+
+def main():
+    from backend.rl.model_free.temporal_diff import TemporalDifference
+
+    td = TemporalDifference()
+    policy = td.train_full(iterations=50000, verbose=False)
+
+    start = time.perf_counter()
+    report = analyze(policy)
+    elapsed = time.perf_counter() - start
+
+    print_report(report)
+    print(f"Analysis took {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
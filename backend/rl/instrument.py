@@ -0,0 +1,308 @@
+# Opt-in instrumentation for the RL code.
+#
+# When enabled, the hot-path methods listed in HOT_PATHS are wrapped with call counters and
+# timers, span() records per-phase timings (enumeration, sweep, extraction, episode) and how many
+# hot-path calls each phase made, record_memory() tracks Q-table growth with tracemalloc, and an
+# optional sampling profiler records where the main thread spends its time.
+#
+# When disabled nothing is wrapped: the methods are the original functions, span() hands back a
+# shared no-op context manager and record_memory() returns immediately. That is why the span and
+# memory hooks can stay in the training loops for production runs.
+#
+#   from backend.rl import instrument
+#   instrument.enable(memory=True, sample_interval=0.005)
+#   ValueIteration().run_value_iteration()
+#   instrument.disable()
+#   instrument.print_report()
+#   instrument.export_json("profile.json")
+
+import functools
+import importlib
+import json
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+
+# (module, class, method) of every method that gets a counter and a timer. A class of None wraps a
+# module-level function, in the module given: callers that imported it by name look it up there.
+HOT_PATHS = [
+    ('backend.rl.single_tic', 'SingleTic', 'game_result'),
+    ('backend.rl.single_tic', 'SingleTic', '_check_winner'),
+    ('backend.rl.single_tic', 'SingleTic', 'get_valid_actions'),
+    ('backend.rl.single_tic', 'SingleTic', 'game_state_to_grid'),
+    ('backend.rl.single_tic', 'SingleTic', 'get_current_player'),
+    ('backend.rl.dynamic_programming.value_iter', 'ValueIteration', 'game_state_to_grid'),
+    ('backend.rl.dynamic_programming.value_iter', 'ValueIteration', 'get_valid_actions'),
+    ('backend.rl.dynamic_programming.value_iter', 'ValueIteration', 'get_current_player'),
+    ('backend.rl.dynamic_programming.value_iter', 'ValueIteration', 'get_reward'),
+    ('backend.rl.dynamic_programming.value_iter', 'ValueIteration', 'get_next_state'),
+    ('backend.rl.dynamic_programming.policy_iter', 'PolicyIteration', 'game_state_to_grid'),
+    ('backend.rl.dynamic_programming.policy_iter', 'PolicyIteration', 'get_valid_actions'),
+    ('backend.rl.dynamic_programming.policy_iter', 'PolicyIteration', 'get_current_player'),
+    ('backend.rl.dynamic_programming.policy_iter', 'PolicyIteration', 'get_reward'),
+    ('backend.rl.dynamic_programming.policy_iter', 'PolicyIteration', 'get_next_state'),
+    # The state graph paths that the gauss_seidel/prioritized VI modes and exact PI run on
+    ('backend.rl.dynamic_programming.state_graph', None, 'state_result'),
+    ('backend.rl.dynamic_programming.state_graph', 'StateGraph', '__init__'),
+    ('backend.rl.dynamic_programming.value_iter', 'ValueIteration', '_backup'),
+    ('backend.rl.dynamic_programming.policy_iter', 'PolicyIteration', 'exact_policy_evaluation'),
+    ('backend.rl.dynamic_programming.policy_iter', 'PolicyIteration', '_graph_policy_improvement'),
+]
+
+_enabled = False
+_patched = []     # (class or module, name, original function) so disable() can put them back
+_counters = {}    # 'Class.method' -> [calls, inclusive seconds]
+_spans = {}       # phase -> {'count', 'seconds', 'calls': Counter of hot-path calls made inside}
+_memory = []      # Q-table growth samples
+_profiler = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.calls_before = {name: counter[0] for name, counter in _counters.items()}
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stats = _spans.setdefault(self.phase, {'count': 0, 'seconds': 0.0, 'calls': Counter()})
+        stats['count'] += 1
+        stats['seconds'] += elapsed
+        for name, counter in _counters.items():
+            delta = counter[0] - self.calls_before.get(name, 0)
+            if delta:
+                stats['calls'][name] += delta
+        return False
+
+
+def is_enabled():
+    return _enabled
+
+
+def span(phase):
+    """Context manager timing one occurrence of a phase. Free when instrumentation is off."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(phase)
+
+
+def record_memory(label, table):
+    """Record the size of a table (e.g. a Q dict) and the traced memory at this point"""
+    if not _enabled or not tracemalloc.is_tracing():
+        return
+    current, peak = tracemalloc.get_traced_memory()
+    _memory.append({'label': label, 'entries': len(table), 'current_bytes': current, 'peak_bytes': peak,
+                    'time': time.perf_counter()})
+
+
+def _wrap(name, function):
+    counter = _counters.setdefault(name, [0, 0.0])
+    perf_counter = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            counter[0] += 1
+            counter[1] += perf_counter() - start
+
+    return wrapper
+
+
+def enable(memory=False, sample_interval=None):
+    """
+    Wrap the hot paths and start recording. memory=True starts tracemalloc (which slows
+    allocations down noticeably), sample_interval starts the sampling profiler.
+    """
+    global _enabled, _profiler
+    if _enabled:
+        return
+
+    for module_name, class_name, method_name in HOT_PATHS:
+        module = importlib.import_module(module_name)
+        owner = module if class_name is None else getattr(module, class_name)
+        original = owner.__dict__[method_name]
+        _patched.append((owner, method_name, original))
+        setattr(owner, method_name, _wrap(method_name if class_name is None else f"{class_name}.{method_name}", original))
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    if sample_interval:
+        _profiler = SamplingProfiler(sample_interval)
+        _profiler.start()
+
+    _enabled = True
+
+
+def disable():
+    """Put the original methods back and stop tracing. Recorded data is kept for report()."""
+    global _enabled
+    if not _enabled:
+        return
+
+    while _patched:
+        owner, method_name, original = _patched.pop()
+        setattr(owner, method_name, original)
+
+    if _profiler is not None:
+        _profiler.stop()
+
+    if tracemalloc.is_tracing():
+        _memory.append({'label': 'top_allocations', 'lines': _top_allocations()})
+        tracemalloc.stop()
+
+    _enabled = False
+
+
+def reset():
+    global _profiler
+    _counters.clear()
+    _spans.clear()
+    _memory.clear()
+    _profiler = None
+
+
+def _top_allocations(limit=10):
+    snapshot = tracemalloc.take_snapshot()
+    return [{'where': str(stat.traceback), 'bytes': stat.size, 'blocks': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]]
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the thread that created it every `interval` seconds of CPU time.
+    Reports self time (innermost frame) and inclusive time (anywhere on the stack).
+
+    On the main thread of a Unix process this uses a SIGPROF timer, so the sample is taken in the
+    profiled thread itself. Otherwise a background thread polls sys._current_frames(), which is
+    biased towards places where the profiled thread releases the GIL (e.g. inside numpy calls).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.self_samples = Counter()
+        self.inclusive_samples = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._previous_handler = None
+        self._use_signal = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def start(self):
+        if self._use_signal:
+            self._previous_handler = signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._use_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        else:
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join()
+
+    def _on_signal(self, signum, frame):
+        self._sample(frame)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._sample(frame)
+
+    def _sample(self, frame):
+        self.samples += 1
+        self.self_samples[self._describe(frame)] += 1
+        seen = set()
+        while frame is not None:
+            name = self._describe(frame)
+            if name not in seen:
+                self.inclusive_samples[name] += 1
+                seen.add(name)
+            frame = frame.f_back
+
+    @staticmethod
+    def _describe(frame):
+        code = frame.f_code
+        return f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}"
+
+    def report(self, limit=15):
+        return {
+            'interval': self.interval,
+            'samples': self.samples,
+            'self': self.self_samples.most_common(limit),
+            'inclusive': self.inclusive_samples.most_common(limit),
+        }
+
+
+def report():
+    """Everything recorded so far, as a JSON-serialisable dict"""
+    return {
+        'hot_paths': {name: {'calls': calls, 'seconds': seconds,
+                             'us_per_call': seconds / calls * 1e6 if calls else 0.0}
+                      for name, (calls, seconds) in sorted(_counters.items(), key=lambda item: -item[1][1])},
+        'spans': {phase: {'count': stats['count'], 'seconds': stats['seconds'],
+                          'calls_per_span': {name: calls / stats['count'] for name, calls in stats['calls'].items()}}
+                  for phase, stats in _spans.items()},
+        'memory': list(_memory),
+        'profile': _profiler.report() if _profiler is not None else None,
+    }
+
+
+def export_json(path):
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2)
+
+
+def print_report():
+    data = report()
+
+    print("=" * 40)
+    print("HOT PATHS (inclusive time)")
+    for name, stats in data['hot_paths'].items():
+        if stats['calls']:
+            print(f"  {name:<42} {stats['calls']:>10} calls {stats['seconds']:>8.3f}s {stats['us_per_call']:>8.2f} us/call")
+
+    print("SPANS")
+    for phase, stats in data['spans'].items():
+        print(f"  {phase:<12} {stats['count']:>8} x  {stats['seconds']:.3f}s")
+        for name, calls in sorted(stats['calls_per_span'].items(), key=lambda item: -item[1]):
+            print(f"      {name:<42} {calls:>12.1f} calls per {phase}")
+
+    growth = [sample for sample in data['memory'] if 'entries' in sample]
+    if growth:
+        print("MEMORY")
+        for sample in growth[:: max(1, len(growth) // 10)]:
+            print(f"  {sample['label']:<10} {sample['entries']:>8} entries {sample['current_bytes'] / 1e6:>8.2f} MB")
+
+    if data['profile'] is not None:
+        print(f"SAMPLED PROFILE ({data['profile']['samples']} samples)")
+        for name, samples in data['profile']['self']:
+            print(f"  {name:<40} {samples / max(1, data['profile']['samples']):6.1%} self")
+    print("=" * 40)
@@ -0,0 +1,42 @@
+# Afterstates: the board right after a move, before the opponent replies.
+#
+# In tic-tac-toe the value of (s, a) only depends on the board that a leads to, and many pairs lead
+# to the same board (X centre, O corner, X edge ends where X edge, O corner, X centre does). With
+# afterstates=True, MonteCarlo and TemporalDifference keep one value per resulting board, V[s'] from
+# X's point of view, and read Q(s, a) as V[afterstate(s, a)]. Every pair that reaches a board shares
+# its experience, and the table holds one float per board instead of a dict of moves per state.
+#
+# The learners only touch Q through _get_Q_value / _set_Q_value, so every update rule (Monte Carlo
+# returns, one-step, n-step, Watkins's traces) works unchanged on top of V.
+
+from backend.rl.single_tic import state_result
+
+
+def _rows(cells):
+    return (tuple(cells[0:3]), tuple(cells[3:6]), tuple(cells[6:9]))
+
+
+def afterstate(state_key, action):
+    """The board after the player to move in state_key plays `action`"""
+    cells = list(state_key[0] + state_key[1] + state_key[2])
+    cells[action] = 'X' if cells.count('X') == cells.count('O') else 'O'
+    return _rows(cells)
+
+
+def decision_states(V):
+    """
+    Every non-terminal state with at least one successor in V: the boards we get by taking back one
+    piece of the player who moved last. These are the states a policy can be read for.
+    """
+    states = set()
+    for after_key in V:
+        cells = list(after_key[0] + after_key[1] + after_key[2])
+        mover = 'X' if cells.count('X') > cells.count('O') else 'O'
+        for i, cell in enumerate(cells):
+            if cell == mover:
+                cells[i] = None
+                before = _rows(cells)
+                if state_result(before) is None:
+                    states.add(before)
+                cells[i] = mover
+    return states
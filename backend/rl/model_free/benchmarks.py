@@ -0,0 +1,148 @@
+# Training-cost benchmarks for the model-free learners.
+#
+# Quality is measured with exploitability.optimal_move_rate: the fraction of the policy's decisions
+# that keep the perfect-play value, over every state it can reach as X or O. A learner is trained in
+# chunks of eval_every episodes until it reaches the target quality, and only training time counts.
+
+import random
+import statistics
+import sys
+import time
+
+from backend.rl.exploitability import solve_game, optimal_move_rate
+
+
+def current_policy(learner):
+    # extract_policy only fills in states that are missing, so start from scratch to see the latest Q values
+    learner.policy = {}
+    learner.extract_policy()
+    return learner.policy
+
+
+def train_episodes(learner, episodes):
+    if hasattr(learner, "train_full"):
+        learner.train_full(iterations=episodes, verbose=False)
+    else:
+        learner.train(num_episodes=episodes, verbose=False)
+
+
+def episodes_to_target(make_learner, target=0.9, max_episodes=100000, eval_every=1000, seed=0, values=None):
+    """
+    Train a fresh learner (make_learner()) until its policy reaches `target` quality.
+    Returns a dict with the episodes and training seconds it took, and the quality reached.
+    """
+    if values is None:
+        values = solve_game()
+
+    random.seed(seed)
+    learner = make_learner()
+    episodes, seconds, quality = 0, 0.0, 0.0
+
+    while episodes < max_episodes:
+        start = time.perf_counter()
+        train_episodes(learner, eval_every)
+        seconds += time.perf_counter() - start
+        episodes += eval_every
+
+        quality = optimal_move_rate(current_policy(learner), values)
+        if quality >= target:
+            return {'episodes': episodes, 'seconds': seconds, 'quality': quality, 'reached': True, 'learner': learner}
+
+    return {'episodes': episodes, 'seconds': seconds, 'quality': quality, 'reached': False, 'learner': learner}
+
+
+def compare(learners, target=0.9, max_episodes=100000, eval_every=1000, seeds=(0, 1, 2), baseline=None):
+    """
+    Run episodes_to_target for every named learner factory over several seeds and print a table.
+    Speedups are relative to `baseline` (the first learner by default).
+    """
+    values = solve_game()
+    summary = {}
+
+    for name, make_learner in learners.items():
+        runs = [episodes_to_target(make_learner, target, max_episodes, eval_every, seed, values) for seed in seeds]
+        summary[name] = {
+            'episodes': statistics.median(run['episodes'] for run in runs),
+            'seconds': statistics.median(run['seconds'] for run in runs),
+            'reached': sum(run['reached'] for run in runs),
+            'runs': runs,
+        }
+
+    baseline = baseline or next(iter(learners))
+    print("=" * 40)
+    print(f"Episodes to {target:.0%} optimal moves (median of {len(seeds)} seeds)")
+    for name, stats in summary.items():
+        speedup = summary[baseline]['seconds'] / stats['seconds'] if stats['seconds'] else float('inf')
+        print(f"  {name:<12} {stats['episodes']:>8.0f} episodes {stats['seconds']:>7.1f}s  "
+              f"reached {stats['reached']}/{len(seeds)}  {speedup:.1f}x faster than {baseline}")
+    print("=" * 40)
+    return summary
+
+
+def table_size(learner):
+    """(entries, bytes) of a learner's value table: (s, a) pairs of Q, or boards of V with afterstates"""
+    if getattr(learner, "afterstates", False):
+        table, entries = learner.V, len(learner.V)
+    else:
+        table, entries = learner.Q, sum(len(actions) for actions in learner.Q.values())
+
+    # Deep size, counting every object once: state keys share their row tuples and None/'X'/'O'
+    seen = set()
+    total = 0
+    stack = [table]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, tuple):
+            stack.extend(obj)
+    return entries, total
+
+
+def compare_td_updates(target=0.9, max_episodes=100000, eval_every=1000, seeds=(0, 1, 2)):
+    from backend.rl.model_free.temporal_diff import TemporalDifference
+
+    learners = {
+        'one-step': lambda: TemporalDifference(mode="q"),
+        'n-step': lambda: TemporalDifference(mode="nstep"),
+        'watkins': lambda: TemporalDifference(mode="watkins"),
+    }
+    return compare(learners, target, max_episodes, eval_every, seeds)
+
+
+def compare_afterstates(target=0.9, max_episodes=100000, eval_every=1000, seeds=(0, 1, 2)):
+    """Q tables against afterstate V tables, for both learners: episodes to target and table size"""
+    from backend.rl.model_free.monte_carlo import MonteCarlo
+    from backend.rl.model_free.temporal_diff import TemporalDifference
+
+    learners = {
+        'mc-q': lambda: MonteCarlo(),
+        'mc-after': lambda: MonteCarlo(afterstates=True),
+        'td-q': lambda: TemporalDifference(mode="q"),
+        'td-after': lambda: TemporalDifference(mode="q", afterstates=True),
+    }
+    summary = compare(learners, target, max_episodes, eval_every, seeds)
+
+    print("Table size when the target was reached (median)")
+    for name, stats in summary.items():
+        sizes = [table_size(run['learner']) for run in stats['runs']]
+        stats['entries'] = statistics.median(entries for entries, _ in sizes)
+        stats['bytes'] = statistics.median(size for _, size in sizes)
+        print(f"  {name:<12} {stats['entries']:>8.0f} entries {stats['bytes'] / 1024:>8.0f} KiB")
+    return summary
+
+
+def main():
+    if "--afterstates" in sys.argv:
+        compare_afterstates()
+    else:
+        compare_td_updates()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# Hogwild-style multi-process Q-learning for Tic-Tac-Toe.
+#
+# TemporalDifference keeps its Q table in a private dict, so training uses one core. Here the Q table is
+# a dense (3**9, 9) float64 array in multiprocessing.shared_memory, indexed by encode_state_key(state).
+# N worker processes each play their own episodes and update the shared array without any locks.
+# Updates can occasionally overwrite each other. Q-learning tolerates that, and skipping the locks is
+# what lets the throughput scale with the number of cores.
+#
+# Each worker does the same one-step Q-learning update as TemporalDifference (mode="q"), on a flat board
+# of digits instead of SingleTic objects. Q values are from X's perspective: X maximizes, O minimizes.
+
+import os
+import random
+import time
+from multiprocessing import Process, shared_memory
+
+import numpy as np
+
+from backend.rl.single_tic import WINNING_LINES, decode_state_key
+
+
+NUM_CODES = 3 ** 9
+NUM_ACTIONS = 9
+POWERS = [3 ** i for i in range(9)]
+
+
+def _winner(cells):
+    for a, b, c in WINNING_LINES:
+        if cells[a] and cells[a] == cells[b] == cells[c]:
+            return cells[a]
+    return 0
+
+
+def _worker(q_name, visited_name, episodes, seed, epsilon, alpha, gamma):
+    q_memory = shared_memory.SharedMemory(name=q_name)
+    visited_memory = shared_memory.SharedMemory(name=visited_name)
+    q = q_memory.buf.cast('d')
+    try:
+        _run_episodes(q, visited_memory.buf, episodes, seed, epsilon, alpha, gamma)
+    finally:
+        # The cast view must be released first, or close() fails and hides the worker's own error
+        q.release()
+        q_memory.close()
+        visited_memory.close()
+
+
+def _run_episodes(q, visited, episodes, seed, epsilon, alpha, gamma):
+    # q is a flat memoryview of doubles: Q(code, action) lives at q[code * 9 + action]
+    rng = random.Random(seed)
+
+    def greedy(code, valid_actions, player):
+        base = code * NUM_ACTIONS
+        best_action = valid_actions[0]
+        best_value = q[base + best_action]
+        for action in valid_actions[1:]:
+            value = q[base + action]
+            if (value > best_value) if player == 1 else (value < best_value):
+                best_action, best_value = action, value
+        return best_action, best_value
+
+    for _ in range(episodes):
+        cells = [0] * 9
+        code = 0
+        player = 1 # 1 is X, 2 is O
+
+        while True:
+            valid_actions = [i for i in range(9) if cells[i] == 0]
+            if rng.random() < epsilon:
+                action = rng.choice(valid_actions)
+            else:
+                action, _ = greedy(code, valid_actions, player)
+
+            cells[action] = player
+            next_code = code + player * POWERS[action]
+            winner = _winner(cells)
+            next_actions = [i for i in range(9) if cells[i] == 0]
+
+            if winner or not next_actions:
+                td_target = 1.0 if winner == 1 else -1.0 if winner == 2 else 0.0
+            else:
+                _, next_value = greedy(next_code, next_actions, 3 - player)
+                td_target = gamma * next_value
+
+            index = code * NUM_ACTIONS + action
+            q[index] += alpha * (td_target - q[index])
+            visited[code] = 1
+
+            if winner or not next_actions:
+                break
+            code = next_code
+            player = 3 - player
+
+
+class HogwildTemporalDifference:
+    def __init__(self, epsilon=0.2, alpha=0.1, gamma=0.9, workers=None):
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.gamma = gamma
+        self.workers = workers or os.cpu_count() or 1
+        self.policy = {}
+        self.episodes_per_sec = 0.0
+
+    def train_full(self, iterations=200000, verbose=True, seed=0):
+        q_memory = shared_memory.SharedMemory(create=True, size=NUM_CODES * NUM_ACTIONS * 8)
+        visited_memory = shared_memory.SharedMemory(create=True, size=NUM_CODES)
+        try:
+            q = np.ndarray((NUM_CODES, NUM_ACTIONS), dtype=np.float64, buffer=q_memory.buf)
+            visited = np.ndarray((NUM_CODES,), dtype=np.uint8, buffer=visited_memory.buf)
+            q[:] = 0.0
+            visited[:] = 0
+
+            # Split the episodes as evenly as possible between the workers
+            shares = [iterations // self.workers + (i < iterations % self.workers) for i in range(self.workers)]
+            processes = [
+                Process(target=_worker, args=(q_memory.name, visited_memory.name, share, seed + i,
+                                              self.epsilon, self.alpha, self.gamma))
+                for i, share in enumerate(shares)
+            ]
+
+            start = time.perf_counter()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - start
+
+            # A worker that died left the shared table partly trained: fail instead of saving it
+            failed = [(i, process.exitcode) for i, process in enumerate(processes) if process.exitcode != 0]
+            if failed:
+                raise RuntimeError("Hogwild workers failed (worker, exit code): "
+                                   + ", ".join(f"{i}: {code}" for i, code in failed))
+            self.episodes_per_sec = iterations / elapsed if elapsed > 0 else float('inf')
+
+            if verbose:
+                print(f"{iterations} episodes on {self.workers} workers in {elapsed:.2f}s "
+                      f"({self.episodes_per_sec:.0f} episodes/sec)")
+
+            self.extract_policy(q, visited)
+            del q, visited # Release the views before closing the shared memory
+        finally:
+            q_memory.close()
+            q_memory.unlink()
+            visited_memory.close()
+            visited_memory.unlink()
+
+        return self.policy
+
+    def extract_policy(self, q, visited):
+        # Greedy action for every state a worker updated, read straight from the shared array
+        self.policy = {}
+        for code in np.flatnonzero(visited).tolist():
+            state_key = decode_state_key(code)
+            valid_actions = [i for i in range(9) if state_key[i // 3][i % 3] is None]
+            q_values = q[code, valid_actions]
+            x_count = sum(row.count('X') for row in state_key)
+            o_count = sum(row.count('O') for row in state_key)
+            if x_count == o_count:
+                best_idx = np.argmax(q_values)
+            else:
+                best_idx = np.argmin(q_values)
+            self.policy[state_key] = valid_actions[best_idx]
+        return self.policy
+
+
+def benchmark_scaling(iterations=100000, max_workers=None):
+    """Episodes/sec and policy quality for 1, 2, 4, ... workers on the same number of episodes"""
+    from backend.rl.exploitability import solve_game, optimal_move_rate
+
+    max_workers = max_workers or os.cpu_count() or 1
+    values = solve_game()
+    counts = []
+    workers = 1
+    while workers <= max_workers:
+        counts.append(workers)
+        workers *= 2
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+
+    results = {}
+    print("=" * 40)
+    for workers in counts:
+        td = HogwildTemporalDifference(workers=workers)
+        policy = td.train_full(iterations, verbose=False)
+        results[workers] = (td.episodes_per_sec, optimal_move_rate(policy, values))
+        speedup = td.episodes_per_sec / results[counts[0]][0]
+        print(f"{workers:>3} workers: {td.episodes_per_sec:>10.0f} episodes/sec ({speedup:.2f}x), "
+              f"optimal move rate {results[workers][1]:.3f}")
+    print("=" * 40)
+    return results
+
+
+def main():
+    benchmark_scaling()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,16 @@ import numpy as np
 from backend.helpers import position_to_coordinates
 import random
 from backend.rl.single_tic import SingleTic
+from backend.rl import instrument
+from backend.rl.model_free.afterstates import afterstate, decision_states
 
 
 # Monte Carlo Method for Tic-Tac-Toe
+# afterstates=True learns a value per post-move board instead of per (state, action) pair (see afterstates.py)
 class MonteCarlo:
-    def __init__(self, epsilon=0.1, alpha=0.1, gamma=0.9):
+    def __init__(self, epsilon=0.1, alpha=0.1, gamma=0.9, afterstates=False):
         self.game = SingleTic()
+        self.afterstates = afterstates
         self._initialize_Q_values()
         self.policy = {}  # Current policy
         self.episode_history = []
@@ -23,14 +27,16 @@ class MonteCarlo:
         # Let's initialize an empty Q table, which we will populate as we encounter episodes.
         self.Q = {} # Q(s,a) values - our main learning target. this is from X's perspective!
         self.returns = {}  # For storing returns for each (s,a) pair
+        self.V = {} # V(s') values for afterstates=True, keyed by the board after the move, also from X's perspective
     
     
     def train(self, num_episodes=200000, verbose=True):
 
         x_wins, o_wins, draws = 0, 0, 0
         for episode_count in range(num_episodes):
-            episode, final_reward = self.generate_episode()
-            self.update_Q_values(episode, final_reward)
+            with instrument.span("episode"):
+                episode, final_reward = self.generate_episode()
+                self.update_Q_values(episode, final_reward)
 
             
             if final_reward == 1:
@@ -44,16 +50,21 @@ class MonteCarlo:
             self.episode_count += 1
 
             
+            if (episode_count + 1) % 1000 == 0:
+                instrument.record_memory("mc.V" if self.afterstates else "mc.Q", self.V if self.afterstates else self.Q)
+
             if (episode_count + 1) % 1000 == 0 and verbose:
                 total = episode_count + 1
                 print(f"Episode {total}: X:{x_wins/total:.2%} O:{o_wins/total:.2%} D:{draws/total:.2%}")
         
-        self.extract_policy()
+        with instrument.span("extraction"):
+            self.extract_policy()
         return self.policy
 
 
     def extract_policy(self):
-        for state_key in self.Q:
+        states = decision_states(self.V) if self.afterstates else self.Q
+        for state_key in states:
             if state_key not in self.policy:
                 valid_actions = self.game.get_valid_actions(state_key)
                 current_player = self.game.get_current_player(state_key)
@@ -153,6 +164,8 @@ class MonteCarlo:
         
 
     def _get_Q_value(self, state_key, action):
+        if self.afterstates:
+            return self.V.get(afterstate(state_key, action), 0.0)
         if state_key not in self.Q:
             self.Q[state_key] = {}
             for action in self.game.get_valid_actions(state_key):
@@ -160,6 +173,9 @@ class MonteCarlo:
         return self.Q[state_key][action]
     
     def _set_Q_value(self, state_key, action, value):
+        if self.afterstates:
+            self.V[afterstate(state_key, action)] = value
+            return
         if state_key not in self.Q:
             self.Q[state_key] = {}
         self.Q[state_key][action] = value
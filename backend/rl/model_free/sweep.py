@@ -0,0 +1,206 @@
+# Parallel hyperparameter sweeps for MonteCarlo and TemporalDifference, with successive halving.
+#
+# Every configuration starts with a small episode budget. After each rung, all surviving
+# configurations are scored against the perfect-play reference (exploitability.optimal_move_rate).
+# Only the best 1/eta continue, each with eta times the budget. Learners are sent back and forth
+# between the worker processes, so training resumes where it stopped instead of starting over.
+#
+#   python -m backend sweep td --trials 27 --min-episodes 2000 --max-episodes 54000 --output sweep.csv
+
+import csv
+import itertools
+import math
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from backend.rl.exploitability import solve_game, optimal_move_rate
+from backend.rl.model_free.benchmarks import current_policy, train_episodes
+
+
+# Default search spaces: a list is a grid of choices, a (low, high) tuple is sampled log-uniformly
+# (random search) or split into log-spaced points (grid search)
+SEARCH_SPACES = {
+    'mc': {'epsilon': (0.02, 0.5), 'alpha': (0.01, 0.5), 'gamma': [0.8, 0.9, 0.95, 1.0]},
+    'td': {'epsilon': (0.02, 0.5), 'alpha': (0.01, 0.5), 'gamma': [0.8, 0.9, 0.95, 1.0],
+           'mode': ['q', 'nstep', 'watkins']},
+}
+
+# Perfect-play values, computed once per worker process
+_VALUES = None
+
+
+def make_learner(algorithm, params):
+    if algorithm == 'mc':
+        from backend.rl.model_free.monte_carlo import MonteCarlo
+        return MonteCarlo(**params)
+    elif algorithm == 'td':
+        from backend.rl.model_free.temporal_diff import TemporalDifference
+        return TemporalDifference(**params)
+    raise ValueError(f"Unknown algorithm '{algorithm}', expected 'mc' or 'td'")
+
+
+def grid_points(low, high, points):
+    """`points` log-spaced values from low to high, both included"""
+    if points < 1:
+        raise ValueError("A grid needs at least one point per range")
+    if points == 1:
+        return [round(math.sqrt(low * high), 4)]
+    ratio = (high / low) ** (1 / (points - 1))
+    return [round(low * ratio ** i, 4) for i in range(points)]
+
+
+def grid_configs(space, points=3):
+    """Every combination of a search space: lists as they are, (low, high) ranges as `points` log-spaced values"""
+    choices = {name: values if isinstance(values, list) else grid_points(*values, points)
+               for name, values in space.items()}
+    names = list(choices)
+    return [dict(zip(names, values)) for values in itertools.product(*(choices[name] for name in names))]
+
+
+def random_configs(space, trials, seed=0):
+    """`trials` random configurations: list entries are chosen uniformly, (low, high) log-uniformly"""
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(trials):
+        config = {}
+        for name, choices in space.items():
+            if isinstance(choices, list):
+                config[name] = rng.choice(choices)
+            else:
+                low, high = choices
+                config[name] = round(math.exp(rng.uniform(math.log(low), math.log(high))), 4)
+        configs.append(config)
+    return configs
+
+
+def _advance(task):
+    # Runs inside a worker: train one configuration up to its next budget and score it
+    global _VALUES
+    if _VALUES is None:
+        _VALUES = solve_game()
+
+    trial, algorithm, params, learner, episodes, seed = task
+    if learner is None:
+        learner = make_learner(algorithm, params)
+
+    random.seed(seed)
+    start = time.perf_counter()
+    train_episodes(learner, episodes)
+    seconds = time.perf_counter() - start
+
+    # MonteCarlo keeps every episode it has played, which we don't need to ship back
+    if hasattr(learner, "episode_history"):
+        learner.episode_history = []
+
+    score = optimal_move_rate(current_policy(learner), _VALUES)
+    return trial, learner, score, seconds
+
+
+def successive_halving(algorithm, configs, min_episodes=2000, max_episodes=54000, eta=3, seed=0,
+                       processes=None, verbose=True):
+    """
+    Run successive halving over a list of parameter dicts. Returns one result row per configuration,
+    with its score after every rung it took part in.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    rows = [{'trial': i, 'algorithm': algorithm, **config, 'episodes': 0, 'seconds': 0.0,
+             'scores': [], 'stopped_at_rung': None} for i, config in enumerate(configs)]
+    learners = {i: None for i in range(len(configs))}
+    alive = list(range(len(configs)))
+
+    budget = min_episodes
+    rung = 0
+    with Pool(processes) as pool:
+        while alive:
+            tasks = []
+            for i in alive:
+                episodes = budget - rows[i]['episodes']
+                tasks.append((i, algorithm, configs[i], learners[i], episodes, seed + 1000 * i + rung))
+
+            for i, learner, score, seconds in pool.imap_unordered(_advance, tasks):
+                learners[i] = learner
+                rows[i]['episodes'] = budget
+                rows[i]['seconds'] += seconds
+                rows[i]['scores'].append(score)
+
+            alive.sort(key=lambda i: -rows[i]['scores'][-1])
+            if verbose:
+                best = rows[alive[0]]
+                print(f"Rung {rung}: {len(alive)} configs at {budget} episodes, "
+                      f"best {best['scores'][-1]:.3f} (trial {best['trial']})")
+
+            if budget >= max_episodes or len(alive) == 1:
+                break
+
+            keep = max(1, len(alive) // eta)
+            for i in alive[keep:]:
+                rows[i]['stopped_at_rung'] = rung
+                learners[i] = None
+            alive = alive[:keep]
+            budget = min(max_episodes, budget * eta)
+            rung += 1
+
+    for row in rows:
+        row['score'] = row['scores'][-1]
+    rows.sort(key=lambda row: (-row['episodes'], -row['score']))
+    return rows
+
+
+def write_results(rows, path):
+    columns = ['trial', 'algorithm'] + sorted({key for row in rows for key in row} -
+                                              {'trial', 'algorithm', 'scores', 'score', 'episodes', 'seconds',
+                                               'stopped_at_rung'})
+    columns += ['episodes', 'seconds', 'score', 'stopped_at_rung', 'scores']
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**row, 'seconds': f"{row['seconds']:.2f}", 'score': f"{row['score']:.4f}",
+                             'scores': " ".join(f"{score:.4f}" for score in row['scores'])})
+
+
+def print_results(rows, limit=10):
+    print("=" * 40)
+    print("SWEEP RESULTS (best first)")
+    for row in rows[:limit]:
+        params = {key: value for key, value in row.items()
+                  if key not in ('trial', 'algorithm', 'scores', 'score', 'episodes', 'seconds', 'stopped_at_rung')}
+        status = "finished" if row['stopped_at_rung'] is None else f"stopped at rung {row['stopped_at_rung']}"
+        print(f"  trial {row['trial']:>3} score {row['score']:.3f} after {row['episodes']:>6} episodes  {params}  ({status})")
+    print("=" * 40)
+
+
+def run_sweep(algorithm, search="random", trials=27, space=None, min_episodes=2000, max_episodes=54000,
+              eta=3, seed=0, processes=None, output=None, points=3):
+    space = space or SEARCH_SPACES[algorithm]
+    if search == "grid":
+        configs = grid_configs(space, points)
+    elif search == "random":
+        configs = random_configs(space, trials, seed)
+    else:
+        raise ValueError(f"Unknown search '{search}', expected 'grid' or 'random'")
+
+    start = time.perf_counter()
+    rows = successive_halving(algorithm, configs, min_episodes, max_episodes, eta, seed, processes)
+    print_results(rows)
+
+    total_episodes = sum(row['episodes'] for row in rows)
+    print(f"{len(configs)} configs, {total_episodes} episodes in {time.perf_counter() - start:.1f}s "
+          f"(vs {len(configs) * max_episodes} episodes to train every config fully)")
+
+    if output:
+        write_results(rows, output)
+        print(f"Wrote {output}")
+    return rows
+
+
+def main():
+    run_sweep('td', trials=9, min_episodes=1000, max_episodes=9000, output="sweep.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,29 @@ import numpy as np
 from backend.helpers import position_to_coordinates
 import random
 from backend.rl.single_tic import SingleTic
+from backend.rl import instrument
+from backend.rl.model_free.afterstates import afterstate, decision_states
 
 
 # Temporal Difference Learning for Tic-Tac-Toe. Using the Q Learning method
+#
+# mode="q" is one-step Q-learning. The terminal reward moves back one step per visit, so it takes many
+# episodes to reach the opening moves. Two multi-step modes propagate it further per episode:
+#   mode="nstep":    n-step Q-learning. Returns look up to n_steps moves ahead, and are cut short at an
+#                    exploratory move, since what follows it says nothing about the greedy policy.
+#   mode="watkins":  Watkins's Q(lambda). A sparse dict of eligibility traces, decayed by gamma * lambda
+#                    after greedy moves and cleared after exploratory ones. Traces under trace_threshold
+#                    are dropped and at most max_traces are kept.
+# afterstates=True learns a value per post-move board instead of per (state, action) pair, for any mode
+# (see afterstates.py).
 class TemporalDifference:
-    def __init__(self, epsilon=0.2, alpha=0.1, gamma=0.9):
+    def __init__(self, epsilon=0.2, alpha=0.1, gamma=0.9, mode="q", n_steps=3, lam=0.8,
+                 trace_threshold=1e-3, max_traces=32, afterstates=False):
+        if mode not in ("q", "nstep", "watkins"):
+            raise ValueError(f"Unknown TD mode: {mode}")
+
         self.game = SingleTic()
+        self.afterstates = afterstates
         self._initialize_Q_values()
         
         # Hyperparameters
@@ -16,8 +33,15 @@ class TemporalDifference:
         self.gamma = gamma
         self.policy = {}
 
+        self.mode = mode
+        self.n_steps = n_steps
+        self.lam = lam
+        self.trace_threshold = trace_threshold
+        self.max_traces = max_traces
+
     def _initialize_Q_values(self):
         self.Q = {}
+        self.V = {} # afterstate -> value, used instead of Q when afterstates=True
 
 
     def q_learning_update(self, state_key, action, reward, next_state_key):
@@ -40,6 +64,11 @@ class TemporalDifference:
         self._set_Q_value(state_key, action, new_q_value)
 
     def train_episode(self):
+        if self.mode == "nstep":
+            return self._train_episode_nstep()
+        elif self.mode == "watkins":
+            return self._train_episode_watkins()
+
         new_game = SingleTic()
         
         while new_game.game_result() is None:
@@ -62,6 +91,91 @@ class TemporalDifference:
         
         return new_game.game_result()
 
+    def _greedy_value(self, state_key):
+        # max_a Q(s,a) for X, min_a Q(s,a) for O
+        q_values = [self._get_Q_value(state_key, a) for a in self.game.get_valid_actions(state_key)]
+        if self.game.get_current_player(state_key) == 'X':
+            return max(q_values)
+        return min(q_values)
+
+    def _choose_action(self, state_key):
+        # Same choice as get_action, also telling whether the move was exploratory (not greedy)
+        action = self.get_action(state_key)
+        return action, self._get_Q_value(state_key, action) != self._greedy_value(state_key)
+
+    def _train_episode_nstep(self):
+        new_game = SingleTic()
+        states, actions, exploratory = [], [], []
+
+        while new_game.game_result() is None:
+            state_key = new_game.get_state_key()
+            action, explored = self._choose_action(state_key)
+            new_game.make_move(action, new_game.get_current_player(state_key))
+            states.append(state_key)
+            actions.append(action)
+            exploratory.append(explored)
+
+        final_reward = self.get_reward(new_game.get_state_key())
+        last = len(states) - 1
+
+        # Work backwards, so each update already sees the updates made closer to the end of the game
+        for t in reversed(range(len(states))):
+            # The only reward is the final one, so the return is either the discounted final reward
+            # (the game ends within n greedy moves) or the discounted greedy value of the state we stop at
+            k = t
+            discount = 1.0
+            while True:
+                if k == last:
+                    target = discount * final_reward
+                    break
+                if k - t + 1 == self.n_steps or exploratory[k + 1]:
+                    target = discount * self.gamma * self._greedy_value(states[k + 1])
+                    break
+                discount *= self.gamma
+                k += 1
+
+            current_q_value = self._get_Q_value(states[t], actions[t])
+            self._set_Q_value(states[t], actions[t], current_q_value + self.alpha * (target - current_q_value))
+
+        return new_game.game_result()
+
+    def _train_episode_watkins(self):
+        new_game = SingleTic()
+        traces = {} # (state_key, action) -> eligibility, only for pairs visited since the last exploratory move
+
+        state_key = new_game.get_state_key()
+        action, _ = self._choose_action(state_key)
+
+        while True:
+            new_game.make_move(action, new_game.get_current_player(state_key))
+            next_state_key = new_game.get_state_key()
+            done = new_game.game_result() is not None
+
+            if done:
+                td_error = self.get_reward(next_state_key) - self._get_Q_value(state_key, action)
+            else:
+                next_action, explored = self._choose_action(next_state_key)
+                td_error = self.gamma * self._greedy_value(next_state_key) - self._get_Q_value(state_key, action)
+
+            # Replacing traces: the pair just taken gets full credit
+            traces.pop((state_key, action), None)
+            traces[(state_key, action)] = 1.0
+            for (s, a), eligibility in traces.items():
+                self._set_Q_value(s, a, self._get_Q_value(s, a) + self.alpha * td_error * eligibility)
+
+            if done:
+                return new_game.game_result()
+
+            if explored:
+                traces.clear()
+            else:
+                decay = self.gamma * self.lam
+                traces = {pair: e * decay for pair, e in traces.items() if e * decay >= self.trace_threshold}
+                while len(traces) > self.max_traces:
+                    del traces[next(iter(traces))] # Oldest pair, which also has the smallest trace
+
+            state_key, action = next_state_key, next_action
+
     def get_reward(self, state_key):
         game = SingleTic(self.game.game_state_to_grid(state_key))
         result = game.game_result()
@@ -78,7 +192,8 @@ class TemporalDifference:
     def train_full(self, iterations=200000, verbose=True):
         x_wins, o_wins, draws = 0, 0, 0
         for i in range(iterations):
-            game_result = self.train_episode()
+            with instrument.span("episode"):
+                game_result = self.train_episode()
             
             # For logging
             if game_result == 'X':
@@ -88,16 +203,21 @@ class TemporalDifference:
             else:
                 draws += 1
 
+            if (i + 1) % 1000 == 0:
+                instrument.record_memory("td.V" if self.afterstates else "td.Q", self.V if self.afterstates else self.Q)
+
             # Print progress every 100 episodes
             if (i + 1) % 100 == 0 and verbose:
                 total = i + 1
                 print(f"Episode {total}: X:{x_wins/total:.2%} O:{o_wins/total:.2%} D:{draws/total:.2%}")
        
-        self.extract_policy()
+        with instrument.span("extraction"):
+            self.extract_policy()
         return self.policy
 
     def extract_policy(self):
-        for state_key in self.Q:
+        states = decision_states(self.V) if self.afterstates else self.Q
+        for state_key in states:
             if state_key not in self.policy:
                 valid_actions = self.game.get_valid_actions(state_key)
                 current_player = self.game.get_current_player(state_key)
@@ -136,6 +256,8 @@ class TemporalDifference:
         
 
     def _get_Q_value(self, state_key, action):
+        if self.afterstates:
+            return self.V.get(afterstate(state_key, action), 0.0)
         if state_key not in self.Q:
             self.Q[state_key] = {}
             for action in self.game.get_valid_actions(state_key):
@@ -143,6 +265,9 @@ class TemporalDifference:
         return self.Q[state_key][action]
     
     def _set_Q_value(self, state_key, action, value):
+        if self.afterstates:
+            self.V[afterstate(state_key, action)] = value
+            return
         if state_key not in self.Q:
             self.Q[state_key] = {}
         self.Q[state_key][action] = value
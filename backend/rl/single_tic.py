@@ -1,7 +1,55 @@
 import numpy as np
 from backend.helpers import position_to_coordinates
+from backend.rl import instrument
+from backend.gamelog import SINGLE
 import random
 
+# All 8 winning lines, as indices into a flattened 3x3 grid
+WINNING_LINES = [
+    (0, 1, 2), (3, 4, 5), (6, 7, 8), # rows
+    (0, 3, 6), (1, 4, 7), (2, 5, 8), # columns
+    (0, 4, 8), (2, 4, 6)             # diagonals
+]
+
+
+def state_result(state_key):
+    """
+    Same answer as SingleTic(grid).game_result() for a state key ('X', 'O', 'D' or None),
+    but without building a numpy array. Used by the headless tools that evaluate many states.
+    """
+    cells = state_key[0] + state_key[1] + state_key[2]
+    for a, b, c in WINNING_LINES:
+        if cells[a] is not None and cells[a] == cells[b] == cells[c]:
+            return cells[a]
+    if None not in cells:
+        return 'D'
+    return None
+
+
+def encode_state_key(state_key):
+    """
+    State key -> integer in [0, 3**9): cell i (row * 3 + col) contributes 0 if empty, 1 * 3**i for X
+    and 2 * 3**i for O. Used wherever states index into flat arrays instead of dicts.
+    """
+    code = 0
+    for i, cell in enumerate(state_key[0] + state_key[1] + state_key[2]):
+        if cell == 'X':
+            code += 3 ** i
+        elif cell == 'O':
+            code += 2 * 3 ** i
+    return code
+
+
+def decode_state_key(code):
+    """Inverse of encode_state_key"""
+    symbols = (None, 'X', 'O')
+    cells = []
+    for _ in range(9):
+        code, digit = divmod(code, 3)
+        cells.append(symbols[digit])
+    return (tuple(cells[0:3]), tuple(cells[3:6]), tuple(cells[6:9]))
+
+
 class SingleTic:
     def __init__(self, grid=None):
         if grid is None:
@@ -20,7 +68,7 @@ class SingleTic:
         assert current_player in ['X', 'O']
         row, col = position_to_coordinates(grid_index)
         if self.grid[row][col] is not None:
-            print("Cell already taken, not making move.")
+            raise ValueError(f"Cell {grid_index} is already taken")
         self.grid[row][col] = current_player
 
     def game_result(self):
@@ -95,7 +143,8 @@ class SingleTic:
                     generate_recursive(new_grid, next_player)
 
         empty_grid = [[None for _ in range(3)] for _ in range(3)]
-        generate_recursive(empty_grid, 'X')
+        with instrument.span("enumeration"):
+            generate_recursive(empty_grid, 'X')
         return all_states
     
     def get_current_player(self, state_key):
@@ -112,9 +161,10 @@ class SingleTic:
             raise ValueError(f"Invalid game state: X={x_count}, O={o_count}")
 
     @classmethod
-    def simulate_game(cls, policy):
+    def simulate_game(cls, policy, log=None):
         """
-        Interactive game where human plays against the optimal AI policy
+        Interactive game where human plays against the optimal AI policy.
+        Every finished game is appended to `log` (a gamelog.GameLog) if one is given.
         """
         print("Welcome to Tic-Tac-Toe vs Optimal AI!")
         print("="*40)
@@ -197,6 +247,7 @@ class SingleTic:
         
         # Initialize game and start playing
         game = cls()
+        moves = []
         print_board(game.grid)
         
         # Game loop
@@ -215,11 +266,14 @@ class SingleTic:
                 else:
                     print("No valid moves available!")
                     break
+            moves.append(move)
             
             print_board(game.grid)
         
         # Announce the result
         result = game.game_result()
+        if log is not None:
+            log.write(SINGLE, moves, result)
         print("="*40)
         print("GAME OVER!")
         
@@ -240,7 +294,7 @@ class SingleTic:
             play_again = input("Want to play again? (y/n): ").lower().strip()
             if play_again in ['y', 'yes']:
                 print("\n" + "="*50 + "\n")
-                return cls.simulate_game(policy)  # Recursive call for new game
+                return cls.simulate_game(policy, log)  # Recursive call for new game
             elif play_again in ['n', 'no']:
                 print("Thanks for playing!")
                 return result
@@ -248,10 +302,11 @@ class SingleTic:
                 print("Please enter y or n")
 
     @classmethod
-    def simulate_ai_game(cls, policy_X, policy_O):
+    def simulate_ai_game(cls, policy_X, policy_O, log=None):
         """
         Simulate a game between two AI policies: policy_X (for 'X') and policy_O (for 'O').
         Logs each move and the final result, indicating which policy is making each move.
+        The game is also appended to `log` (a gamelog.GameLog) if one is given.
         """
         print("AI vs AI Tic-Tac-Toe!")
         print("="*40)
@@ -299,6 +354,7 @@ class SingleTic:
 
         # Initialize game
         game = cls()
+        moves = []
         print_board(game.grid)
 
         # Game loop
@@ -310,6 +366,7 @@ class SingleTic:
                 move = get_ai_move(game, policy_O, "Policy O (O)")
             if move is not None:
                 game.make_move(move, current_player)
+                moves.append(move)
             else:
                 print("No valid moves available!")
                 break
@@ -317,6 +374,8 @@ class SingleTic:
 
         # Announce the result
         result = game.game_result()
+        if log is not None:
+            log.write(SINGLE, moves, result)
         print("="*40)
         print("GAME OVER!")
         if result == 'X':
@@ -0,0 +1,410 @@
+# A small JSON-over-HTTP server that serves moves from a trained tic-tac-toe policy.
+#
+#   GET  /health  -> {"status": "ok"}, plus the policy version when serving a watched directory
+#   POST /move    {"board": [["X", null, null], [null, "O", null], [null, null, null]]}
+#                 -> {"move": 2, "player": "X", "fallback": false}
+#                 The policy is either fixed or the newest version published to a watched directory
+#                 (see policy_store.py), swapped in between requests without a restart.
+#   WS   /analyze {"type": "analyze", "position": {...}, "deadline_ms": 2000, "interval_ms": 100}
+#                 -> {"type": "update", "best_move": 40, "value": 0.56, "pv": [...], "visits": {...}, ...}
+#                    every interval, then {"type": "done", ...} at the deadline or after {"type": "cancel"}
+#                 The position is an Ultimate game in the frontend's shape (see Position.from_json).
+#                 Sending a new "analyze" replaces the running search. With an opening book
+#                 (serve(book=...)), book positions get a single "done" at once, with "book": true.
+#   POST /games        {}                               -> new Ultimate game: {"game_id": ..., "cells": [...], ...}
+#   POST /games/move   {"game_id": ..., "move": 40}     -> the game after the move (grid * 9 + position)
+#   POST /games/state  {"game_id": ...}                 -> the game as it is
+#                 Unknown or expired games are a 404, illegal moves a 400.
+#
+# Uses only the standard library, with one thread per connection and keep-alive enabled. WebSocket
+# support is the minimal part of RFC 6455 the analysis stream needs: text frames, ping/pong and close.
+
+import base64
+import hashlib
+import json
+import os
+import random
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.rl.single_tic import state_result
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_MESSAGE_BYTES = 1 << 20
+MAX_DEADLINE_MS = 60000
+MIN_INTERVAL_MS = 20
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+def parse_board(board):
+    """Validate a 3x3 JSON board and turn it into a state key"""
+    if not isinstance(board, list) or len(board) != 3:
+        raise BadRequest("Board must be a list of 3 rows")
+    for row in board:
+        if not isinstance(row, list) or len(row) != 3:
+            raise BadRequest("Each row must have 3 cells")
+        for cell in row:
+            if cell not in ('X', 'O', None):
+                raise BadRequest("Cells must be 'X', 'O' or null")
+
+    state_key = tuple(tuple(row) for row in board)
+    x_count = sum(row.count('X') for row in state_key)
+    o_count = sum(row.count('O') for row in state_key)
+    if x_count not in (o_count, o_count + 1):
+        raise BadRequest(f"Invalid game state: X={x_count}, O={o_count}")
+    return state_key
+
+
+class WebSocket:
+    """Server side of a WebSocket connection, on the handler's socket files"""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.lock = threading.Lock()  # The search thread and the reading thread both send
+        self.closed = False
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("WebSocket is closed")
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+
+    def send_json(self, payload):
+        self._send_frame(0x1, json.dumps(payload).encode())
+
+    def close(self, code=1000):
+        if not self.closed:
+            try:
+                self._send_frame(0x8, struct.pack("!H", code))
+            except OSError:
+                pass
+            self.closed = True
+
+    def _read(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError("Connection closed mid-frame")
+        return data
+
+    def receive(self):
+        """Next text message, or None once the connection is closed"""
+        message = b""
+        while True:
+            first, second = self._read(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._read(8))[0]
+            if len(message) + length > MAX_MESSAGE_BYTES:
+                self.close(1009)
+                return None
+            mask = self._read(4) if second & 0x80 else None
+            payload = self._read(length)
+            if mask:
+                payload = bytes(byte ^ mask[i & 3] for i, byte in enumerate(payload))
+
+            if opcode == 0x8:
+                self.close()
+                return None
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            message += payload
+            if first & 0x80:
+                return message.decode("utf-8", errors="replace")
+
+
+class PolicyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, policy, host="127.0.0.1", port=8000, sessions=None, reloader=None, book=None):
+        from backend.sessions import SessionStore
+
+        self.policy = policy
+        self.reloader = reloader
+        self.book = book
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self.routes = {
+            ('GET', '/health'): self.handle_health,
+            ('POST', '/move'): self.handle_move,
+            ('POST', '/games'): self.handle_new_game,
+            ('POST', '/games/move'): self.handle_game_move,
+            ('POST', '/games/state'): self.handle_game_state,
+        }
+        self.websocket_routes = {
+            '/analyze': self.handle_analyze,
+        }
+        super().__init__((host, port), RequestHandler)
+
+    def handle_health(self, body):
+        if self.reloader is not None:
+            return 200, {'status': 'ok', 'policy': self.reloader.stats()}
+        return 200, {'status': 'ok'}
+
+    def handle_move(self, body):
+        if self.reloader is not None:
+            # The request keeps the version it started with, even if a new one is swapped in meanwhile
+            with self.reloader.acquire() as policy:
+                return self._move(policy, body)
+        return self._move(self.policy, body)
+
+    def _move(self, policy, body):
+        state_key = parse_board(body.get('board'))
+        if state_result(state_key) is not None:
+            raise BadRequest("Game is already over")
+
+        x_count = sum(row.count('X') for row in state_key)
+        o_count = sum(row.count('O') for row in state_key)
+        player = 'X' if x_count == o_count else 'O'
+        valid_actions = [i for i in range(9) if state_key[i // 3][i % 3] is None]
+
+        move = policy.get(state_key)
+        fallback = move not in valid_actions
+        if fallback:
+            move = random.choice(valid_actions)
+        return 200, {'move': move, 'player': player, 'fallback': fallback}
+
+    def _game_id(self, body):
+        game_id = body.get('game_id')
+        if not isinstance(game_id, str):
+            raise BadRequest("game_id must be a string")
+        return game_id
+
+    def handle_new_game(self, body):
+        return 200, self.sessions.state(self.sessions.create())
+
+    def handle_game_move(self, body):
+        game_id = self._game_id(body)
+        move = body.get('move')
+        if not isinstance(move, int) or isinstance(move, bool):
+            raise BadRequest("move must be an integer (grid * 9 + position)")
+        try:
+            return 200, self.sessions.play(game_id, move)
+        except KeyError:
+            raise NotFound(f"No game {game_id}")
+        except ValueError as e:
+            raise BadRequest(str(e))
+
+    def handle_game_state(self, body):
+        game_id = self._game_id(body)
+        try:
+            return 200, self.sessions.state(game_id)
+        except KeyError:
+            raise NotFound(f"No game {game_id}")
+
+    def handle_analyze(self, websocket):
+        # Messages are read here, the search runs in its own thread so a cancel is seen right away
+        cancel, worker = None, None
+        try:
+            while True:
+                text = websocket.receive()
+                if text is None:
+                    break
+                try:
+                    message = json.loads(text)
+                    if not isinstance(message, dict):
+                        raise BadRequest("Messages must be JSON objects")
+                    if message.get('type') == 'cancel':
+                        if cancel is not None:
+                            cancel.set()
+                        continue
+                    if message.get('type') != 'analyze':
+                        raise BadRequest("Message type must be 'analyze' or 'cancel'")
+                    position, deadline, interval = parse_analysis(message)
+                except (BadRequest, json.JSONDecodeError) as e:
+                    websocket.send_json({'type': 'error', 'error': str(e)})
+                    continue
+
+                if worker is not None:
+                    cancel.set()
+                    worker.join()
+                cancel = threading.Event()
+                worker = threading.Thread(target=run_analysis,
+                                          args=(websocket, position, deadline, interval, cancel, self.book),
+                                          daemon=True)
+                worker.start()
+        finally:
+            if cancel is not None:
+                cancel.set()
+
+
+def parse_analysis(message):
+    """Validate an 'analyze' message: (position, deadline in seconds, update interval in seconds)"""
+    from backend.ultimate.position import Position
+
+    try:
+        position = Position.from_json(message.get('position'))
+    except ValueError as e:
+        raise BadRequest(str(e))
+    if position.result:
+        raise BadRequest("Game is already over")
+
+    deadline_ms, interval_ms = message.get('deadline_ms', 1000), message.get('interval_ms', 100)
+    for name, value in (('deadline_ms', deadline_ms), ('interval_ms', interval_ms)):
+        if not isinstance(value, (int, float)) or value <= 0:
+            raise BadRequest(f"{name} must be a positive number")
+    return position, min(deadline_ms, MAX_DEADLINE_MS) / 1000, max(interval_ms, MIN_INTERVAL_MS) / 1000
+
+
+def run_analysis(websocket, position, deadline, interval, cancel, book=None):
+    from backend.ultimate.mcts import analyze
+
+    def send(stats):
+        websocket.send_json({'type': 'done' if stats['done'] else 'update', **stats})
+
+    try:
+        stats = book.stats(position) if book is not None else None
+        if stats is not None:
+            # Searched offline, deeper than the deadline would allow
+            send({**stats, 'elapsed_ms': 0, 'done': True, 'cancelled': False})
+            return
+        analyze(position, deadline=deadline, interval=interval, on_update=send, cancel=cancel)
+    except OSError:
+        # The client went away, nobody is left to tell
+        cancel.set()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes. With Nagle's algorithm the body then waits for the
+    # client's delayed ACK, about 40ms per request on a keep-alive connection.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Keep the console quiet, request logging costs more than the request itself
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        route = self.server.routes.get((method, self.path.split('?')[0]))
+        if route is None:
+            self._send_json(404, {'error': f"No route for {method} {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            if not isinstance(body, dict):
+                raise BadRequest("Request body must be a JSON object")
+            status, payload = route(body)
+        except (BadRequest, json.JSONDecodeError) as e:
+            status, payload = 400, {'error': str(e)}
+        except NotFound as e:
+            status, payload = 404, {'error': str(e)}
+        self._send_json(status, payload)
+
+    def _upgrade(self):
+        route = self.server.websocket_routes.get(self.path.split('?')[0])
+        if route is None:
+            self._send_json(404, {'error': f"No WebSocket route for {self.path}"})
+            return
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not key:
+            self._send_json(400, {'error': "Missing Sec-WebSocket-Key"})
+            return
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        websocket = WebSocket(self.rfile, self.wfile)
+        try:
+            route(websocket)
+        except OSError:
+            pass
+        finally:
+            websocket.close()
+            self.close_connection = True
+
+    def do_GET(self):
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            self._upgrade()
+            return
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+
+def _snapshot_sessions(sessions, path, interval, stop):
+    # Periodic snapshots, so a crash loses at most `interval` seconds of games
+    while not stop.wait(interval):
+        sessions.expire_idle()
+        sessions.snapshot(path)
+
+
+def serve(policy, host="127.0.0.1", port=8000, max_sessions=10000, session_timeout=1800.0, snapshot=None,
+          snapshot_interval=60.0, watch=None, name="policy", watch_interval=1.0, book=None):
+    # With watch (a directory), `policy` is ignored and the newest published version of `name` is served.
+    # book is the path of an Ultimate opening book (see ultimate/opening_book.py) for /analyze.
+    from backend.sessions import SessionStore
+
+    sessions = SessionStore(max_sessions=max_sessions, idle_timeout=session_timeout)
+    stop = threading.Event()
+    if snapshot:
+        if os.path.exists(snapshot):
+            print(f"Restored {sessions.restore(snapshot)} games from {snapshot}")
+        threading.Thread(target=_snapshot_sessions, args=(sessions, snapshot, snapshot_interval, stop),
+                         daemon=True).start()
+
+    reloader = None
+    if watch:
+        from backend.policy_store import PolicyReloader
+
+        reloader = PolicyReloader(watch, name=name, interval=watch_interval).start()
+        print(f"Serving {name} v{reloader.version} from {watch}, watching for new versions")
+
+    opening_book = None
+    if book:
+        from backend.ultimate.opening_book import OpeningBook
+
+        opening_book = OpeningBook.open(book)
+        print(f"Opening book {book}: {len(opening_book.table)} positions, {opening_book.plies} plies")
+
+    server = PolicyServer(policy, host, port, sessions=sessions, reloader=reloader, book=opening_book)
+    print(f"Serving moves on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down")
+    finally:
+        stop.set()
+        if reloader is not None:
+            reloader.stop()
+        server.server_close()
+        if snapshot:
+            print(f"Saved {sessions.snapshot(snapshot)} games to {snapshot}")
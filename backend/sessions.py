@@ -0,0 +1,232 @@
+# Store for many simultaneous Ultimate tic-tac-toe games, one per player session.
+#
+# A MultiTic game is nine SingleTic objects with nested lists. Here the games live in preallocated
+# flat arrays (struct-of-arrays), one slot per live session:
+#   codes        9 sub-board codes per slot (see ultimate/tables.py), uint16
+#   macro        macro-board code (the results of the nine grids), int32
+#   forced       grid the next move must be in, -1 for any unfinished grid
+#   player       X or O to move, result EMPTY until the game ends, moves played
+#   last_active  time of the last access, for the idle timeout
+# That is 34 bytes per game, plus its entry in the id index. Grid results, legal moves and the game
+# result are table lookups on the codes, so checking a move builds no lists and copies nothing.
+#
+# Sessions are found by id through an OrderedDict (id -> slot) kept in least-recently-used order:
+# a lookup is O(1), the idle and least-recently-used sessions are at the front, and both
+# expiring idle sessions and evicting for room only pop from the front.
+#
+#   store = SessionStore(max_sessions=10000, idle_timeout=1800)
+#   game_id = store.create()
+#   store.play(game_id, 40)
+#   store.state(game_id)
+
+import os
+import pickle
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from backend.ultimate.tables import EMPTY, X, O, POW3, POW4, SUB_RESULT, SUB_MOVE_MASK, MACRO_RESULT
+
+
+SNAPSHOT_VERSION = 1
+SYMBOLS = (None, 'X', 'O', 'D')
+
+# Per move (grid * 9 + position): its grid, its position and its bit in a sub-board move mask
+GRID_OF = [move // 9 for move in range(81)]
+POSITION_OF = [move % 9 for move in range(81)]
+BIT_OF = [1 << (move % 9) for move in range(81)]
+
+
+class SessionStore:
+    def __init__(self, max_sessions=10000, idle_timeout=1800.0, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.codes = array('H', bytes(2 * 9 * max_sessions))
+        self.macro = array('i', bytes(4 * max_sessions))
+        self.forced = array('b', bytes(max_sessions))
+        self.player = array('b', bytes(max_sessions))
+        self.result = array('b', bytes(max_sessions))
+        self.moves = array('B', bytes(max_sessions))
+        self.last_active = array('d', bytes(8 * max_sessions))
+
+        self.slots = OrderedDict()  # session id -> slot, least recently used first
+        self.free = list(range(max_sessions - 1, -1, -1))
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, session_id):
+        return session_id in self.slots
+
+    def _expire_idle(self, now):
+        # Least recently used first, so we can stop at the first session that is still active
+        deadline = now - self.idle_timeout
+        while self.slots:
+            session_id, slot = next(iter(self.slots.items()))
+            if self.last_active[slot] > deadline:
+                break
+            self._remove(session_id)
+            self.expired += 1
+
+    def _remove(self, session_id):
+        self.free.append(self.slots.pop(session_id))
+
+    def _slot(self, session_id):
+        # Slot of a live session, marking it as just used. Raises KeyError for unknown or idle sessions.
+        now = self.clock()
+        self._expire_idle(now)
+        slot = self.slots[session_id]
+        self.slots.move_to_end(session_id)
+        self.last_active[slot] = now
+        return slot
+
+    def create(self, first_grid=4):
+        """Start a new game and return its session id. Evicts the least recently used game when full."""
+        with self.lock:
+            now = self.clock()
+            self._expire_idle(now)
+            if not self.free:
+                self._remove(next(iter(self.slots)))
+                self.evicted += 1
+
+            slot = self.free.pop()
+            base = slot * 9
+            for grid in range(9):
+                self.codes[base + grid] = 0
+            self.macro[slot] = 0
+            self.forced[slot] = -1 if first_grid is None else first_grid
+            self.player[slot] = X
+            self.result[slot] = EMPTY
+            self.moves[slot] = 0
+            self.last_active[slot] = now
+
+            session_id = secrets.token_hex(8)
+            self.slots[session_id] = slot
+            return session_id
+
+    def _is_legal(self, slot, move):
+        if self.result[slot] or not 0 <= move < 81:
+            return False
+        grid = GRID_OF[move]
+        forced = self.forced[slot]
+        if forced >= 0 and grid != forced:
+            return False
+        return SUB_MOVE_MASK[self.codes[slot * 9 + grid]] & BIT_OF[move] != 0
+
+    def is_legal(self, session_id, move):
+        with self.lock:
+            return self._is_legal(self._slot(session_id), move)
+
+    def play(self, session_id, move):
+        """Play a move for the player to move. Raises KeyError for an unknown session, ValueError if illegal."""
+        with self.lock:
+            slot = self._slot(session_id)
+            if not isinstance(move, int) or not self._is_legal(slot, move):
+                raise ValueError(f"Illegal move {move}")
+
+            grid, position = GRID_OF[move], POSITION_OF[move]
+            base = slot * 9
+            player = self.player[slot]
+            code = self.codes[base + grid] + player * POW3[position]
+            self.codes[base + grid] = code
+            sub_result = SUB_RESULT[code]
+            if sub_result:
+                self.macro[slot] += sub_result * POW4[grid]
+                self.result[slot] = MACRO_RESULT[self.macro[slot]]
+            self.forced[slot] = position if SUB_RESULT[self.codes[base + position]] == EMPTY else -1
+            self.player[slot] = O if player == X else X
+            self.moves[slot] += 1
+            return self._state(slot, session_id)
+
+    def _state(self, slot, session_id):
+        cells = []
+        sub_results = []
+        for grid in range(9):
+            code = self.codes[slot * 9 + grid]
+            sub_results.append(SYMBOLS[SUB_RESULT[code]])
+            for _ in range(9):
+                code, digit = divmod(code, 3)
+                cells.append(SYMBOLS[digit])
+        forced = self.forced[slot]
+        return {
+            'game_id': session_id,
+            'cells': cells,
+            'sub_results': sub_results,
+            'next_grid_index': None if forced < 0 else forced,
+            'current_player': SYMBOLS[self.player[slot]],
+            'result': SYMBOLS[self.result[slot]],
+            'moves': self.moves[slot],
+        }
+
+    def state(self, session_id):
+        """JSON-ready state of a game, in the same shape as Position.to_json plus the id and move count"""
+        with self.lock:
+            return self._state(self._slot(session_id), session_id)
+
+    def delete(self, session_id):
+        with self.lock:
+            if session_id in self.slots:
+                self._remove(session_id)
+
+    def expire_idle(self):
+        """Drop every session idle for longer than idle_timeout. Returns how many were dropped."""
+        with self.lock:
+            before = self.expired
+            self._expire_idle(self.clock())
+            return self.expired - before
+
+    def snapshot(self, path):
+        """Save every live session to path (atomically). Idle times survive a restart, the clock doesn't."""
+        with self.lock:
+            now = self.clock()
+            sessions = []
+            for session_id, slot in self.slots.items():
+                sessions.append((session_id, bytes(self.codes[slot * 9:slot * 9 + 9]), self.macro[slot],
+                                 self.forced[slot], self.player[slot], self.result[slot], self.moves[slot],
+                                 now - self.last_active[slot]))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({'version': SNAPSHOT_VERSION, 'sessions': sessions}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return len(sessions)
+
+    def restore(self, path):
+        """Load the sessions of a snapshot, oldest first. Returns how many were restored."""
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is a version {data.get('version')} snapshot, expected {SNAPSHOT_VERSION}")
+
+        with self.lock:
+            now = self.clock()
+            restored = 0
+            for session_id, codes, macro, forced, player, result, moves, idle in data['sessions']:
+                if idle >= self.idle_timeout or session_id in self.slots:
+                    continue
+                if not self.free:
+                    self._remove(next(iter(self.slots)))
+                    self.evicted += 1
+                slot = self.free.pop()
+                self.codes[slot * 9:slot * 9 + 9] = array('H', codes)
+                self.macro[slot] = macro
+                self.forced[slot] = forced
+                self.player[slot] = player
+                self.result[slot] = result
+                self.moves[slot] = moves
+                self.last_active[slot] = now - idle
+                self.slots[session_id] = slot
+                restored += 1
+            return restored
+
+    def stats(self):
+        with self.lock:
+            return {'sessions': len(self.slots), 'max_sessions': self.max_sessions,
+                    'evicted': self.evicted, 'expired': self.expired}
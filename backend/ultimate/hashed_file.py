@@ -0,0 +1,142 @@
+# A read-only hash table stored in a single file and memory-mapped, for O(1) lookups by 64-bit key.
+#
+# The file is an open-addressing table with linear probing, at most half full:
+#   header   magic, format version, capacity, count, value dtype, metadata length
+#   metadata JSON (what the table holds, how it was built)
+#   keys     capacity uint64 values, 0 marks an empty slot
+#   values   capacity values of the value dtype
+# A lookup hashes nothing: the key is already a random 64-bit Zobrist hash, so its low bits pick the
+# home slot directly. Opening a table maps the file and reads nothing else, so it is instant
+# and the pages are shared between every process that opens the same file.
+#
+#   HashedTable.write(path, keys, values, metadata={'kind': 'tablebase'})
+#   table = HashedTable.open(path)
+#   table.get(position.zobrist())
+
+import json
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = b"TTHT"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sIQQ8sI")
+MAX_LOAD = 0.5
+
+
+def _capacity(count):
+    capacity = 8
+    while capacity * MAX_LOAD < count:
+        capacity *= 2
+    return capacity
+
+
+def _place(keys, capacity):
+    # Slot of every key under linear probing, computed in vectorized rounds. A key that loses a round
+    # moves on to the next slot, and slots never empty again, so every key is still found by probing
+    # forward from its home slot.
+    mask = np.uint64(capacity - 1)
+    taken = np.zeros(capacity, dtype=bool)
+    slots = np.empty(len(keys), dtype=np.int64)
+    pending = np.arange(len(keys))
+    candidate = (keys & mask).astype(np.int64)
+    while len(pending):
+        free = ~taken[candidate]
+        # Among pending keys that want the same free slot, the first one wins it
+        _, first = np.unique(candidate, return_index=True)
+        winner = np.zeros(len(pending), dtype=bool)
+        winner[first] = True
+        winner &= free
+        slots[pending[winner]] = candidate[winner]
+        taken[candidate[winner]] = True
+        pending, candidate = pending[~winner], (candidate[~winner] + 1) & (capacity - 1)
+    return slots
+
+
+class HashedTable:
+    def __init__(self, path, keys, values, metadata):
+        self.path = path
+        self.keys = keys
+        self.values = values
+        self.metadata = metadata
+        self.mask = len(keys) - 1
+        self.count = int(metadata.get('count', 0))
+
+    @staticmethod
+    def write(path, keys, values, metadata=None):
+        """Write a table of unique nonzero uint64 keys -> values (any fixed-size numpy dtype)"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        values = np.asarray(values)
+        if len(keys) != len(values):
+            raise ValueError("keys and values must have the same length")
+        if len(keys) and (keys == 0).any():
+            raise ValueError("0 is reserved for empty slots")
+        if len(np.unique(keys)) != len(keys):
+            raise ValueError("Keys must be unique")
+
+        capacity = _capacity(len(keys))
+        slots = _place(keys, capacity)
+        table_keys = np.zeros(capacity, dtype=np.uint64)
+        table_values = np.zeros(capacity, dtype=values.dtype)
+        table_keys[slots] = keys
+        table_values[slots] = values
+
+        metadata = {**(metadata or {}), 'count': len(keys)}
+        meta = json.dumps(metadata, sort_keys=True).encode()
+        meta += b" " * (-(_HEADER.size + len(meta)) % 8)  # keep the arrays 8-byte aligned
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, capacity, len(keys), values.dtype.str.encode(), len(meta)))
+            f.write(meta)
+            table_keys.tofile(f)
+            table_values.tofile(f)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            magic, version, capacity, count, dtype, meta_length = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a hashed table")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+            metadata = json.loads(f.read(meta_length))
+
+        dtype = np.dtype(dtype.rstrip(b"\0").decode())
+        offset = _HEADER.size + meta_length
+        keys = np.memmap(path, dtype=np.uint64, mode='r', offset=offset, shape=(capacity,))
+        values = np.memmap(path, dtype=dtype, mode='r', offset=offset + capacity * 8, shape=(capacity,))
+        return cls(path, keys, values, metadata)
+
+    def slot(self, key):
+        """Slot holding key, or -1"""
+        keys = self.keys
+        i = key & self.mask
+        while True:
+            found = int(keys[i])
+            if found == key:
+                return i
+            if found == 0:
+                return -1
+            i = (i + 1) & self.mask
+
+    def get(self, key, default=None):
+        i = self.slot(key)
+        return default if i < 0 else self.values[i].item()
+
+    def __contains__(self, key):
+        return self.slot(key) >= 0
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        # Drop the maps. Any view still held elsewhere keeps its pages alive until it goes away.
+        self.keys = self.values = None
@@ -0,0 +1,186 @@
+# Anytime Monte Carlo tree search (UCT) for Ultimate tic-tac-toe.
+#
+# The search can be stopped after any iteration and still give a move: the most visited root
+# move, which only gets better with time. analyze() runs it in slices and reports the best move,
+# principal variation and visit counts after every slice, until a deadline or a cancel.
+#
+# Leaves are scored by a random playout by default. Any evaluator(position, rng) that returns the
+# expected score of X in [0, 1] can replace it. With a tablebase, positions it covers are scored
+# exactly instead.
+#
+#   search = MCTS(Position.from_moves([40, 36]))
+#   search.run(iterations=5000)
+#   search.best_move()
+
+import math
+import random
+import time
+
+from backend.ultimate.position import Position, X, DRAW
+
+
+def random_rollout(position, rng):
+    """Play random moves to the end of the game. Returns X's score: 1 win, 0.5 draw, 0 loss"""
+    while not position.result:
+        moves = position.legal_moves()
+        position.make(moves[int(rng.random() * len(moves))])
+    if position.result == DRAW:
+        return 0.5
+    return 1.0 if position.result == X else 0.0
+
+
+class Node:
+    __slots__ = ('move', 'parent', 'player', 'children', 'untried', 'visits', 'score')
+
+    def __init__(self, move, parent, player, untried):
+        self.move = move
+        self.parent = parent
+        self.player = player      # player who made `move`, the one whose score this node keeps
+        self.children = []
+        self.untried = untried    # legal moves not expanded yet
+        self.visits = 0
+        self.score = 0.0          # sum of the mover's results: 1 win, 0.5 draw, 0 loss
+
+
+class MCTS:
+    def __init__(self, position, exploration=1.4, evaluator=None, tablebase=None, seed=None):
+        if position.result:
+            raise ValueError("The game is already over")
+        self.position = position.copy()
+        self.position.history = []
+        self.exploration = exploration
+        self.evaluator = evaluator or random_rollout
+        self.tablebase = tablebase
+        self.rng = random.Random(seed)
+        # The root "move" was made by the opponent of the player to move
+        self.root = Node(None, None, self.position.player ^ 3, self.position.legal_moves())
+        self.iterations = 0
+
+    def _select(self, node):
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        best, best_value = None, -1.0
+        for child in node.children:
+            value = child.score / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+    def _evaluate(self, position):
+        # X's expected score at a leaf
+        if position.result:
+            return 0.5 if position.result == DRAW else (1.0 if position.result == X else 0.0)
+        if self.tablebase is not None and position.playable_empties() <= self.tablebase.max_empties:
+            value = self.tablebase.probe(position)
+            if value is not None:
+                to_move_score = (value[0] + 1) / 2  # LOSS/DRAW/WIN -> 0/0.5/1
+                return to_move_score if position.player == X else 1.0 - to_move_score
+        return self.evaluator(position, self.rng)
+
+    def iterate(self, iterations=1):
+        rng = self.rng
+        for _ in range(iterations):
+            position = self.position.copy()
+            node = self.root
+
+            # Selection: walk down fully expanded nodes
+            while not node.untried and node.children:
+                node = self._select(node)
+                position.make(node.move)
+
+            # Expansion: add one child for an untried move
+            if node.untried:
+                move = node.untried.pop(int(rng.random() * len(node.untried)))
+                player = position.player
+                position.make(move)
+                child = Node(move, node, player, position.legal_moves())
+                node.children.append(child)
+                node = child
+
+            # Simulation, then backpropagation of the result to every node on the path
+            x_score = self._evaluate(position)
+            while node is not None:
+                node.visits += 1
+                node.score += x_score if node.player == X else 1.0 - x_score
+                node = node.parent
+        self.iterations += iterations
+
+    def run(self, iterations=None, seconds=None):
+        """Iterate until either budget runs out (at least one must be given)"""
+        if iterations is None and seconds is None:
+            raise ValueError("Give an iteration or a time budget")
+        deadline = None if seconds is None else time.perf_counter() + seconds
+        done = 0
+        while (iterations is None or done < iterations) and (deadline is None or time.perf_counter() < deadline):
+            batch = 64 if iterations is None else min(64, iterations - done)
+            self.iterate(batch)
+            done += batch
+        return self.best_move()
+
+    def best_move(self):
+        if not self.root.children:
+            return self.root.untried[0] if self.root.untried else None
+        return max(self.root.children, key=lambda child: child.visits).move
+
+    def principal_variation(self, min_visits=2):
+        moves = []
+        node = self.root
+        while node.children:
+            node = max(node.children, key=lambda child: child.visits)
+            if node.visits < min_visits:
+                break
+            moves.append(node.move)
+        return moves
+
+    def stats(self, top=10):
+        """Snapshot of the search, JSON-ready"""
+        children = sorted(self.root.children, key=lambda child: -child.visits)
+        best = children[0] if children else None
+        return {
+            'best_move': self.best_move(),
+            # Expected score of the player to move with the best move: 1 win, 0.5 draw, 0 loss
+            'value': round(best.score / best.visits, 4) if best else None,
+            'pv': self.principal_variation(),
+            'visits': {str(child.move): child.visits for child in children[:top]},
+            'iterations': self.iterations,
+        }
+
+
+def analyze(position, deadline=1.0, interval=0.1, on_update=None, cancel=None, max_iterations=None, **options):
+    """
+    Anytime analysis: search until `deadline` seconds have passed, `cancel` (a threading.Event) is
+    set or max_iterations is reached, calling on_update(stats) every `interval` seconds and once at
+    the end with stats['done'] = True. Returns the final stats.
+    """
+    search = MCTS(position, **options)
+    start = time.perf_counter()
+    next_update = start + interval
+    cancelled = False
+    while True:
+        now = time.perf_counter()
+        if cancel is not None and cancel.is_set():
+            cancelled = True
+            break
+        if now - start >= deadline or (max_iterations is not None and search.iterations >= max_iterations):
+            break
+        search.iterate(16)
+        if on_update is not None and time.perf_counter() >= next_update:
+            on_update({**search.stats(), 'elapsed_ms': round((time.perf_counter() - start) * 1000), 'done': False})
+            next_update += interval
+
+    stats = {**search.stats(), 'elapsed_ms': round((time.perf_counter() - start) * 1000), 'done': True,
+             'cancelled': cancelled}
+    if on_update is not None:
+        on_update(stats)
+    return stats
+
+
+def main():
+    stats = analyze(Position(), deadline=2.0, interval=0.5,
+                    on_update=lambda stats: print(f"{stats['elapsed_ms']:>5}ms {stats['iterations']:>6} iterations, "
+                                                  f"best {stats['best_move']} value {stats['value']} pv {stats['pv']}"))
+    print(f"Best move {stats['best_move']}")
+
+
+if __name__ == "__main__":
+    main()
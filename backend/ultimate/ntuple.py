@@ -0,0 +1,311 @@
+# N-tuple network: a value function for Ultimate tic-tac-toe made of lookup tables.
+#
+# The value of an afterstate (the position right after a move) is a sum of weights, one per tuple:
+#   - grid:    for each of the nine grids, its 3**9 cell pattern together with where the grid is
+#   - target:  the pattern of the grid the opponent is sent to, with its place (or one weight for
+#              sending the opponent anywhere)
+#   - macro:   the 4**9 pattern of grid results
+# eleven lookups in all. Weights are shared between boards that are the same up to the 8 symmetries
+# of the square (a rotation or reflection moves the grids and the cells inside them the same way)
+# and between colours: values are from the side of the player who just moved, with the colours
+# swapped when that was O. Each table index is precomputed once as its symmetry class (orbit).
+#
+# train() learns the weights by TD(0) self-play over afterstates: every move is chosen by evaluating
+# all the afterstates (epsilon-greedy), and the opponent's previous afterstate is moved towards minus
+# the best value found. Finished games score exactly: 1 for the player who won, 0 for a draw.
+#
+# A network plugs into any search as a leaf evaluator:
+#   network = load_or_train(games=20000)
+#   MCTS(position, evaluator=network.evaluator())
+#   network.evaluate(position)     # value for the player to move, in [-1, 1]
+#   network.evaluate_batch(codes, macro, forced, mover)   # numpy, for batches of positions
+
+import math
+import random
+from array import array
+
+import numpy as np
+
+from backend.ultimate.position import Position, X, O, DRAW
+from backend.ultimate.tables import SYMMETRIES
+
+
+SUB_CODES = 3 ** 9
+MACRO_CODES = 4 ** 9
+
+
+def _digits(base):
+    codes = np.arange(base ** 9, dtype=np.int64)
+    return (codes[:, None] // base ** np.arange(9, dtype=np.int64)) % base
+
+
+def _transformed(digits, base):
+    # Code of every board under every symmetry: cell p moves to symmetry[p]
+    powers = base ** np.arange(9, dtype=np.int64)
+    images = []
+    for symmetry in SYMMETRIES:
+        moved = np.empty_like(digits)
+        moved[:, list(symmetry)] = digits
+        images.append(moved @ powers)
+    return images
+
+
+def _swapped(digits, base):
+    # Code with X and O exchanged (DRAW stays)
+    swapped = np.where(digits == X, O, np.where(digits == O, X, digits))
+    return swapped @ (base ** np.arange(9, dtype=np.int64))
+
+
+def _build_indices():
+    # Sub-board tuples, keyed by grid * 3**9 + code. The class of a (grid, code) pair is the smallest
+    # key among its 8 images.
+    sub_digits = _digits(3)
+    sub_images = _transformed(sub_digits, 3)
+    canonical = None
+    for symmetry, images in zip(SYMMETRIES, sub_images):
+        keys = np.array(symmetry, dtype=np.int64)[:, None] * SUB_CODES + images[None, :]
+        canonical = keys if canonical is None else np.minimum(canonical, keys)
+    _, sub_orbit = np.unique(canonical.reshape(-1), return_inverse=True)
+    sub_classes = int(sub_orbit.max()) + 1
+    sub_swap = _swapped(sub_digits, 3)
+    sub_orbit_o = sub_orbit.reshape(9, SUB_CODES)[:, sub_swap].reshape(-1)
+
+    macro_digits = _digits(4)
+    canonical = np.min(np.stack(_transformed(macro_digits, 4)), axis=0)
+    _, macro_orbit = np.unique(canonical, return_inverse=True)
+    macro_classes = int(macro_orbit.max()) + 1
+    macro_orbit_o = macro_orbit[_swapped(macro_digits, 4)]
+
+    # One flat weight vector: grid tuples, target tuples, the free-target weight, macro tuples
+    target_offset = sub_classes
+    free_index = 2 * sub_classes
+    macro_offset = free_index + 1
+    size = macro_offset + macro_classes
+    indices = {
+        'grid': (sub_orbit, sub_orbit_o),
+        'target': (sub_orbit + target_offset, sub_orbit_o + target_offset),
+        'macro': (macro_orbit + macro_offset, macro_orbit_o + macro_offset),
+    }
+    return indices, free_index, size
+
+
+_INDICES, FREE_INDEX, WEIGHTS = _build_indices()
+
+# numpy index tables for evaluate_batch, [mover == O] selects the colour-swapped one
+GRID_INDEX_ARRAYS = np.stack(_INDICES['grid']).astype(np.int32)
+TARGET_INDEX_ARRAYS = np.stack(_INDICES['target']).astype(np.int32)
+MACRO_INDEX_ARRAYS = np.stack(_INDICES['macro']).astype(np.int32)
+
+# array('i') versions for the scalar path: indexing them with an int is as fast as a list, at a
+# tenth of the memory. Keyed by mover (X or O).
+GRID_INDEX = {X: array('i', GRID_INDEX_ARRAYS[0].tobytes()), O: array('i', GRID_INDEX_ARRAYS[1].tobytes())}
+TARGET_INDEX = {X: array('i', TARGET_INDEX_ARRAYS[0].tobytes()), O: array('i', TARGET_INDEX_ARRAYS[1].tobytes())}
+MACRO_INDEX = {X: array('i', MACRO_INDEX_ARRAYS[0].tobytes()), O: array('i', MACRO_INDEX_ARRAYS[1].tobytes())}
+GRID_OFFSETS = [grid * SUB_CODES for grid in range(9)]
+
+
+def features(sub_codes, macro_code, forced, mover):
+    """Indices of the eleven weights of an afterstate, seen from `mover` (who just moved)"""
+    grid_index = GRID_INDEX[mover]
+    indices = [grid_index[GRID_OFFSETS[grid] + sub_codes[grid]] for grid in range(9)]
+    if forced < 0:
+        indices.append(FREE_INDEX)
+    else:
+        indices.append(TARGET_INDEX[mover][GRID_OFFSETS[forced] + sub_codes[forced]])
+    indices.append(MACRO_INDEX[mover][macro_code])
+    return indices
+
+
+class NTupleNetwork:
+    def __init__(self, weights=None):
+        # A list of floats while training (fast scalar updates), numpy for batches
+        self.weights = [0.0] * WEIGHTS if weights is None else list(map(float, weights))
+        self._array = None
+        self.games = 0
+
+    def afterstate_value(self, position):
+        """Value of a position for the player who just moved into it, in about [-1, 1]"""
+        if position.result:
+            return 0.0 if position.result == DRAW else (1.0 if position.result != position.player else -1.0)
+        weights = self.weights
+        return sum(weights[i] for i in features(position.sub_codes, position.macro_code, position.forced,
+                                                position.player ^ 3))
+
+    def evaluate(self, position):
+        """Value for the player to move: the position is the opponent's afterstate"""
+        return -self.afterstate_value(position)
+
+    def evaluator(self):
+        """Leaf evaluator for MCTS: X's expected score in [0, 1]"""
+        def evaluate(position, _rng):
+            value = max(-1.0, min(1.0, self.evaluate(position)))
+            return (value + 1) / 2 if position.player == X else (1 - value) / 2
+        return evaluate
+
+    def move_values(self, position):
+        """(move, afterstate value for the player to move) for every legal move"""
+        values = []
+        for move in position.legal_moves():
+            position.make(move)
+            values.append((move, self.afterstate_value(position)))
+            position.unmake()
+        return values
+
+    def best_move(self, position):
+        return max(self.move_values(position), key=lambda item: item[1])[0]
+
+    def agent(self):
+        """A greedy player: position -> move"""
+        return self.best_move
+
+    def weight_array(self):
+        if self._array is None:
+            self._array = np.array(self.weights, dtype=np.float32)
+        return self._array
+
+    def evaluate_batch(self, codes, macro, forced, mover):
+        """
+        Afterstate values of N positions at once, for the players who just moved.
+        codes (N, 9) sub-board codes, macro (N,), forced (N,) with -1 for a free move, mover (N,) X or O.
+        """
+        weights = self.weight_array()
+        colour = (np.asarray(mover) == O).astype(np.intp)
+        codes = np.asarray(codes, dtype=np.intp)
+        keys = codes + np.arange(9, dtype=np.intp) * SUB_CODES
+        total = weights[GRID_INDEX_ARRAYS[colour[:, None], keys]].sum(axis=1)
+        total += weights[MACRO_INDEX_ARRAYS[colour, np.asarray(macro, dtype=np.intp)]]
+
+        forced = np.asarray(forced, dtype=np.intp)
+        sent = forced >= 0
+        rows = np.flatnonzero(sent)
+        target_keys = forced[sent] * SUB_CODES + codes[rows, forced[sent]]
+        target = np.full(len(forced), weights[FREE_INDEX], dtype=np.float32)
+        target[sent] = weights[TARGET_INDEX_ARRAYS[colour[sent], target_keys]]
+        return total + target
+
+    def train(self, games=10000, alpha=0.1, epsilon=0.1, seed=0, verbose=False, report_every=1000):
+        """
+        TD(0) self-play over afterstates. alpha is the step for the whole value, shared out over its
+        eleven weights. Returns the number of games played so far.
+        """
+        rng = random.Random(seed)
+        weights = self.weights
+        self._array = None
+
+        for game in range(games):
+            position = Position()
+            previous, previous_value = None, 0.0  # the opponent's last afterstate: weight indices, value
+
+            while not position.result:
+                mover = position.player
+                options = []
+                for move in position.legal_moves():
+                    position.make(move)
+                    if position.result:
+                        indices, value = None, (0.0 if position.result == DRAW else 1.0)
+                    else:
+                        indices = features(position.sub_codes, position.macro_code, position.forced, mover)
+                        value = sum(weights[i] for i in indices)
+                    position.unmake()
+                    options.append((value, move, indices))
+
+                best = max(options, key=lambda option: option[0])
+                if previous is not None:
+                    # The opponent's afterstate is worth minus the best we can do from it
+                    step = alpha * (-best[0] - previous_value) / len(previous)
+                    for i in previous:
+                        weights[i] += step
+
+                value, move, indices = rng.choice(options) if rng.random() < epsilon else best
+                position.make(move)
+                previous, previous_value = indices, value
+
+            self.games += 1
+            if verbose and (game + 1) % report_every == 0:
+                print(f"Game {game + 1}: {len(position.history)} plies, "
+                      f"result {'XOD'[position.result - 1]}")
+        return self.games
+
+    def to_artifact(self):
+        return {'weights': np.array(self.weights, dtype=np.float32), 'games': self.games}
+
+    @classmethod
+    def from_artifact(cls, data):
+        network = cls(data['weights'])
+        network.games = data['games']
+        return network
+
+
+def load_or_train(games=20000, alpha=0.1, epsilon=0.1, seed=0, artifact_dir=None, force=False, verbose=True):
+    """The network trained with this config, from the artifact cache or trained now"""
+    from backend.artifacts import load_or_build
+
+    config = {'games': games, 'alpha': alpha, 'epsilon': epsilon, 'seed': seed, 'weights': WEIGHTS}
+
+    def build(config):
+        network = NTupleNetwork()
+        network.train(config['games'], config['alpha'], config['epsilon'], config['seed'], verbose=verbose,
+                      report_every=max(1, config['games'] // 10))
+        return network.to_artifact()
+
+    data = load_or_build('ntuple', config, build, artifact_dir=artifact_dir, force=force, verbose=verbose)
+    return NTupleNetwork.from_artifact(data)
+
+
+def play_match(agent_X, agent_O, games=100, seed=0, opening_plies=4):
+    """
+    Score of agent_X against agent_O (agents map a Position to a move, None plays randomly),
+    after `opening_plies` random moves so the games differ. Returns (X wins, O wins, draws).
+    """
+    rng = random.Random(seed)
+    counts = [0, 0, 0]
+    for _ in range(games):
+        position = Position()
+        while not position.result:
+            agent = agent_X if position.player == X else agent_O
+            if agent is None or len(position.history) < opening_plies:
+                position.make(rng.choice(position.legal_moves()))
+            else:
+                position.make(agent(position))
+        counts[position.result - 1] += 1
+    return tuple(counts)
+
+
+def main():
+    import time
+    from backend.ultimate.batch_playout import _stack
+
+    network = load_or_train(games=20000)
+    agent = network.agent()
+    for label, (x_agent, o_agent) in (("as X vs random", (agent, None)), ("as O vs random", (None, agent))):
+        wins_x, wins_o, draws = play_match(x_agent, o_agent, games=200)
+        print(f"n-tuple {label}: X {wins_x} O {wins_o} draws {draws}")
+
+    rng = random.Random(1)
+    positions = []
+    for _ in range(2000):
+        position = Position()
+        for _ in range(rng.randrange(1, 40)):
+            if position.result:
+                break
+            position.make(rng.choice(position.legal_moves()))
+        if not position.result:
+            positions.append(position)
+
+    start = time.perf_counter()
+    for position in positions:
+        network.afterstate_value(position)
+    elapsed = time.perf_counter() - start
+    print(f"Scalar: {len(positions) / elapsed:,.0f} evaluations/sec")
+
+    codes, macro, forced, player, _ = _stack(positions * 50)
+    start = time.perf_counter()
+    values = network.evaluate_batch(codes, macro, forced, player ^ 3)
+    elapsed = time.perf_counter() - start
+    print(f"Batch: {len(values) / elapsed:,.0f} evaluations/sec")
+    assert all(math.isclose(value, network.afterstate_value(position), abs_tol=1e-3)
+               for value, position in zip(values, positions))
+
+
+if __name__ == "__main__":
+    main()
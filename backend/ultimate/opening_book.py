@@ -0,0 +1,212 @@
+# Opening book for Ultimate tic-tac-toe: the best move of every position in the first plies,
+# searched offline so that games (and the server) can play their openings instantly.
+#
+# Building a book of the first K plies:
+#   1. Enumerate every position reachable in fewer than K plies from the start (X opening in grid 4
+#      like game_loop, or anywhere with first_grid=None).
+#   2. Group them by symmetry. Both starts are symmetric under the 8 rotations and reflections of the
+#      board, so only one position of each group (the one with the smallest Zobrist hash) is searched.
+#   3. Search those positions in parallel, one deep MCTS per process.
+#   4. Write every position, symmetric copies included, to a HashedTable keyed by Position.zobrist(),
+#      with the searched move mapped back through its symmetry. A probe is one memory-mapped lookup
+#      and nothing has to be transformed at play time.
+#
+# An entry holds the move, the search's expected score for the player to move (1 win, 0.5 draw,
+# 0 loss), the visits of the move and the iterations of the search, packed in a uint64.
+#
+#   book = OpeningBook.open(build_book(plies=4, iterations=20000))
+#   book.probe(position)           # BookEntry(move=40, score=0.53, visits=..., iterations=...), or None
+#   agent = book.agent(fallback)   # book moves while in the book, fallback(position) after
+
+import os
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+
+from backend.ultimate.hashed_file import HashedTable
+from backend.ultimate.position import Position
+from backend.ultimate.tables import SYMMETRIES
+
+BookEntry = namedtuple('BookEntry', 'move score visits iterations')
+
+# Bits of a packed entry: move 8, score 16 (scaled to 0..65535), visits 20, iterations 20.
+# Counts saturate at the top of their field.
+_COUNT_MAX = (1 << 20) - 1
+
+_INVERSES = [tuple(symmetry.index(i) for i in range(9)) for symmetry in SYMMETRIES]
+
+
+def transform_move(move, symmetry):
+    """The move (grid * 9 + position) under a symmetry, which moves grids and cells alike"""
+    return symmetry[move // 9] * 9 + symmetry[move % 9]
+
+
+def opening_positions(plies, first_grid=4):
+    """{zobrist: moves} of every unfinished position reached in fewer than `plies` plies"""
+    positions = {}
+    frontier = [[]]
+    for depth in range(plies):
+        next_frontier = []
+        for moves in frontier:
+            position = Position.from_moves(moves, first_grid)
+            key = position.zobrist()
+            if position.result or key in positions:
+                continue
+            positions[key] = moves
+            if depth + 1 < plies:
+                next_frontier.extend(moves + [move] for move in position.legal_moves())
+        frontier = next_frontier
+    return positions
+
+
+def canonical(moves, first_grid=4):
+    """(zobrist, symmetry index) of the symmetric copy of a position with the smallest hash"""
+    images = []
+    for index, symmetry in enumerate(SYMMETRIES):
+        image = Position.from_moves([transform_move(move, symmetry) for move in moves], first_grid)
+        images.append((image.zobrist(), index))
+    return min(images)
+
+
+def _pack(move, score, visits, iterations):
+    return (move | int(round(score * 65535)) << 8 | min(visits, _COUNT_MAX) << 24
+            | min(iterations, _COUNT_MAX) << 44)
+
+
+def _unpack(packed):
+    return BookEntry(packed & 0xFF, ((packed >> 8) & 0xFFFF) / 65535, (packed >> 24) & _COUNT_MAX,
+                     (packed >> 44) & _COUNT_MAX)
+
+
+def _search(task):
+    # One book position: (moves, first_grid, iterations, seed) -> (move, score, visits)
+    from backend.ultimate.mcts import MCTS
+
+    moves, first_grid, iterations, seed = task
+    search = MCTS(Position.from_moves(moves, first_grid), seed=seed)
+    search.run(iterations=iterations)
+    best = max(search.root.children, key=lambda child: child.visits)
+    return best.move, best.score / best.visits, best.visits
+
+
+def book_path(plies, iterations, first_grid=4, seed=0, artifact_dir=None):
+    from backend.artifacts import DEFAULT_ARTIFACT_DIR, config_hash
+
+    config = {'plies': plies, 'iterations': iterations, 'first_grid': first_grid, 'seed': seed}
+    return os.path.join(artifact_dir or DEFAULT_ARTIFACT_DIR, f"book-{config_hash('book', config)}.tt")
+
+
+def build_book(plies=4, iterations=20000, first_grid=4, seed=0, processes=None, path=None, artifact_dir=None,
+               force=False, verbose=True):
+    """Search (or reuse) the book of the first `plies` plies for this config and return its path"""
+    path = path or book_path(plies, iterations, first_grid, seed, artifact_dir)
+    if os.path.exists(path) and not force:
+        if verbose:
+            print(f"Reusing {path}")
+        return path
+
+    start = time.perf_counter()
+    positions = opening_positions(plies, first_grid)
+    groups = {}  # canonical hash -> (moves of a position in the group, [(zobrist, symmetry), ...])
+    for key, moves in positions.items():
+        canonical_key, index = canonical(moves, first_grid)
+        if canonical_key not in groups:
+            groups[canonical_key] = ([transform_move(move, SYMMETRIES[index]) for move in moves], [])
+        groups[canonical_key][1].append((key, index))
+
+    order = sorted(groups)
+    tasks = [(groups[key][0], first_grid, iterations, seed + i) for i, key in enumerate(order)]
+    if verbose:
+        print(f"{len(positions)} positions in the first {plies} plies, {len(tasks)} up to symmetry")
+
+    with Pool(processes) as pool:
+        results = []
+        for done, result in enumerate(pool.imap(_search, tasks, chunksize=1), 1):
+            results.append(result)
+            if verbose and done % max(1, len(tasks) // 10) == 0:
+                print(f"  {done}/{len(tasks)} searched, {time.perf_counter() - start:.0f}s")
+
+    keys, values = [], []
+    for canonical_key, (move, score, visits) in zip(order, results):
+        for key, index in groups[canonical_key][1]:
+            # The searched position is this one under SYMMETRIES[index], so its move maps back with the inverse
+            keys.append(key)
+            values.append(_pack(transform_move(move, _INVERSES[index]), score, visits, iterations))
+
+    metadata = {'kind': 'book', 'plies': plies, 'iterations': iterations, 'first_grid': first_grid, 'seed': seed,
+                'searched': len(tasks)}
+    HashedTable.write(path, np.array(keys, dtype=np.uint64), np.array(values, dtype=np.uint64), metadata)
+    if verbose:
+        print(f"{len(keys)} positions written to {path} ({os.path.getsize(path) / 1024:.0f}KB) "
+              f"in {time.perf_counter() - start:.0f}s")
+    return path
+
+
+class OpeningBook:
+    def __init__(self, table):
+        self.table = table
+        self.plies = table.metadata['plies']
+        self.first_grid = table.metadata['first_grid']
+
+    @classmethod
+    def open(cls, path):
+        return cls(HashedTable.open(path))
+
+    def probe(self, position):
+        """The BookEntry of a position, or None if it is out of the book"""
+        packed = self.table.get(position.zobrist())
+        return None if packed is None else _unpack(packed)
+
+    def best_move(self, position):
+        entry = self.probe(position)
+        return None if entry is None else entry.move
+
+    def stats(self, position):
+        """The book entry in the shape of MCTS.stats(), or None if the position is out of the book"""
+        entry = self.probe(position)
+        if entry is None:
+            return None
+        return {'best_move': entry.move, 'value': round(entry.score, 4), 'pv': [entry.move],
+                'visits': {str(entry.move): entry.visits}, 'iterations': entry.iterations, 'book': True}
+
+    def agent(self, fallback):
+        """A player (position -> move) that plays book moves while it can and fallback(position) after"""
+        def play(position):
+            move = self.best_move(position)
+            return fallback(position) if move is None else move
+        return play
+
+    def close(self):
+        self.table.close()
+
+
+def main():
+    import random
+
+    book = OpeningBook.open(build_book(plies=3, iterations=5000))
+    position = Position()
+    print(f"{len(book.table)} positions, opening move {book.probe(position)}")
+
+    # Book moves agree across symmetric copies of a position (up to the position's own symmetries)
+    rng = random.Random(0)
+    for _ in range(100):
+        moves = []
+        position = Position()
+        for _ in range(rng.randrange(book.plies)):
+            moves.append(rng.choice(position.legal_moves()))
+            position.make(moves[-1])
+        after = canonical(moves + [book.best_move(position)])[0]
+        for symmetry in SYMMETRIES:
+            image = [transform_move(move, symmetry) for move in moves]
+            assert canonical(image + [book.best_move(Position.from_moves(image))])[0] == after
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        book.probe(position)
+    print(f"Probe: {(time.perf_counter() - start) / 10000 * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
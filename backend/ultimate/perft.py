@@ -0,0 +1,188 @@
+# Perft for Ultimate tic-tac-toe: count the leaf nodes of the game tree to a fixed depth.
+#
+# Perft is the standard way chess engines check their move generator. Walk every legal line to
+# depth d and count the positions you reach. Any rules bug changes the count. It is also a clean
+# throughput benchmark, because the work is nothing but move generation and make/unmake.
+#
+# Finished games are leaves. A position whose game is over before depth d contributes nothing
+# beyond depth 0, the same convention as checkmate in chess perft.
+#
+# PERFT_SUITE holds expected counts for a few positions. The counts were cross-checked against
+# multitic_perft, which plays the same lines on the original MultiTic/SingleTic classes.
+# run_suite() is therefore the regression test for any change to Position.
+#
+#   python -m backend perft --depth 6 --processes 4
+#   python -m backend perft --suite --check
+
+import copy
+import os
+import time
+from multiprocessing import Pool
+
+from backend.ultimate.position import Position
+
+
+# One random game, cut at three points of interest
+_GAME = [42, 60, 54, 4, 44, 78, 62, 76, 39, 32, 48, 29, 22, 37, 10, 14, 47, 23, 45, 1, 17, 79, 68, 51, 59, 46,
+         12, 31, 40, 38, 24, 58, 41, 52, 63, 8, 77, 49, 7, 70, 67, 0, 57, 33, 56, 19, 13, 15, 25, 71, 73]
+
+# name -> (moves, first_grid, {depth: expected leaf count})
+PERFT_SUITE = {
+    'start': ([], 4, {1: 9, 2: 80, 3: 704, 4: 6120, 5: 52584, 6: 446944}),
+    'free start': ([], None, {1: 81, 2: 720, 3: 6336, 4: 55080, 5: 473256}),
+    'midgame': (_GAME[:14], 4, {1: 9, 2: 66, 3: 486, 4: 3638, 5: 27416, 6: 213358}),
+    'sent to a finished grid': (_GAME[:38], 4, {1: 39, 2: 342, 3: 3403, 4: 30774, 5: 317975}),
+    'endgame': (_GAME, 4, {1: 3, 2: 22, 3: 151, 4: 1083, 5: 5156, 6: 28847}),
+}
+
+
+def perft(position, depth):
+    """Number of positions reached by playing every legal line of `depth` moves"""
+    if depth == 0:
+        return 1
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make(move)
+        nodes += perft(position, depth - 1)
+        position.unmake()
+    return nodes
+
+
+def divide(position, depth):
+    """Perft split by root move ({move: leaf count}), to find which subtree a count differs in"""
+    counts = {}
+    for move in position.legal_moves():
+        position.make(move)
+        counts[move] = perft(position, depth - 1)
+        position.unmake()
+    return counts
+
+
+def _perft_subtree(task):
+    position, move, depth = task
+    position.make(move)
+    return move, perft(position, depth - 1)
+
+
+def parallel_perft(position, depth, processes=None):
+    """Perft with the root moves split between worker processes. Returns (total, {move: count})"""
+    if depth <= 1:
+        counts = divide(position, depth) if depth == 1 else {}
+        return (sum(counts.values()) if depth == 1 else 1), counts
+
+    tasks = [(position, move, depth) for move in position.legal_moves()]
+    with Pool(processes or os.cpu_count() or 1) as pool:
+        counts = dict(pool.imap_unordered(_perft_subtree, tasks))
+    return sum(counts.values()), counts
+
+
+def multitic_perft(game, grid_index, current_player, depth):
+    """
+    Reference perft on the original MultiTic classes, slow because of the deep copies. grid_index
+    is the grid the player must play in, None for any unfinished grid.
+    """
+    from backend.rl.single_tic import SingleTic
+
+    if depth == 0:
+        return 1
+    if grid_index is None:
+        grids = [g for g in range(9) if isinstance(game.big_grid[g // 3][g % 3], SingleTic)]
+    else:
+        grids = [grid_index]
+
+    nodes = 0
+    next_player = 'O' if current_player == 'X' else 'X'
+    for grid in grids:
+        cells = game.big_grid[grid // 3][grid % 3].flatten_grid()
+        for position in range(9):
+            if cells[position] is not None:
+                continue
+            child = copy.deepcopy(game)
+            child.make_move(grid, position, current_player)
+            child.replace_single_grid(grid)
+            if child.big_grid_result() is not None:
+                nodes += 1 if depth == 1 else 0
+                continue
+            next_grid = position if isinstance(child.big_grid[position // 3][position % 3], SingleTic) else None
+            nodes += multitic_perft(child, next_grid, next_player, depth - 1)
+    return nodes
+
+
+def _multitic_from_moves(moves, first_grid):
+    # Replays a move list on MultiTic, the way game_loop does
+    from backend.main import MultiTic
+    from backend.rl.single_tic import SingleTic
+
+    game = MultiTic()
+    grid_index, player = first_grid, 'X'
+    for move in moves:
+        grid, position = divmod(move, 9)
+        if grid_index is not None and grid != grid_index:
+            raise ValueError(f"Move {move} is not in the forced grid {grid_index}")
+        player, _ = game.make_move(grid, position, player)
+        game.replace_single_grid(grid)
+        grid_index = position if isinstance(game.big_grid[position // 3][position % 3], SingleTic) else None
+    return game, grid_index, player
+
+
+def check_against_multitic(max_depth=3, verbose=True):
+    """Compare Position perft with the MultiTic reference on every suite position up to max_depth"""
+    mismatches = []
+    for name, (moves, first_grid, expected) in PERFT_SUITE.items():
+        game, grid_index, player = _multitic_from_moves(moves, first_grid)
+        for depth in sorted(expected):
+            if depth > max_depth:
+                break
+            reference = multitic_perft(game, grid_index, player, depth)
+            nodes = perft(Position.from_moves(moves, first_grid), depth)
+            if nodes != reference:
+                mismatches.append((name, depth, nodes, reference))
+            if verbose:
+                status = "ok" if nodes == reference else f"MISMATCH (MultiTic {reference})"
+                print(f"  {name:<26} depth {depth}: {nodes:>8} {status}")
+    return mismatches
+
+
+def run_suite(max_depth=None, processes=1, verbose=True):
+    """Run every suite position to its deepest expected depth. Returns the list of failures."""
+    failures = []
+    total_nodes = 0
+    start = time.perf_counter()
+    if verbose:
+        print("=" * 40)
+    for name, (moves, first_grid, expected) in PERFT_SUITE.items():
+        position = Position.from_moves(moves, first_grid)
+        for depth in sorted(expected):
+            if max_depth is not None and depth > max_depth:
+                break
+            depth_start = time.perf_counter()
+            if processes == 1:
+                nodes = perft(position, depth)
+            else:
+                nodes, _ = parallel_perft(position, depth, processes)
+            elapsed = time.perf_counter() - depth_start
+            total_nodes += nodes
+            if nodes != expected[depth]:
+                failures.append((name, depth, nodes, expected[depth]))
+            if verbose:
+                status = "ok" if nodes == expected[depth] else f"FAIL (expected {expected[depth]})"
+                print(f"  {name:<26} depth {depth}: {nodes:>8} {status}  "
+                      f"({nodes / elapsed if elapsed > 0 else 0:,.0f} nodes/sec)")
+    elapsed = time.perf_counter() - start
+    if verbose:
+        print(f"{len(failures)} failures, {total_nodes} nodes in {elapsed:.2f}s "
+              f"({total_nodes / elapsed:,.0f} nodes/sec)")
+        print("=" * 40)
+    return failures
+
+
+def main():
+    failures = run_suite()
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
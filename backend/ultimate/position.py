@@ -0,0 +1,290 @@
+# A compact, mutable Ultimate tic-tac-toe position for search, perft and rollouts.
+#
+# MultiTic holds nine SingleTic objects with nested lists and needs deep copies to explore moves.
+# Here the whole game is a flat list of 81 cells plus a few integers, and make()/unmake() update it
+# in place. A move is a single integer: grid_index * 9 + position.
+#
+# The rules are the same as MultiTic's:
+# - X moves first, in grid 4 (like game_loop), unless the position is created with first_grid=None
+# - the next player must play in the grid matching the position just played, unless that grid is
+#   finished, in which case any unfinished grid is allowed
+# - a grid is finished when it is won or full (a draw)
+# - the game is won by three won grids in a line. As with MultiTic.big_grid_result, three drawn grids
+#   in a line also end the game (as a draw), and so does every grid being finished
+#
+# Cell, grid and game results use EMPTY/X/O/DRAW = 0/1/2/3. Each grid's code and the macro-board code
+# (see tables.py) are kept up to date, so results and legal moves are single table lookups.
+#
+# Every position also keeps a Zobrist hash of its grid results and of the cells of unfinished grids,
+# updated by make()/unmake(). Cells of a finished grid can't change the rest of the game, so they are
+# left out: transpositions that differ only there share a hash, and so do positions rebuilt with
+# from_multitic, which has lost them. zobrist() adds the forced grid and the player to move, giving a
+# 64-bit key for tablebases and books.
+
+import random
+
+from backend.ultimate.tables import (
+    EMPTY, X, O, DRAW, POW3, POW4, SUB_WIN, SUB_RESULT, SUB_MOVE_MASK, SUB_MOVES, SUB_EVAL,
+    MACRO_RESULT, MACRO_EVAL, sub_code, macro_code,
+)
+
+
+SYMBOLS = {EMPTY: None, X: 'X', O: 'O', DRAW: 'D'}
+CODES = {None: EMPTY, 'X': X, 'O': O, 'D': DRAW}
+
+# Score of a finished game in evaluate(), above anything the heuristic can reach
+GAME_WIN = 1000
+
+# Fixed seed, so hashes stored in files stay valid between runs
+_zobrist_rng = random.Random(0x7AC7AC)
+ZOBRIST_CELLS = [(0, _zobrist_rng.getrandbits(64), _zobrist_rng.getrandbits(64)) for _ in range(81)]
+ZOBRIST_SUB_RESULTS = [(0,) + tuple(_zobrist_rng.getrandbits(64) for _ in range(3)) for _ in range(9)]
+ZOBRIST_FORCED = [_zobrist_rng.getrandbits(64) for _ in range(10)]  # indexed by forced + 1
+ZOBRIST_O_TO_MOVE = _zobrist_rng.getrandbits(64)
+
+
+class Position:
+    __slots__ = ('cells', 'sub_results', 'sub_codes', 'macro_code', 'forced', 'player', 'result', 'history',
+                 'hash')
+
+    def __init__(self, first_grid=4):
+        self.cells = [EMPTY] * 81
+        self.sub_results = [EMPTY] * 9
+        self.sub_codes = [0] * 9
+        self.macro_code = 0
+        self.forced = -1 if first_grid is None else first_grid  # -1 means any unfinished grid
+        self.player = X
+        self.result = EMPTY
+        self.history = []  # Undo records: (move, forced before the move)
+        self.hash = 0  # Zobrist hash of sub_results and the cells of unfinished grids
+
+    def copy(self):
+        other = Position.__new__(Position)
+        other.cells = self.cells[:]
+        other.sub_results = self.sub_results[:]
+        other.sub_codes = self.sub_codes[:]
+        other.macro_code = self.macro_code
+        other.forced = self.forced
+        other.player = self.player
+        other.result = self.result
+        other.history = self.history[:]
+        other.hash = self.hash
+        return other
+
+    def key(self):
+        """Hashable identity of the position (the move history is not part of it)"""
+        return (tuple(self.cells), tuple(self.sub_results), self.forced, self.player)
+
+    def zobrist(self):
+        """64-bit hash of the position, for on-disk tables"""
+        hash_ = self.hash ^ ZOBRIST_FORCED[self.forced + 1]
+        return hash_ ^ ZOBRIST_O_TO_MOVE if self.player == O else hash_
+
+    def rehash(self):
+        """Recompute the hash after cells or sub_results were set directly"""
+        self.hash = 0
+        for grid, result in enumerate(self.sub_results):
+            self.hash ^= ZOBRIST_SUB_RESULTS[grid][result]
+            if result == EMPTY:
+                for cell in range(grid * 9, grid * 9 + 9):
+                    self.hash ^= ZOBRIST_CELLS[cell][self.cells[cell]]
+        return self
+
+    def playable_empties(self):
+        """Empty cells in unfinished grids"""
+        return sum(len(SUB_MOVES[self.sub_codes[grid]]) for grid in range(9) if self.sub_results[grid] == EMPTY)
+
+    def evaluate(self):
+        """
+        Heuristic score for the player to move: the macro-board threats (in units of a won grid) plus
+        the threats inside every unfinished grid. A finished game scores +-GAME_WIN or 0.
+        """
+        if self.result:
+            if self.result == DRAW:
+                return 0
+            return GAME_WIN if self.result == self.player else -GAME_WIN
+        score = MACRO_EVAL[self.macro_code] * SUB_WIN
+        for grid in range(9):
+            if self.sub_results[grid] == EMPTY:
+                score += SUB_EVAL[self.sub_codes[grid]]
+        return score if self.player == X else -score
+
+    def legal_moves(self):
+        if self.result:
+            return []
+        if self.forced >= 0:
+            base = self.forced * 9
+            return [base + i for i in SUB_MOVES[self.sub_codes[self.forced]]]
+        moves = []
+        for grid in range(9):
+            if self.sub_results[grid] == EMPTY:
+                base = grid * 9
+                moves.extend(base + i for i in SUB_MOVES[self.sub_codes[grid]])
+        return moves
+
+    def is_legal(self, move):
+        if self.result or not 0 <= move < 81:
+            return False
+        grid, position = divmod(move, 9)
+        if self.sub_results[grid] != EMPTY or not SUB_MOVE_MASK[self.sub_codes[grid]] >> position & 1:
+            return False
+        return self.forced < 0 or grid == self.forced
+
+    def make(self, move):
+        grid, position = divmod(move, 9)
+        player = self.player
+        self.history.append((move, self.forced))
+        self.cells[move] = player
+        self.hash ^= ZOBRIST_CELLS[move][player]
+
+        code = self.sub_codes[grid] + player * POW3[position]
+        self.sub_codes[grid] = code
+        sub_result = SUB_RESULT[code]
+        if sub_result:
+            self.sub_results[grid] = sub_result
+            self.hash ^= ZOBRIST_SUB_RESULTS[grid][sub_result] ^ self._grid_hash(grid)
+            self.macro_code += sub_result * POW4[grid]
+            self.result = MACRO_RESULT[self.macro_code]
+
+        self.forced = position if self.sub_results[position] == EMPTY else -1
+        self.player = O if player == X else X
+
+    def unmake(self):
+        # Moves are only made in unfinished grids of unfinished games, so both were EMPTY before it
+        move, forced = self.history.pop()
+        grid, position = divmod(move, 9)
+        sub_result = self.sub_results[grid]
+        if sub_result:
+            self.hash ^= ZOBRIST_SUB_RESULTS[grid][sub_result] ^ self._grid_hash(grid)
+            self.macro_code -= sub_result * POW4[grid]
+            self.sub_results[grid] = EMPTY
+            self.result = EMPTY
+        player = self.cells[move]
+        self.hash ^= ZOBRIST_CELLS[move][player]
+        self.sub_codes[grid] -= player * POW3[position]
+        self.cells[move] = EMPTY
+        self.forced = forced
+        self.player = player
+
+    def _grid_hash(self, grid):
+        hash_ = 0
+        for cell in range(grid * 9, grid * 9 + 9):
+            hash_ ^= ZOBRIST_CELLS[cell][self.cells[cell]]
+        return hash_
+
+    @classmethod
+    def from_moves(cls, moves, first_grid=4):
+        position = cls(first_grid)
+        for move in moves:
+            if not position.is_legal(move):
+                raise ValueError(f"Illegal move {move} in this position")
+            position.make(move)
+        return position
+
+    @classmethod
+    def from_multitic(cls, game, next_grid_index, current_player):
+        """
+        Build a position from a MultiTic game, the grid the next player must play in (None for any)
+        and the player to move ('X' or 'O').
+        """
+        from backend.rl.single_tic import SingleTic
+
+        position = cls()
+        for grid in range(9):
+            sub = game.big_grid[grid // 3][grid % 3]
+            if isinstance(sub, SingleTic):
+                cells = [CODES[cell] for cell in sub.flatten_grid()]
+                position.cells[grid * 9:grid * 9 + 9] = cells
+                position.sub_codes[grid] = sub_code(cells)
+                position.sub_results[grid] = SUB_RESULT[position.sub_codes[grid]]
+            else:
+                # A replaced grid only keeps its result, its cells stay empty but are never playable
+                position.sub_results[grid] = CODES[sub]
+
+        position.player = CODES[current_player]
+        position.rehash()
+        position.macro_code = macro_code(position.sub_results)
+        position.result = MACRO_RESULT[position.macro_code]
+        if next_grid_index is None or position.sub_results[next_grid_index] != EMPTY:
+            position.forced = -1
+        else:
+            position.forced = next_grid_index
+        return position
+
+    @classmethod
+    def from_json(cls, payload):
+        """
+        Position from a JSON game state, either the frontend's
+            {"bigGrid": 3x3 of {"grid": 3x3 cells, "winner": ...}, "currentPlayer": "X", "nextGridIndex": 4}
+        or the output of to_json() ({"cells": 81 cells, "current_player": ..., "next_grid_index": ...}).
+        Cells are 'X', 'O' or null. Grid results are recomputed from the cells. Raises ValueError.
+        """
+        if not isinstance(payload, dict):
+            raise ValueError("Position must be a JSON object")
+        if 'bigGrid' in payload:
+            big_grid = payload['bigGrid']
+            if not isinstance(big_grid, list) or len(big_grid) != 3 or any(
+                    not isinstance(row, list) or len(row) != 3 for row in big_grid):
+                raise ValueError("bigGrid must be 3 rows of 3 grids")
+            cells = []
+            for row in big_grid:
+                for sub in row:
+                    grid = sub.get('grid') if isinstance(sub, dict) else None
+                    if not isinstance(grid, list) or len(grid) != 3 or any(
+                            not isinstance(r, list) or len(r) != 3 for r in grid):
+                        raise ValueError("Every grid must be 3 rows of 3 cells")
+                    cells.extend(cell for r in grid for cell in r)
+            player, next_grid = payload.get('currentPlayer'), payload.get('nextGridIndex')
+        else:
+            cells = payload.get('cells')
+            if not isinstance(cells, list) or len(cells) != 81:
+                raise ValueError("cells must be a list of 81 cells")
+            player, next_grid = payload.get('current_player'), payload.get('next_grid_index')
+
+        if any(cell not in ('X', 'O', None) for cell in cells):
+            raise ValueError("Cells must be 'X', 'O' or null")
+        if player not in ('X', 'O'):
+            raise ValueError("The player to move must be 'X' or 'O'")
+        if next_grid is not None and (not isinstance(next_grid, int) or not 0 <= next_grid <= 8):
+            raise ValueError("The next grid index must be 0-8 or null")
+        x_count, o_count = cells.count('X'), cells.count('O')
+        if x_count - o_count != (0 if player == 'X' else 1):
+            raise ValueError(f"Invalid game state: X={x_count}, O={o_count} with {player} to move")
+
+        position = cls()
+        position.cells = [CODES[cell] for cell in cells]
+        for grid in range(9):
+            position.sub_codes[grid] = sub_code(position.cells[grid * 9:grid * 9 + 9])
+            position.sub_results[grid] = SUB_RESULT[position.sub_codes[grid]]
+        position.player = CODES[player]
+        position.rehash()
+        position.macro_code = macro_code(position.sub_results)
+        position.result = MACRO_RESULT[position.macro_code]
+        if next_grid is None or position.sub_results[next_grid] != EMPTY:
+            position.forced = -1
+        else:
+            position.forced = next_grid
+        return position
+
+    def to_json(self):
+        return {
+            'cells': [SYMBOLS[cell] for cell in self.cells],
+            'sub_results': [SYMBOLS[result] for result in self.sub_results],
+            'next_grid_index': None if self.forced < 0 else self.forced,
+            'current_player': SYMBOLS[self.player],
+            'result': SYMBOLS[self.result],
+        }
+
+    def __str__(self):
+        rows = []
+        for big_row in range(3):
+            for small_row in range(3):
+                parts = []
+                for big_col in range(3):
+                    grid = big_row * 3 + big_col
+                    base = grid * 9 + small_row * 3
+                    parts.append(" ".join(SYMBOLS[self.cells[base + i]] or "." for i in range(3)))
+                rows.append(" | ".join(parts))
+            if big_row < 2:
+                rows.append("------+-------+------")
+        return "\n".join(rows)
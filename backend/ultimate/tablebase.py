@@ -0,0 +1,211 @@
+# Endgame tablebases for Ultimate tic-tac-toe.
+#
+# Once few playable cells are left (empty cells in unfinished grids), the game tree below a position
+# is small enough to solve exactly. Every move fills a playable cell, so a position with K playable
+# empties is at most K plies from the end of the game.
+#
+# There are far too many such positions to enumerate them all, so generation starts from the
+# late-game positions of many random games and covers everything reachable from them:
+#   1. Roots: play random games until at most K playable empties are left.
+#   2. Forward pass: enumerate every non-terminal position reachable from the roots, with its
+#      playable-empty count (its level) and its moves as edges to child indices (CSR arrays).
+#   3. Retrograde pass: solve level by level, from the fewest empties up. Every move lowers the
+#      level, so each level only needs the values of levels already solved, like OutOfCoreSolver.
+#
+# Values are from the point of view of the player to move: WIN, DRAW or LOSS, with the number of
+# plies to the end of the game under best play (winner fastest, loser slowest). Draws store 0.
+# The table is a HashedTable keyed by Position.zobrist(), so a probe is one memory-mapped lookup.
+#
+#   tablebase = Tablebase.open(build_tablebase(max_empties=10))
+#   tablebase.probe(position)      # (WIN, 3), or None if the position is not in the table
+#   tablebase.best_move(position)
+
+import os
+import random
+import time
+
+import numpy as np
+
+from backend.ultimate.hashed_file import HashedTable
+from backend.ultimate.position import Position, DRAW
+
+
+LOSS, DRAW_VALUE, WIN = -1, 0, 1
+WDL_NAMES = {WIN: 'win', DRAW_VALUE: 'draw', LOSS: 'loss'}
+
+# Scores used while solving: higher is better for the player to move.
+# A win in d plies scores MATE - d, a loss in d plies -(MATE - d), a draw 0.
+MATE = 1000
+
+
+def collect_roots(max_empties, games=1000, seed=0):
+    """Distinct positions with at most max_empties playable cells, taken from random games"""
+    rng = random.Random(seed)
+    roots = {}
+    for _ in range(games):
+        position = Position()
+        while not position.result and position.playable_empties() > max_empties:
+            position.make(rng.choice(position.legal_moves()))
+        if not position.result:
+            position.history = []
+            roots.setdefault(position.zobrist(), position)
+    return list(roots.values())
+
+
+def enumerate_positions(roots):
+    """
+    Forward pass. Returns (hashes, levels, edge_starts, edges): node i has children
+    edges[edge_starts[i]:edge_starts[i + 1]], where -1 means the move won the game and -2 that it
+    drew it.
+    """
+    index = {}
+    hashes, levels, children = [], [], []
+
+    def visit(position):
+        key = position.zobrist()
+        if key in index:
+            return index[key]
+        i = len(hashes)
+        index[key] = i
+        hashes.append(key)
+        levels.append(position.playable_empties())
+        edges = []
+        children.append(edges)
+        for move in position.legal_moves():
+            position.make(move)
+            if position.result == DRAW:
+                edges.append(-2)
+            elif position.result:
+                edges.append(-1)
+            else:
+                edges.append(visit(position))
+            position.unmake()
+        return i
+
+    for root in roots:
+        visit(root.copy())
+
+    edge_starts = np.zeros(len(children) + 1, dtype=np.int64)
+    edge_starts[1:] = np.cumsum([len(edges) for edges in children])
+    edges = np.fromiter((child for edges in children for child in edges), dtype=np.int64,
+                        count=int(edge_starts[-1]))
+    return np.array(hashes, dtype=np.uint64), np.array(levels, dtype=np.int16), edge_starts, edges
+
+
+def retrograde(levels, edge_starts, edges):
+    """Retrograde pass: score of every node from the point of view of its player to move"""
+    count = len(levels)
+    # Two extra entries are the targets of the terminal edges, seen from the player who would move next:
+    # after a winning move that player has lost (-MATE, i.e. lost in 0 plies), after a drawing move it's a draw
+    scores = np.zeros(count + 2, dtype=np.int32)
+    scores[count] = -MATE
+    targets = np.where(edges == -1, count, np.where(edges == -2, count + 1, edges))
+
+    for level in np.unique(levels):
+        nodes = np.flatnonzero(levels == level)
+        starts, ends = edge_starts[nodes], edge_starts[nodes + 1]
+        lengths = ends - starts
+        edge_index = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        child = scores[targets[edge_index]]
+        # Moving to a child worth s to the opponent is worth -s to us, one ply further from the end
+        move_scores = -child + np.sign(child)
+        scores[nodes] = np.maximum.reduceat(move_scores, np.cumsum(lengths) - lengths)
+    return scores[:count]
+
+
+def score_to_value(score):
+    """Solver score -> (WIN/DRAW_VALUE/LOSS, plies to the end)"""
+    if score > 0:
+        return WIN, MATE - score
+    if score < 0:
+        return LOSS, MATE + score
+    return DRAW_VALUE, 0
+
+
+def _pack(scores):
+    # uint16: (wdl + 1) << 8 | distance
+    scores = scores.astype(np.int64)
+    wdl = np.sign(scores)
+    distance = np.where(scores > 0, MATE - scores, np.where(scores < 0, MATE + scores, 0))
+    return ((wdl + 1) << 8 | distance).astype(np.uint16)
+
+
+def tablebase_path(max_empties, games, seed, artifact_dir=None):
+    from backend.artifacts import DEFAULT_ARTIFACT_DIR, config_hash
+
+    config = {'max_empties': max_empties, 'games': games, 'seed': seed}
+    return os.path.join(artifact_dir or DEFAULT_ARTIFACT_DIR, f"tablebase-{config_hash('tablebase', config)}.tt")
+
+
+def build_tablebase(max_empties=10, games=1000, seed=0, path=None, artifact_dir=None, force=False, verbose=True):
+    """Generate (or reuse) the tablebase file for this config and return its path"""
+    path = path or tablebase_path(max_empties, games, seed, artifact_dir)
+    if os.path.exists(path) and not force:
+        if verbose:
+            print(f"Reusing {path}")
+        return path
+
+    start = time.perf_counter()
+    roots = collect_roots(max_empties, games, seed)
+    hashes, levels, edge_starts, edges = enumerate_positions(roots)
+    enumerated = time.perf_counter()
+    scores = retrograde(levels, edge_starts, edges)
+    solved = time.perf_counter()
+
+    metadata = {'kind': 'tablebase', 'max_empties': max_empties, 'games': games, 'seed': seed,
+                'roots': len(roots)}
+    HashedTable.write(path, hashes, _pack(scores), metadata)
+    if verbose:
+        wins, draws, losses = (scores > 0).sum(), (scores == 0).sum(), (scores < 0).sum()
+        print(f"{len(hashes)} positions from {len(roots)} roots with <= {max_empties} playable empties: "
+              f"{wins} wins, {draws} draws, {losses} losses for the player to move")
+        print(f"Forward pass {enumerated - start:.1f}s, retrograde pass {solved - enumerated:.1f}s, "
+              f"{os.path.getsize(path) / 2 ** 20:.1f}MB written to {path}")
+    return path
+
+
+class Tablebase:
+    def __init__(self, table):
+        self.table = table
+        self.max_empties = table.metadata['max_empties']
+
+    @classmethod
+    def open(cls, path):
+        return cls(HashedTable.open(path))
+
+    def probe(self, position):
+        """(WIN/DRAW_VALUE/LOSS, plies to the end) for the player to move, or None if not in the table"""
+        packed = self.table.get(position.zobrist())
+        if packed is None:
+            return None
+        return (packed >> 8) - 1, packed & 0xFF
+
+    def best_move(self, position):
+        """Fastest win, else a draw, else the slowest loss. None if the position is not in the table."""
+        if self.probe(position) is None:
+            return None
+        best_move, best_score = None, None
+        for move in position.legal_moves():
+            position.make(move)
+            if position.result:
+                score = 0 if position.result == DRAW else MATE - 1
+            else:
+                wdl, distance = self.probe(position)
+                child = wdl * (MATE - distance) if wdl else 0
+                score = -child + (child > 0) - (child < 0)
+            position.unmake()
+            if best_score is None or score > best_score:
+                best_move, best_score = move, score
+        return best_move
+
+    def close(self):
+        self.table.close()
+
+
+def main():
+    tablebase = Tablebase.open(build_tablebase())
+    print(f"{len(tablebase.table)} positions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Precomputed lookup tables for 3x3 boards, indexed by the board's code.
+#
+# A sub-board has only 3**9 = 19,683 cell patterns. Its code uses the same digits as
+# encode_state_key: cell i (row * 3 + col) contributes 0, 1 * 3**i for X or 2 * 3**i for O. The macro
+# board (the results of the nine sub-boards) also allows DRAW, so its code is in base 4:
+# grid g contributes result * 4**g, giving 4**9 = 262,144 patterns.
+#
+# Tables, all built with numpy when the module is first imported (about 0.2s):
+#   SUB_RESULT[code]    EMPTY (game on), X, O or DRAW, the same answer as state_result()
+#   SUB_MOVE_MASK[code] bit i set if cell i is playable (0 once the sub-board is finished)
+#   SUB_MOVES[code]     the playable cells as a tuple
+#   SUB_EVAL[code]      threat score from X's point of view: open lines with two or one X count
+#                       +3 / +1, the same for O negatively, and a finished board +-SUB_WIN or 0
+#   MACRO_RESULT[code]  game result, including three drawn grids in a line ending the game as a draw
+#   MACRO_EVAL[code]    the same threat score on the macro board, DRAW grids blocking their lines
+# Each table exists as a numpy array (for the vectorized kernels) and as a plain list
+# (indexing a list with a Python int is several times faster than indexing an array).
+
+import numpy as np
+
+from backend.rl.single_tic import WINNING_LINES
+
+
+EMPTY, X, O, DRAW = 0, 1, 2, 3
+POW3 = [3 ** i for i in range(9)]
+POW4 = [4 ** i for i in range(9)]
+
+# The 8 rotations and reflections of a 3x3 board, as permutations: cell i goes to symmetry[i].
+# On the 9x9 board the same permutation moves the grids and the cells inside them.
+_TRANSFORMS = (
+    lambda r, c: (r, c), lambda r, c: (c, 2 - r), lambda r, c: (2 - r, 2 - c), lambda r, c: (2 - c, r),
+    lambda r, c: (r, 2 - c), lambda r, c: (2 - r, c), lambda r, c: (c, r), lambda r, c: (2 - c, 2 - r),
+)
+SYMMETRIES = [tuple(row * 3 + col for row, col in (t(i // 3, i % 3) for i in range(9))) for t in _TRANSFORMS]
+
+SUB_WIN = 12
+# Score of an open line holding 0, 1 or 2 pieces of one player and none of the other
+LINE_SCORES = np.array([0, 1, 3], dtype=np.int16)
+
+_LINES = np.array(WINNING_LINES, dtype=np.int64)
+
+
+def _digits(base):
+    codes = np.arange(base ** 9, dtype=np.int64)
+    return ((codes[:, None] // base ** np.arange(9, dtype=np.int64)[None, :]) % base).astype(np.int8)
+
+
+def _results(digits, drawn_lines=False):
+    # First completed line (in WINNING_LINES order) decides the winner, like state_result. With
+    # drawn_lines, a line of three DRAW grids counts as complete too, as in MultiTic.big_grid_result.
+    lines = digits[:, _LINES]
+    first = lines[:, :, 0]
+    complete = np.all(lines == first[:, :, None], axis=2) & (first != EMPTY)
+    if not drawn_lines:
+        complete &= first != DRAW
+    has_line = complete.any(axis=1)
+    winner = first[np.arange(len(digits)), np.argmax(complete, axis=1)]
+    full = np.all(digits != EMPTY, axis=1)
+    return np.where(has_line, winner, np.where(full, DRAW, EMPTY)).astype(np.int8)
+
+
+def _threats(digits):
+    # Sum of LINE_SCORES over the lines still open for one player and not the other
+    lines = digits[:, _LINES]
+    xs = (lines == X).sum(axis=2)
+    os_ = (lines == O).sum(axis=2)
+    blocked = (lines == DRAW).any(axis=2)
+    x_open = (os_ == 0) & ~blocked & (xs < 3)
+    o_open = (xs == 0) & ~blocked & (os_ < 3)
+    score = np.where(x_open, LINE_SCORES[np.minimum(xs, 2)], 0) - np.where(o_open, LINE_SCORES[np.minimum(os_, 2)], 0)
+    return score.sum(axis=1).astype(np.int16)
+
+
+def _build_sub_tables():
+    digits = _digits(3)
+    result = _results(digits)
+    playable = (digits == EMPTY) & (result == EMPTY)[:, None]
+    move_mask = (playable.astype(np.int64) << np.arange(9, dtype=np.int64)).sum(axis=1).astype(np.uint16)
+    finished_eval = np.select([result == X, result == O], [SUB_WIN, -SUB_WIN], 0)
+    evaluation = np.where(result == EMPTY, _threats(digits), finished_eval).astype(np.int16)
+    return result, move_mask, evaluation
+
+
+def _build_macro_tables():
+    digits = _digits(4)
+    return _results(digits, drawn_lines=True), _threats(digits)
+
+
+SUB_RESULT_ARRAY, SUB_MOVE_MASK_ARRAY, SUB_EVAL_ARRAY = _build_sub_tables()
+MACRO_RESULT_ARRAY, MACRO_EVAL_ARRAY = _build_macro_tables()
+
+SUB_RESULT = SUB_RESULT_ARRAY.tolist()
+SUB_MOVE_MASK = SUB_MOVE_MASK_ARRAY.tolist()
+SUB_MOVES = [tuple(i for i in range(9) if mask >> i & 1) for mask in SUB_MOVE_MASK]
+SUB_EVAL = SUB_EVAL_ARRAY.tolist()
+MACRO_RESULT = MACRO_RESULT_ARRAY.tolist()
+MACRO_EVAL = MACRO_EVAL_ARRAY.tolist()
+
+
+def sub_code(cells):
+    """Nine cell values (EMPTY/X/O) -> sub-board code"""
+    return sum(cell * POW3[i] for i, cell in enumerate(cells))
+
+
+def macro_code(sub_results):
+    """Nine grid results (EMPTY/X/O/DRAW) -> macro-board code"""
+    return sum(result * POW4[i] for i, result in enumerate(sub_results))